@@ -1,2 +1,2 @@
 
-from .build import check, Builder, use_asserts
+from .build import check, sweep, Builder, use_asserts
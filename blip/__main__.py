@@ -2,9 +2,11 @@ import time
 import os
 import sys
 import shutil
+import json
 import importlib
 from datetime import datetime
-from blip.build import Scheduler, Builder, Check, all_checks
+from blip.build import Scheduler, Builder, Cache, Check, Jobserver, all_checks, all_sweeps, sweep_table, format_table
+from blip.build import check_report, merge_reports, shard_checks
 import argparse
 
 parser = argparse.ArgumentParser("blip")
@@ -12,19 +14,63 @@ subparsers = parser.add_subparsers(dest="cmd", help="Commands")
 check_parser = subparsers.add_parser("check", help="Verify the design")
 check_parser.add_argument("checks", nargs="*")
 check_parser.add_argument("--list", action="store_true", default=False)
+check_parser.add_argument("--shard", help="Run only shard I/N (1 <= I <= N) of the checks, balanced by runtime")
+check_parser.add_argument("--runtimes",
+    help="Report covering all selected checks used to balance the shards (eg. from 'merge -o'), required with --shard")
+check_parser.add_argument("--cache-dir", default=os.path.join("build", "cache"),
+    help="Directory for compiled simulation models kept between runs")
+check_parser.add_argument("--cache-size", type=int, default=2048,
+    help="Maximum size of the cache in megabytes, least recently used entries are evicted")
+check_parser.add_argument("--no-cache", action="store_true", default=False)
+merge_parser = subparsers.add_parser("merge", help="Combine reports of sharded runs")
+merge_parser.add_argument("reports", nargs="+")
+merge_parser.add_argument("-o", "--output", default=os.path.join("build", "report.json"))
 argv = parser.parse_args(sys.argv[1:])
 
+if argv.cmd == "merge":
+    reports = []
+    for path in argv.reports:
+        with open(path) as f:
+            reports.append(json.load(f))
+    try:
+        report = merge_reports(reports)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    os.makedirs(os.path.dirname(argv.output) or ".", exist_ok=True)
+    with open(argv.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    failed = [name for name, entry in report["checks"].items() if not entry["ok"]]
+    for name in failed:
+        print(f"{name}: FAIL")
+    print(f"Merged {len(report['checks'])} checks, {len(failed)} failed.")
+    sys.exit(1 if failed else 0)
+
 if argv.cmd == "check":
 
     check_files = [
         "rtl.pll",
         "rtl.sdram",
+        "rtl.arith",
+        "rtl.cdc",
         "rtl.dvi.tmds",
+        "rtl.dvi.serializer",
+        "rtl.dvi.timing",
+        "rtl.dvi.scaler",
+        "rtl.dvi.pixel_format",
         "rtl.ecp5.pll",
         "rtl.ecp5.io",
+        "rtl.ecp5.clocking",
+        "rtl.ecp5.pll_control",
         "util.dvi_timing",
+        "util.dvi_modes",
+        "model.tmds",
         "test.dvi_demo",
         "test.dvi_demo_720p",
+        "test.dvi_demo_1080p",
+        "test.dvi_demo_modes",
     ]
 
     def use_check(check: Check) -> bool:
@@ -41,9 +87,24 @@ if argv.cmd == "check":
         if should_load:
             importlib.import_module("blip." + f)
 
+    checks = [check for check in all_checks if use_check(check)]
+
+    if argv.shard:
+        index, count = (int(n) for n in argv.shard.split("/"))
+        if not 1 <= index <= count:
+            parser.error(f"Bad shard: {argv.shard}")
+        if not argv.runtimes:
+            parser.error("--shard needs an explicit --runtimes report shared by all shards")
+        with open(argv.runtimes) as f:
+            runtimes = { name: e["seconds"] for name, e in json.load(f)["checks"].items() }
+        try:
+            checks = shard_checks(checks, runtimes, index - 1, count)
+        except ValueError as e:
+            print(f"Error: {argv.runtimes}: {e}", file=sys.stderr)
+            sys.exit(1)
+
     if argv.list:
-        for check in all_checks:
-            if not use_check(check): continue
+        for check in checks:
             print(check.name)
         sys.exit(0)
 
@@ -52,24 +113,51 @@ if argv.cmd == "check":
     temp_dir = os.path.join("temp", timestamp)
     build_dir = "build"
 
-    scheduler = Scheduler(max_threads=os.cpu_count())
-    builder = Builder(scheduler, build_dir=temp_dir)
+    jobserver = Jobserver.from_environ(os.cpu_count())
+    max_threads = jobserver.max_threads if jobserver else os.cpu_count()
+    scheduler = Scheduler(max_threads=max_threads, jobserver=jobserver)
+    cache = None if argv.no_cache else Cache(argv.cache_dir, argv.cache_size * 1024 * 1024)
+
+    # The PLL search is run while elaborating, outside of any task
+    from blip.rtl.ecp5.pll import set_config_cache
+    set_config_cache(cache)
+    builder = Builder(scheduler, build_dir=temp_dir, cache=cache)
 
     begin_sec = time.time()
 
     num_executed = 0
-    for check in all_checks:
-        if not use_check(check): continue
+    elaborate_seconds = {}
+    for check in checks:
         print(check.name + "...", flush=True)
-        builder.set_prefix(check.prefix)
+        check_begin_sec = time.time()
+        builder.begin_check(check)
         check.func(builder)
+        elaborate_seconds[check.name] = time.time() - check_begin_sec
         scheduler.update()
         num_executed += 1
 
     while not scheduler.finished():
         scheduler.update()
         time.sleep(0.1)
+    scheduler.close()
+    if cache is not None:
+        cache.evict()
     
+    for sweep in all_sweeps:
+        table = sweep_table(sweep, scheduler)
+        if len(table) <= 1: continue
+        print(f"\n{sweep.name}:")
+        print(format_table(table), flush=True)
+        with open(os.path.join(temp_dir, *sweep.name.split(".")) + ".csv", "w") as f:
+            for row in table:
+                print(",".join(row), file=f)
+        print()
+
+    os.makedirs(temp_dir, exist_ok=True)
+    report = check_report(checks, scheduler, elaborate_seconds)
+    with open(os.path.join(temp_dir, "report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
     os.makedirs(build_dir, exist_ok=True)
     if os.path.exists(temp_dir):
         print(f"Copying '{temp_dir}' to '{build_dir}'")
@@ -1,39 +1,72 @@
 from nmigen.build import Platform
 from nmigen.build.run import BuildPlan
 import os
+import re
 import sys
+import time
+import select
+import shutil
+import traceback
 import subprocess
-from typing import Iterable, Optional, Callable, List
-from dataclasses import dataclass
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Optional, Callable, List, Dict, Any
+from dataclasses import dataclass, field
+from itertools import product
 
 @dataclass
 class Result:
     ok: bool
     info: str = ""
     exit_code: int = 0
+    metrics: Dict[str, Any] = field(default_factory=dict)
+    seconds: float = 0.0
 
 @dataclass
 class Check:
     name: str
     prefix: List[str]
     func: Callable
+    params: Dict[str, str] = field(default_factory=dict)
+
+@dataclass
+class Sweep:
+    name: str
+    params: List[str]
+    checks: List[Check]
 
 class Task:
-    def __init__(self, name: str, id: str, threads: int=1):
+    def __init__(self, name: str, id: str, threads: int=1, jobserver: bool=False, deps: Iterable["Task"]=()):
+        """Unit of work run by the `Scheduler`
+
+        threads: Number of job slots the task occupies while running
+        jobserver: The task is a jobserver client and borrows additional
+            job slots by itself, so only a single slot is reserved for it
+        deps: Tasks that must succeed before this one is started
+        """
         self.name = name
         self.id = id
         self.threads = threads
+        self.jobserver = jobserver
+        self.deps = list(deps)
+
+        # Set by the scheduler before `start()`
+        self.slots = threads
+        self.env = {}
+        self.pass_fds = ()
 
     def describe(self) -> str:
         return self.name
 
 class ExecTask(Task):
-    def __init__(self, name: str, id: str, args: Iterable[str], cwd: str, stdout, stderr, threads: int=1):
-        super().__init__(name, id, threads=threads)
+    def __init__(self, name: str, id: str, args: Iterable[str], cwd: str, stdout, stderr, threads: int=1,
+            jobserver: bool=False, metrics: Optional[Callable[[], Dict[str, Any]]]=None, deps: Iterable[Task]=()):
+        super().__init__(name, id, threads=threads, jobserver=jobserver, deps=deps)
         self.args = list(args)
         self.cwd = cwd
         self.stdout = stdout
         self.stderr = stderr
+        self.metrics = metrics
         self.stdout_file = None
         self.stderr_file = None
 
@@ -44,7 +77,11 @@ class ExecTask(Task):
         if isinstance(stderr, str):
             self.stderr_file = stderr = open(self.stderr, "w")
 
-        self.proc = subprocess.Popen(self.args, cwd=self.cwd, stdout=stdout, stderr=stderr)
+        env = dict(os.environ, **self.env)
+        env["BLIP_THREADS"] = str(self.slots)
+
+        self.proc = subprocess.Popen(self.args, cwd=self.cwd, stdout=stdout, stderr=stderr,
+            env=env, pass_fds=self.pass_fds)
 
     def poll(self) -> Optional[Result]:
         exit_code = self.proc.poll()
@@ -53,23 +90,199 @@ class ExecTask(Task):
         if self.stdout_file: self.stdout_file.close()
         if self.stderr_file: self.stderr_file.close()
 
+        metrics = self.metrics() if self.metrics else {}
+
         if exit_code == 0:
-            return Result(ok=True)
+            return Result(ok=True, metrics=metrics)
         else:
-            return Result(ok=False, exit_code=exit_code)
+            return Result(ok=False, exit_code=exit_code, metrics=metrics)
 
     def describe(self) -> str:
         args = " ".join(self.args)
         return f"$ {args}"
 
+def run_python(func: Callable, args, kwargs, stdout: str, stderr: str) -> Result:
+    """Entry point of `PythonTask` in a worker process"""
+    with open(stdout, "w") as out, open(stderr, "w") as err:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            try:
+                value = func(*args, **kwargs)
+            except Exception:
+                info = traceback.format_exc()
+                print(info, file=err)
+                return Result(ok=False, info=info)
+    if isinstance(value, Result):
+        return value
+    return Result(ok=True)
+
+class PythonTask(Task):
+    def __init__(self, name: str, id: str, pool: ProcessPoolExecutor, func: Callable, args=(), kwargs=None,
+            stdout: str=os.devnull, stderr: str=os.devnull, threads: int=1, deps: Iterable[Task]=()):
+        """Call a picklable `func(*args, **kwargs)` in a worker process
+
+        The task fails if the function raises, the traceback is stored in
+        the result info and written to `stderr`. The function may also
+        return a `Result` to report metrics.
+        """
+        super().__init__(name, id, threads=threads, deps=deps)
+        self.pool = pool
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.stdout = stdout
+        self.stderr = stderr
+
+    def start(self):
+        self.future = self.pool.submit(run_python, self.func, self.args, self.kwargs,
+            os.path.abspath(self.stdout), os.path.abspath(self.stderr))
+
+    def poll(self) -> Optional[Result]:
+        if not self.future.done(): return None
+        try:
+            return self.future.result()
+        except Exception as e:
+            return Result(ok=False, info=f"Worker failed: {e!r}")
+
+    def describe(self) -> str:
+        return f">>> {self.func.__module__}.{self.func.__qualname__}()"
+
+class Jobserver:
+    """GNU make compatible jobserver
+
+    Every process implicitly owns one job slot, additional slots are acquired
+    by reading a single byte token from a shared pipe and released by writing
+    the same byte back. If `blip` runs under `make -jN` we join the token pool
+    of the parent make, either through inherited pipe descriptors or the
+    named pipe of `--jobserver-auth=fifo:PATH` used by make 4.4+, otherwise we
+    create a pipe holding `max_threads - 1` tokens. The pool is advertised to
+    child processes through `MAKEFLAGS` so nested tools such as `sby -j`
+    borrow from the same budget.
+    """
+
+    def __init__(self, max_threads: int, fds=None, makeflags: Optional[str]=None):
+        self.max_threads = max_threads
+        self.implicit_free = True
+
+        if fds is None:
+            self.r_fd, self.w_fd = os.pipe()
+            os.write(self.w_fd, b"+" * (max_threads - 1))
+            self.makeflags = f"-j{max_threads} --jobserver-auth={self.r_fd},{self.w_fd} --jobserver-fds={self.r_fd},{self.w_fd}"
+        else:
+            self.r_fd, self.w_fd = fds
+            self.makeflags = makeflags
+
+        # Read through a private non-blocking file description so we never
+        # stall the main loop or change the blocking mode of the shared pipe
+        try:
+            self.r_poll = os.open(f"/proc/self/fd/{self.r_fd}", os.O_RDONLY | os.O_NONBLOCK)
+        except OSError:
+            self.r_poll = None
+
+    @staticmethod
+    def from_environ(max_threads: int) -> Optional["Jobserver"]:
+        """Join the jobserver of a parent make or create a new one
+
+        Returns `None` on platforms without inheritable pipes."""
+
+        if sys.platform.startswith("win32"):
+            return None
+
+        makeflags = os.environ.get("MAKEFLAGS", "")
+        jobs = re.search(r"(?:^|\s)-j(\d+)", makeflags)
+        parent_threads = int(jobs.group(1)) if jobs else max_threads
+
+        # GNU make 4.4+ passes a named pipe instead of inherited descriptors
+        fifo = re.search(r"--jobserver-auth=fifo:(\S+)", makeflags)
+        if fifo:
+            try:
+                r_fd = os.open(fifo.group(1), os.O_RDONLY | os.O_NONBLOCK)
+                w_fd = os.open(fifo.group(1), os.O_WRONLY | os.O_NONBLOCK)
+                return Jobserver(parent_threads, fds=(r_fd, w_fd), makeflags=makeflags)
+            except OSError:
+                # Make already exited and removed the fifo
+                pass
+
+        auth = re.search(r"--jobserver-(?:auth|fds)=(\d+),(\d+)", makeflags)
+        if auth:
+            fds = int(auth.group(1)), int(auth.group(2))
+            try:
+                for fd in fds:
+                    os.fstat(fd)
+                return Jobserver(parent_threads, fds=fds, makeflags=makeflags)
+            except OSError:
+                # Recipe not marked with `+`, make closed the pipe for us
+                pass
+
+        return Jobserver(max_threads)
+
+    def _read_token(self) -> Optional[bytes]:
+        try:
+            if self.r_poll is not None:
+                return os.read(self.r_poll, 1) or None
+            readable, _, _ = select.select([self.r_fd], [], [], 0)
+            if not readable: return None
+            return os.read(self.r_fd, 1) or None
+        except BlockingIOError:
+            return None
+
+    def acquire(self, count: int) -> Optional[List[bytes]]:
+        """Try to acquire `count` job slots without blocking
+
+        Returns a list of acquired tokens (`None` standing for the implicit
+        slot of this process) or `None` if not enough slots are available."""
+
+        tokens = []
+        if self.implicit_free:
+            self.implicit_free = False
+            tokens.append(None)
+        while len(tokens) < count:
+            token = self._read_token()
+            if token is None:
+                self.release(tokens)
+                return None
+            tokens.append(token)
+        return tokens
+
+    def release(self, tokens: List[bytes]):
+        for token in tokens:
+            if token is None:
+                self.implicit_free = True
+            else:
+                os.write(self.w_fd, token)
+
+    def environ(self) -> Dict[str, str]:
+        return { "MAKEFLAGS": self.makeflags }
+
 class Scheduler:
-    def __init__(self, max_threads):
+    def __init__(self, max_threads, jobserver: Optional[Jobserver]=None):
         self.queue = []
         self.active = []
         self.max_threads = max_threads
+        self.jobserver = jobserver
+        self.tokens = {}
+        self.results = {}
+        self.pool = None
+
+        # Tasks are attributed to the check that was running when they were added
+        self.check = None
+        self.task_checks = {}
+        self.task_threads = {}
+        self.start_times = {}
+
+    def python_pool(self) -> ProcessPoolExecutor:
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.max_threads)
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
 
     def add_task(self, task: Task) -> Task:
         self.queue.append(task)
+        self.task_checks[task.id] = self.check
+        self.task_threads[task.id] = task.threads
         return task
     
     def update(self):
@@ -80,33 +293,137 @@ class Scheduler:
             if result is None:
                 still_active.append(task)
                 continue
+            if self.jobserver:
+                self.jobserver.release(self.tokens.pop(task))
+            result.seconds = time.time() - self.start_times.pop(task)
+            self.results[task.id] = result
             self.on_done(task, result)
         self.active = still_active
 
-        # Schedule new tasks
-        while self.queue and sum(a.threads for a in self.active) < self.max_threads:
-            task = self.queue.pop(0)
+        # Schedule new tasks whose dependencies have finished
+        for task in list(self.queue):
+            deps_ok = self.dependency_result(task)
+            if deps_ok is None: continue
+            if not deps_ok:
+                self.queue.remove(task)
+                result = Result(ok=False, info="Dependency failed")
+                self.results[task.id] = result
+                self.on_done(task, result)
+                continue
+
+            task.slots = min(task.threads, self.max_threads)
+            if self.jobserver:
+                # Jobserver clients only need a slot to start in, they
+                # borrow the rest of their threads from the shared pool
+                tokens = self.jobserver.acquire(1 if task.jobserver else task.slots)
+                if tokens is None: break
+                self.tokens[task] = tokens
+                task.env = self.jobserver.environ()
+                task.pass_fds = (self.jobserver.r_fd, self.jobserver.w_fd)
+            elif sum(a.slots for a in self.active) >= self.max_threads:
+                break
+            self.queue.remove(task)
             self.on_start(task)
+            self.start_times[task] = time.time()
             task.start()
             self.active.append(task)
 
     def finished(self) -> bool:
         return not (self.queue or self.active)
 
+    def dependency_result(self, task: Task) -> Optional[bool]:
+        """`None` while dependencies are pending, otherwise whether all succeeded"""
+        for dep in task.deps:
+            result = self.results.get(dep.id)
+            if result is None: return None
+            if not result.ok: return False
+        return True
+
+    def check_results(self, check: Check) -> Dict[str, Result]:
+        """Results of the finished tasks spawned by `check`"""
+        return { id: r for id, r in self.results.items() if self.task_checks.get(id) is check }
+
     def on_start(self, task: Task):
         print(f"{task.describe()}   ({task.id})", flush=True)
 
     def on_done(self, task: Task, result: Result):
+        # Only show the last line of multi-line info such as tracebacks
+        info = f" ({result.info.strip().splitlines()[-1]})" if result.info.strip() else ""
         if result.ok:
-            print(f"{task.id}: OK", flush=True)
+            print(f"{task.id}: OK{info}", flush=True)
         else:
-            print(f"{task.id}: FAIL", flush=True)
+            print(f"{task.id}: FAIL{info}", flush=True)
+
+class Cache:
+    """Directory of entries kept between runs
+
+    Every entry is a directory named by its key. Entries are written
+    atomically so concurrent runs can share the cache, when the total size
+    exceeds `max_bytes` the least recently used entries are evicted at the
+    end of the run, see `evict()`.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = os.path.abspath(path)
+        self.max_bytes = max_bytes
+        # File timestamps are coarser than `time.time()`, keep a margin
+        self.begin = time.time() - 2.0
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key)
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Path to the entry for `key` if it exists, marks it as used"""
+        path = self.entry_path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def store(self, key: str, files: Iterable[str]) -> str:
+        """Copy `files` into the entry for `key`"""
+        path = self.entry_path(key)
+        temp_path = f"{path}.tmp{os.getpid()}"
+        os.makedirs(temp_path, exist_ok=True)
+        for file in files:
+            shutil.copy2(file, temp_path)
+        try:
+            os.rename(temp_path, path)
+        except OSError:
+            # Stored concurrently by another run
+            shutil.rmtree(temp_path, ignore_errors=True)
+        return path
+
+    def evict(self):
+        """Evict least recently used entries exceeding `max_bytes`
+
+        Called once after all tasks of the run have finished, as tasks use
+        the entries in place. Entries looked up or stored since the cache
+        was opened, by this run or a concurrent one, are never evicted. The
+        cache can stay above `max_bytes` until a later run."""
+
+        if not os.path.isdir(self.path): return
+        entries = []
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            if ".tmp" in name or not os.path.isdir(path): continue
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            entries.append((os.path.getmtime(path), size, path))
+
+        total = 0
+        for mtime, size, path in sorted(entries, reverse=True):
+            total += size
+            if total > self.max_bytes and mtime < self.begin:
+                shutil.rmtree(path, ignore_errors=True)
 
 class Builder:
-    def __init__(self, scheduler: Scheduler, build_dir: str):
+    def __init__(self, scheduler: Scheduler, build_dir: str, cache: Optional[Cache]=None):
         self.build_dir = build_dir
+        self.cache = cache
         self.prefix = []
         self.scheduler = scheduler
+        self.shared_tasks = {}
     
     def set_prefix(self, prefix: Iterable[str]):
         self.prefix = list(prefix)
@@ -115,6 +432,7 @@ class Builder:
     
     def begin_check(self, check: Check):
         self.set_prefix(check.prefix)
+        self.scheduler.check = check
 
     def temp_file(self, name: str) -> str:
         return os.path.join(self.prefix_path, name)
@@ -125,34 +443,122 @@ class Builder:
     def temp_exists(self, name: str) -> bool:
         return os.path.exists(self.temp_file(name))
 
-    def exec(self, name: str, exe: str, args: Iterable[str], cwd: Optional[str] = None, threads: int = 1):
+    def shared(self, key: str, create: Callable[[], Task]) -> Task:
+        """Task shared between checks, created only once per `key`
+
+        `create()` is called with the builder temporarily prefixed to
+        `shared/<key>`, use `shared_file()` to refer to its outputs."""
+
+        task = self.shared_tasks.get(key)
+        if task is None:
+            prefix = self.prefix
+            self.set_prefix(["shared", key])
+            task = self.shared_tasks[key] = create()
+            self.set_prefix(prefix)
+        return task
+
+    def shared_file(self, key: str, name: str) -> str:
+        return os.path.abspath(os.path.join(self.build_dir, "shared", key, name))
+
+    def task_id(self, name: str) -> str:
+        return ".".join(self.prefix + [name])
+
+    def exec(self, name: str, exe: str, args: Iterable[str], cwd: Optional[str] = None, threads: int = 1,
+            jobserver: bool = False, metrics: Optional[Callable[[], Dict[str, Any]]] = None,
+            deps: Iterable[Task] = ()):
+        return self.scheduler.add_task(self.exec_task(name, exe, args, cwd=cwd, threads=threads,
+            jobserver=jobserver, metrics=metrics, deps=deps))
+
+    def exec_task(self, name: str, exe: str, args: Iterable[str], cwd: Optional[str] = None, threads: int = 1,
+            jobserver: bool = False, metrics: Optional[Callable[[], Dict[str, Any]]] = None,
+            deps: Iterable[Task] = ()) -> ExecTask:
+        """Create an `ExecTask` without scheduling it"""
         if cwd is None:
             cwd = self.prefix_path
-        exe_id = ".".join(self.prefix + [name])
-        self.scheduler.add_task(ExecTask(name, exe_id, [exe] + args,
+        exe_id = self.task_id(name)
+        return ExecTask(name, exe_id, [exe] + args,
             stdout=os.path.join(self.prefix_path, name + ".out"),
             stderr=os.path.join(self.prefix_path, name + ".err"),
             cwd=cwd,
-            threads=threads))
+            threads=threads,
+            jobserver=jobserver,
+            metrics=metrics,
+            deps=deps)
     
-    def exec_plan(self, name: str, plan: BuildPlan, cwd: Optional[str] = None):
+    def python(self, name: str, func: Callable, *args, threads: int = 1, deps: Iterable[Task] = (), **kwargs):
+        """Run `func(*args, **kwargs)` as a task in a worker process"""
+        return self.scheduler.add_task(PythonTask(name, self.task_id(name), self.scheduler.python_pool(),
+            func, args, kwargs,
+            stdout=os.path.join(self.prefix_path, name + ".out"),
+            stderr=os.path.join(self.prefix_path, name + ".err"),
+            threads=threads,
+            deps=deps))
+
+    def exec_plan(self, name: str, plan: BuildPlan, cwd: Optional[str] = None, threads: int = 1,
+            metrics: Optional[Callable[[], Dict[str, Any]]] = None):
         if cwd is None:
             cwd = self.prefix_path
         
         plan.execute_local(cwd, run_script=False)
 
         if sys.platform.startswith("win32"):
-            self.exec(name, "cmd", ["/c", f"call {plan.script}.bat"], cwd)
+            return self.exec(name, "cmd", ["/c", f"call {plan.script}.bat"], cwd, threads=threads, metrics=metrics)
         else:
-            self.exec(name, "sh", [f"{plan.script}.sh"], cwd)
+            return self.exec(name, "sh", [f"{plan.script}.sh"], cwd, threads=threads, metrics=metrics)
+
+    def build(self, name: str, platform: Platform, top, threads: int = 1, **kwargs):
+        """Synthesize and place-and-route `top` as a task
+
+        nextpnr runs with as many threads as there are job slots allocated
+        to the task, the value is substituted by the build script at runtime.
+        Fmax and utilization from the nextpnr log are stored in the metrics
+        of the task result.
+        """
+
+        if sys.platform.startswith("win32"):
+            threads_opt = "--threads %BLIP_THREADS%"
+        else:
+            threads_opt = "--threads $BLIP_THREADS"
+        kwargs["nextpnr_opts"] = f"{threads_opt} {kwargs.get('nextpnr_opts', '')}".strip()
+
+        plan = platform.build(top, do_build=False, **kwargs)
+        log_path = os.path.join(self.prefix_path, kwargs.get("name", "top") + ".tim")
+        return self.exec_plan(name, plan, threads=threads,
+            metrics=lambda: parse_nextpnr_log(log_path))
+
+def parse_nextpnr_log(path: str) -> Dict[str, Any]:
+    """Parse achieved/constrained clock frequencies (MHz) and device
+    utilization (used, available) from a nextpnr log"""
+
+    fmax, util = {}, {}
+    if not os.path.exists(path):
+        return {}
+
+    # Later reports (after routing) override the earlier ones
+    with open(path) as f:
+        for line in f:
+            m = re.search(r"Max frequency for clock '(.*)': ([\d.]+) MHz \((?:PASS|FAIL) at ([\d.]+) MHz\)", line)
+            if m:
+                fmax[m.group(1)] = (float(m.group(2)), float(m.group(3)))
+                continue
+            m = re.match(r"Info:\s+(\w+):\s+(\d+)/\s*(\d+)\s+\d+%", line)
+            if m:
+                util[m.group(1)] = (int(m.group(2)), int(m.group(3)))
+
+    return { "fmax": fmax, "utilization": util }
 
 all_checks = []
+all_sweeps = []
+
+def check_name(fn: Callable) -> str:
+    name = f"{fn.__module__}.{fn.__name__}"
+    if name.startswith("blip."):
+        name = name[5:]
+    return name
 
 def check(shared=False):
     def inner(fn: Callable) -> Callable:
-        name = f"{fn.__module__}.{fn.__name__}"
-        if name.startswith("blip."):
-            name = name[5:]
+        name = check_name(fn)
         prefix = name.split(".")
         if shared:
             prefix = prefix[:-1]
@@ -161,5 +567,141 @@ def check(shared=False):
         return fn
     return inner
 
+def sweep(shared=False, **grid):
+    """Expand a check over the product of parameter values
+
+    Each keyword is a parameter name with either a list of values or a dict
+    from labels to values. Every combination is registered as an independent
+    check `<name>.<key>_<label>...` and called as `fn(bld, **values)`. The
+    results of the variants are collected into a table by `sweep_table()`.
+
+        @sweep(pipeline=[False, True])
+        def synth(bld: Builder, pipeline: bool): ...
+    """
+
+    def labels(values):
+        if isinstance(values, dict):
+            return list(values.items())
+        return [(re.sub(r"\W", "_", str(v)), v) for v in values]
+
+    def inner(fn: Callable) -> Callable:
+        name = check_name(fn)
+        prefix = name.split(".")
+        if shared:
+            prefix = prefix[:-1]
+        checks = []
+        for combination in product(*(labels(v) for v in grid.values())):
+            params = { k: label for k, (label, _) in zip(grid, combination) }
+            values = { k: value for k, (_, value) in zip(grid, combination) }
+            variant = "_".join(f"{k}_{label}" for k, label in params.items())
+
+            def func(bld: Builder, values=values):
+                return fn(bld, **values)
+
+            check = Check(f"{name}.{variant}", prefix + [variant], func, params)
+            all_checks.append(check)
+            checks.append(check)
+        all_sweeps.append(Sweep(name, list(grid), checks))
+        return fn
+    return inner
+
+def sweep_table(sweep: Sweep, scheduler: Scheduler) -> List[List[str]]:
+    """Comparison table of the variants of `sweep` that have been run
+
+    Fmax is the worst achieved/constrained frequency ratio over all clocks of
+    the variant, utilization columns are device resources used by any variant.
+    Variants that pass and fit in the device are sorted by Fmax first.
+    """
+
+    rows = []
+    for check in sweep.checks:
+        results = scheduler.check_results(check)
+        if not results: continue
+
+        ok = all(r.ok for r in results.values())
+        fmax = None
+        util = {}
+        for r in results.values():
+            for achieved, constraint in r.metrics.get("fmax", {}).values():
+                if fmax is None or achieved / constraint < fmax[0] / fmax[1]:
+                    fmax = (achieved, constraint)
+            util.update(r.metrics.get("utilization", {}))
+        fits = all(used <= available for used, available in util.values())
+        rows.append((check, ok and fits, fmax, util))
+
+    resources = sorted(set(k for _, _, _, util in rows for k, (used, _) in util.items() if used > 0))
+    rows.sort(key=lambda row: (not row[1], -(row[2][0] / row[2][1]) if row[2] else 0.0))
+
+    table = [sweep.params + ["result", "fmax"] + resources]
+    for check, ok, fmax, util in rows:
+        table.append([check.params[k] for k in sweep.params] + [
+            "OK" if ok else "FAIL",
+            f"{fmax[0]:.2f}/{fmax[1]:.2f} MHz" if fmax else "-",
+        ] + [f"{util[k][0]}/{util[k][1]}" if k in util else "-" for k in resources])
+    return table
+
+def check_report(checks: Iterable[Check], scheduler: Scheduler, elaborate_seconds: Dict[str, float]) -> Dict[str, Any]:
+    """Results of finished checks in a JSON compatible form
+
+    The runtime of a check is the time spent elaborating it plus the
+    duration of each of its tasks multiplied by the threads it requested."""
+
+    report = {}
+    for check in checks:
+        results = scheduler.check_results(check)
+        seconds = elaborate_seconds.get(check.name, 0.0)
+        tasks = {}
+        for id, r in results.items():
+            seconds += r.seconds * scheduler.task_threads[id]
+            tasks[id] = { "ok": r.ok, "info": r.info, "exit_code": r.exit_code,
+                "seconds": r.seconds, "metrics": r.metrics }
+        report[check.name] = {
+            "ok": all(r.ok for r in results.values()),
+            "seconds": seconds,
+            "tasks": tasks,
+        }
+    return { "checks": report }
+
+def merge_reports(reports: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine the reports of disjoint shards"""
+    merged = {}
+    for report in reports:
+        for name, entry in report["checks"].items():
+            if name in merged:
+                raise ValueError(f"Check '{name}' is present in multiple reports")
+            merged[name] = entry
+    return { "checks": dict(sorted(merged.items())) }
+
+def shard_checks(checks: List[Check], runtimes: Dict[str, float], index: int, count: int) -> List[Check]:
+    """Select the checks of shard `index` (0-based) out of `count`
+
+    Checks are greedily assigned to the least loaded shard in order of
+    decreasing recorded runtime. The result depends only on the check names
+    and `runtimes`, so every node computes the same partition as long as
+    they share the same runtimes. Every check must have a recorded runtime,
+    balancing on partial data (eg. the report of a single shard) would
+    silently give different partitions on different nodes."""
+
+    missing = [c.name for c in checks if c.name not in runtimes]
+    if missing:
+        raise ValueError(f"No recorded runtime for {len(missing)} checks: {', '.join(missing[:5])}"
+            + (", ..." if len(missing) > 5 else ""))
+    cost = { c.name: runtimes[c.name] for c in checks }
+
+    loads = [0.0] * count
+    selected = []
+    for check in sorted(checks, key=lambda c: (-cost[c.name], c.name)):
+        shard = min(range(count), key=lambda n: (loads[n], n))
+        loads[shard] += cost[check.name]
+        if shard == index:
+            selected.append(check)
+
+    # Keep the original registration order within the shard
+    return [c for c in checks if c in selected]
+
+def format_table(table: List[List[str]]) -> str:
+    widths = [max(len(row[n]) for row in table) for n in range(len(table[0]))]
+    return "\n".join("  ".join(c.ljust(w) for c, w in zip(row, widths)).rstrip() for row in table)
+
 def use_asserts(p: Platform):
     return not p
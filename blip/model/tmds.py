@@ -0,0 +1,301 @@
+import time
+import random
+import numpy as np
+from typing import Tuple
+from blip import check, Builder
+from blip.build import Result
+from blip.util.dvi_timing import DVIMode
+
+# Control characters indexed by `hsync | vsync << 1`
+ctl_chars = np.array([0b1101010100, 0b0010101011, 0b0101010100, 0b1010101011], dtype=np.uint16)
+
+# Index of a pseudo data word that doesn't change the DC bias, used for padding
+identity = 256
+
+def build_tables() -> Tuple[np.ndarray, np.ndarray]:
+    """Encoding tables indexed by `[data, dc_bias]`
+
+    Returns the output character and next 4-bit DC bias for each data word
+    and current DC bias state, following `TMDSEncoder` exactly."""
+
+    chars = np.zeros((257, 16), dtype=np.uint16)
+    biases = np.zeros((257, 16), dtype=np.uint8)
+    biases[identity] = np.arange(16)
+
+    for data in range(256):
+        bits = [(data >> n) & 1 for n in range(8)]
+
+        # XOR/XNOR encoding to minimize transitions
+        use_xnor = sum(bits[1:]) > 3
+        xored = 0
+        for n in range(8):
+            xored |= (bits[n] ^ ((xored >> (n - 1)) & 1 if n > 0 else 0)) << n
+        xnored = xored ^ (0b10101010 if use_xnor else 0)
+        x_bias = (bin(xnored).count("1") - 4) & 0xf
+
+        for dc_bias in range(16):
+            zero_bias = x_bias == 0 or dc_bias == 0
+            same_bias = (x_bias >> 3) == (dc_bias >> 3)
+            use_invert = use_xnor if zero_bias else same_bias
+            data_bias = (-x_bias if use_invert else x_bias) + (not use_xnor) + use_invert - 1
+
+            chars[data, dc_bias] = (xnored ^ (0xff if use_invert else 0)) | (not use_xnor) << 8 | use_invert << 9
+            biases[data, dc_bias] = (dc_bias + data_bias) & 0xf
+
+    return chars, biases
+
+enc_chars, enc_biases = build_tables()
+
+def build_decode_table() -> np.ndarray:
+    """Decoded `data | en_data << 8 | hsync << 9 | vsync << 10` for every character"""
+
+    table = np.zeros(1024, dtype=np.uint16)
+    for char in range(1024):
+        inverted = char & 0xff ^ (0xff if char & 0x200 else 0)
+        xnor = 0 if char & 0x100 else 1
+        data = inverted & 1
+        for n in range(1, 8):
+            data |= (((inverted >> n) ^ (inverted >> (n - 1)) ^ xnor) & 1) << n
+        table[char] = data | 1 << 8
+    for sync, char in enumerate(ctl_chars):
+        table[char] = sync << 9
+    return table
+
+dec_table = build_decode_table()
+
+def find_reachable() -> np.ndarray:
+    """DC bias states reachable from reset"""
+    reachable = {0}
+    while True:
+        found = reachable | set(enc_biases[:256, sorted(reachable)].ravel().tolist())
+        if found == reachable:
+            return np.array(sorted(reachable))
+        reachable = found
+
+reachable = find_reachable()
+
+def scan_bias(data: np.ndarray, dc_bias: int, chunk: int=512) -> np.ndarray:
+    """DC bias state before each data word of a 1D sequence
+
+    The bias is a small state machine so we split the sequence into chunks
+    and first step every chunk from all reachable states at once, giving the
+    transfer function of each chunk. A short sequential pass over the chunks
+    resolves their starting states, after which the per-word states are
+    found by stepping all chunks in parallel again.
+
+    The start states of a chunk usually merge after a few dozen words, from
+    then on such chunks are stepped with a single state."""
+
+    count = len(data)
+    num_chunks = max((count + chunk - 1) // chunk, 1)
+    padded = np.full(num_chunks * chunk, identity, dtype=np.int16)
+    padded[:count] = data
+
+    # Words pre-shifted to index the flattened table, transposed so that
+    # each step reads a contiguous row
+    words = np.ascontiguousarray(padded.reshape(num_chunks, chunk).T) << 4
+    flat = enc_biases.astype(np.int16).ravel()
+
+    starts = reachable if (dc_bias & 0xf) in reachable else np.arange(16)
+    column = np.zeros(16, dtype=np.intp)
+    column[starts] = np.arange(len(starts))
+
+    # Transfer function of every chunk from all start states. The columns
+    # of `rows` are reordered so that the first `merged` chunks are the ones
+    # whose states have merged, `order` maps columns back to chunks.
+    order = np.arange(num_chunks)
+    rows, base, merged = words, 0, 0
+    single = np.zeros(0, dtype=np.int16)
+    multi = np.broadcast_to(starts.astype(np.int16), (num_chunks, len(starts)))
+    for n in range(chunk):
+        if n in (32, 64, 128) and len(multi) > 0:
+            same = (multi == multi[:, :1]).all(axis=1)
+            if same.any():
+                keep = np.concatenate([np.arange(merged),
+                    merged + np.flatnonzero(same), merged + np.flatnonzero(~same)])
+                rows, base = rows[n - base:, keep], n
+                order = order[keep]
+                single = np.concatenate([single, multi[same, 0]])
+                multi = multi[~same]
+                merged = len(single)
+        row = rows[n - base]
+        if merged > 0:
+            single = flat.take(row[:merged] + single)
+        if len(multi) > 0:
+            multi = flat.take(row[merged:, None] + multi)
+
+    transfer = np.empty((num_chunks, len(starts)), dtype=np.int16)
+    transfer[order[:merged]] = single[:, None]
+    transfer[order[merged:]] = multi
+
+    # Resolve the start state of each chunk sequentially
+    transfer = transfer.tolist()
+    chunk_starts = np.zeros(num_chunks, dtype=np.int16)
+    state = dc_bias & 0xf
+    for c in range(num_chunks):
+        chunk_starts[c] = state
+        state = transfer[c][column[state]]
+
+    # Step all chunks from their actual start state
+    result = np.zeros((chunk, num_chunks), dtype=np.uint8)
+    state = chunk_starts
+    for n in range(chunk):
+        result[n] = state
+        state = flat.take(words[n] + state)
+
+    return result.T.ravel()[:count]
+
+def encode_data(words: np.ndarray, dc_bias: int=0) -> Tuple[np.ndarray, int]:
+    """Encode a 1D sequence of data words, returns the characters and final DC bias"""
+
+    states = scan_bias(words, dc_bias)
+    chars = enc_chars.ravel().take(words.astype(np.intp) << 4 | states)
+    if len(words) > 0:
+        dc_bias = int(enc_biases[words[-1], states[-1]])
+    return chars, dc_bias & 0xf
+
+def encode(data: np.ndarray, en_data=True, hsync=0, vsync=0, dc_bias: int=0) -> Tuple[np.ndarray, int]:
+    """Encode a sequence of symbols like `TMDSEncoder`
+
+    data: 8-bit data words
+    en_data: Data enable, control characters are sent where false
+    hsync, vsync: Sync signals encoded in control characters
+    dc_bias: Initial 4-bit DC bias state of the encoder
+
+    Returns the 10-bit characters and the final DC bias state."""
+
+    data = np.asarray(data, dtype=np.uint8)
+    shape = data.shape
+    data = data.ravel()
+    en_data = np.broadcast_to(np.asarray(en_data, dtype=bool), shape).ravel()
+    sync = (np.broadcast_to(np.asarray(hsync, dtype=np.uint8), shape).ravel() & 1) \
+        | (np.broadcast_to(np.asarray(vsync, dtype=np.uint8), shape).ravel() & 1) << 1
+
+    # Control characters don't affect the DC bias so only encode the data words
+    chars = ctl_chars.take(sync)
+    chars[en_data], dc_bias = encode_data(data[en_data], dc_bias)
+    return chars.reshape(shape), dc_bias
+
+def decode(chars: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Decode characters like `TMDSDecoder`
+
+    Returns `(data, en_data, hsync, vsync)` arrays."""
+
+    decoded = dec_table[np.asarray(chars, dtype=np.uint16) & 0x3ff]
+    return ((decoded & 0xff).astype(np.uint8), (decoded >> 8 & 1).astype(bool),
+        (decoded >> 9 & 1).astype(bool), (decoded >> 10 & 1).astype(bool))
+
+def encode_frame(rgb: np.ndarray, mode: DVIMode, dc_bias=(0, 0, 0)) -> Tuple[np.ndarray, Tuple[int, int, int]]:
+    """Encode a whole frame including blanking as sent by the DVI demos
+
+    rgb: `(height, width, 3)` array of 8-bit pixels
+    dc_bias: DC bias of the blue, green and red channels
+
+    Every line starts with the active pixels followed by the front porch,
+    sync pulse and back porch, lines are ordered likewise. Sync is sent on
+    the blue channel. Returns the characters as `(3, v_total, h_total)`
+    with channels in blue, green, red order and the final DC biases."""
+
+    h, v = mode.h, mode.v
+    h_total = h.pixels + h.front_porch + h.sync_pulse + h.back_porch
+    v_total = v.pixels + v.front_porch + v.sync_pulse + v.back_porch
+
+    # Blanking only contains control characters and the active pixels are
+    # contiguous in scan order, so encode them directly
+    x = np.arange(h_total)
+    y = np.arange(v_total)
+    h_sync = ((x >= h.pixels + h.front_porch) & (x < h.pixels + h.front_porch + h.sync_pulse)) ^ h.invert_polarity
+    v_sync = ((y >= v.pixels + v.front_porch) & (y < v.pixels + v.front_porch + v.sync_pulse)) ^ v.invert_polarity
+
+    chars = np.empty((3, v_total, h_total), dtype=np.uint16)
+    chars[0] = ctl_chars[h_sync[None, :] | v_sync[:, None].astype(np.intp) << 1]
+    chars[1:] = ctl_chars[0]
+
+    biases = []
+    for c, rgb_index in enumerate([2, 1, 0]):
+        active, bias = encode_data(rgb[:, :, rgb_index].ravel(), dc_bias[c])
+        chars[c, :v.pixels, :h.pixels] = active.reshape(v.pixels, h.pixels)
+        biases.append(bias)
+
+    return chars, tuple(biases)
+
+def check_rtl_equivalence(seed: int=1, count: int=4000):
+    """Compare the model against simulated `TMDSEncoder`/`TMDSDecoder`"""
+
+    from nmigen import Module
+    from nmigen.back.pysim import Simulator, Settle
+    from blip.rtl.dvi.tmds import TMDSEncoder, TMDSDecoder
+
+    rng = random.Random(seed)
+    stimulus = [(rng.randrange(256), rng.random() < 0.8, rng.randrange(2), rng.randrange(2))
+        for _ in range(count)]
+
+    m = Module()
+    m.submodules.enc = enc = TMDSEncoder()
+    m.submodules.dec = dec = TMDSDecoder()
+    m.d.comb += dec.i_char.eq(enc.o_char)
+
+    rtl_chars, rtl_decoded = [], []
+    def process():
+        for data, en_data, hsync, vsync in stimulus:
+            yield enc.i_data.eq(data)
+            yield enc.i_en_data.eq(en_data)
+            yield enc.i_hsync.eq(hsync)
+            yield enc.i_vsync.eq(vsync)
+            yield Settle()
+            rtl_chars.append((yield enc.o_char))
+            rtl_decoded.append(((yield dec.o_data), (yield dec.o_en_data),
+                (yield dec.o_hsync), (yield dec.o_vsync)))
+            yield
+
+    sim = Simulator(m)
+    sim.add_clock(1e-6)
+    sim.add_sync_process(process)
+    sim.run()
+
+    data, en_data, hsync, vsync = (np.array(s) for s in zip(*stimulus))
+    chars, _ = encode(data, en_data, hsync, vsync)
+    assert chars.tolist() == rtl_chars
+
+    decoded = decode(chars)
+    for n, rtl in enumerate(rtl_decoded):
+        ref = tuple(int(d[n]) for d in decoded)
+        if en_data[n]:
+            assert ref[:2] == rtl[:2], f"Decode mismatch at {n}: {ref} != {rtl}"
+        else:
+            assert ref[1:] == rtl[1:], f"Decode mismatch at {n}: {ref} != {rtl}"
+
+def check_frame_speed(max_ms_per_channel: float=100.0):
+    """Encode a random 1920x1080 frame, must take tens of milliseconds per channel
+
+    Uses the best CPU time of a few runs so that other tasks running in
+    parallel and the first run allocating memory don't count."""
+
+    from blip.util.dvi_timing import get_dvi_mode_cvt_rb
+
+    mode = get_dvi_mode_cvt_rb(1920, 1080)
+    rng = np.random.default_rng(1)
+    rgb = rng.integers(0, 256, size=(1080, 1920, 3), dtype=np.uint8)
+
+    seconds = float("inf")
+    for _ in range(3):
+        begin = time.process_time()
+        chars, _ = encode_frame(rgb, mode)
+        seconds = min(seconds, time.process_time() - begin)
+
+    data, en_data, _, _ = decode(chars)
+    assert np.array_equal(data[::-1, :1080, :1920].transpose(1, 2, 0), rgb)
+
+    ms_per_channel = seconds * 1000 / 3
+    assert ms_per_channel < max_ms_per_channel, \
+        f"Encoding took {ms_per_channel:.1f} ms per channel, expected below {max_ms_per_channel:.0f} ms"
+    return Result(ok=True, info=f"{ms_per_channel:.1f} ms per channel",
+        metrics={ "ms_per_channel": ms_per_channel })
+
+@check()
+def rtl_equivalence(bld: Builder):
+    bld.python("sim", check_rtl_equivalence)
+
+@check()
+def frame_speed(bld: Builder):
+    bld.python("encode", check_frame_speed)
@@ -0,0 +1,141 @@
+from nmigen import *
+from nmigen.build import Platform
+from nmigen.back import rtlil
+from nmigen.asserts import Assert, AnyConst
+from nmigen_boards.ulx3s import ULX3S_85F_Platform
+from typing import List, Tuple
+from blip import sweep, Builder
+from blip.task import sby
+
+def popcount_linear(value: Value) -> Value:
+    """Reference popcount as a chain of adders, deepest possible carry path"""
+    result = Const(0, range(len(value) + 1))
+    for bit in value:
+        result = result + bit
+    return result
+
+def popcount_tree(value: Value) -> Value:
+    """Popcount as a balanced tree of adders"""
+    if len(value) <= 1:
+        return value
+    half = len(value) // 2
+    return popcount_tree(value[:half]) + popcount_tree(value[half:])
+
+# Popcount of every 4-bit value
+popcount4_table = [bin(n).count("1") for n in range(16)]
+
+def popcount_lut4(value: Value) -> Value:
+    """Popcount with 4-bit groups counted by table lookup
+
+    Every output bit of a group count depends on 4 inputs and fits in a
+    single LUT4, the group counts are summed with `add_tree()`."""
+
+    groups = []
+    for base in range(0, len(value), 4):
+        group = value[base:base + 4]
+        table = Array(Const(popcount4_table[n], 3) for n in range(16))
+        groups.append(table[group])
+    return add_tree(groups)
+
+def zero_extend(value: Value, width: int) -> Value:
+    if len(value) >= width:
+        return value
+    return Cat(value, C(0, width - len(value)))
+
+def compress_3_2(a: Value, b: Value, c: Value) -> Tuple[Value, Value]:
+    """Full adder compressor, `a + b + c == sum + carry`"""
+    width = max(len(a), len(b), len(c))
+    a, b, c = (zero_extend(v, width) for v in (a, b, c))
+    return a ^ b ^ c, Cat(C(0, 1), (a & b) | (a & c) | (b & c))
+
+def add_tree(values: List[Value]) -> Value:
+    """Sum of unsigned values using a carry-save tree of 3:2 compressors
+
+    Only the last addition propagates carries, the compressor levels have
+    constant depth regardless of the operand width."""
+
+    values = list(values)
+    if len(values) == 0:
+        return C(0, 1)
+    while len(values) > 2:
+        compressed = []
+        while len(values) >= 3:
+            compressed.extend(compress_3_2(*values[:3]))
+            values = values[3:]
+        values = compressed + values
+    return sum(values[1:], values[0])
+
+def less_than(a: Value, b: Value) -> Value:
+    """Unsigned `a < b` as a tree of comparisons from the most significant half"""
+    width = max(len(a), len(b))
+    return _less_equal(zero_extend(a, width), zero_extend(b, width))[0]
+
+def _less_equal(a: Value, b: Value) -> Tuple[Value, Value]:
+    if len(a) == 1:
+        return ~a & b, a == b
+    half = len(a) // 2
+    lt_lo, eq_lo = _less_equal(a[:half], b[:half])
+    lt_hi, eq_hi = _less_equal(a[half:], b[half:])
+    return lt_hi | (eq_hi & lt_lo), eq_hi & eq_lo
+
+def build_formal(bld: Builder, width: int):
+    m = Module()
+
+    a = AnyConst(width)
+    b = AnyConst(width)
+    c = AnyConst(width)
+
+    naive_pop = Signal(range(width + 1))
+    m.d.comb += naive_pop.eq(popcount_linear(a))
+
+    m.d.comb += [
+        Assert(popcount_tree(a) == naive_pop),
+        Assert(popcount_lut4(a) == naive_pop),
+        Assert(add_tree([a, b, c, a ^ b]) == a + b + c + (a ^ b)),
+        Assert(less_than(a, b) == (a < b)),
+        Assert(less_than(a[:width // 2], b) == (a[:width // 2] < b)),
+    ]
+
+    with bld.temp_open("formal.il") as f:
+        il_text = rtlil.convert(m, ports=[naive_pop])
+        f.write(il_text)
+
+@sweep(width=[3, 7, 8, 16, 32])
+def prove(bld: Builder, width: int):
+    build_formal(bld, width)
+    sby.verify(bld, "prove.sby", "formal.il",
+        sby.Task("sby_bmc", "bmc", depth=1, engines=["smtbmc", "yices"]),
+    )
+
+class SynthTop(Elaboratable):
+    def __init__(self, width: int, popcount):
+        self.width = width
+        self.popcount = popcount
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        shift_in = Signal(self.width)
+        value = Signal(self.width)
+        count = Signal(range(self.width + 1))
+
+        dummy_in = platform.request("button_fire")
+        dummy_out = platform.request("led")
+
+        m.d.sync += [
+            shift_in.eq(Cat(dummy_in, shift_in[0:])),
+            value.eq(shift_in),
+            count.eq(self.popcount(value)),
+            dummy_out.eq(count.xor()),
+        ]
+
+        return m
+
+@sweep(width=[8, 16, 32], popcount={
+    "linear": popcount_linear,
+    "tree": popcount_tree,
+    "lut4": popcount_lut4,
+})
+def synth(bld: Builder, width: int, popcount):
+    platform = ULX3S_85F_Platform()
+    bld.build("synth", platform, SynthTop(width, popcount))
@@ -0,0 +1,125 @@
+from nmigen import *
+from nmigen.build import Platform
+from nmigen.back import rtlil
+from nmigen.asserts import Assert, Assume, AnyConst, AnySeq, Past
+from blip import sweep, Builder
+from blip.task import sby
+
+class RatioCDC(Elaboratable):
+    def __init__(self, width: int, r_domain: str="read", w_domain: str="write"):
+        """Clock domain crossing between clocks with an integer frequency ratio
+
+        The read clock must run an integer multiple faster than the write
+        clock and come from the same PLL with zero phase offset, so that every
+        write clock edge coincides with a read clock edge, eg. the pixel and
+        TMDS clocks of the DVI demos. Use `AsyncFIFOBuffered` for unrelated
+        clocks instead.
+
+        A word written with `w_en` is registered in the write domain and
+        captured to `r_data` on the next read clock edge, where `r_rdy` stays
+        set until it's read with `r_en`. There is no backpressure, the reader
+        must read once per write clock period like `Gearbox` does or the word
+        is overwritten by the next one. Both domains must be reset together.
+        """
+
+        self.width = width
+        self.r_domain = r_domain
+        self.w_domain = w_domain
+
+        self.w_data = Signal(width)
+        self.w_en = Signal()
+
+        self.r_data = Signal(width)
+        self.r_rdy = Signal()
+        self.r_en = Signal()
+
+        self.w_buf = Signal(width)
+        self.w_toggle = Signal()
+        self.r_toggle = Signal()
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        with m.If(self.w_en):
+            m.d[self.w_domain] += [
+                self.w_buf.eq(self.w_data),
+                self.w_toggle.eq(~self.w_toggle),
+            ]
+
+        # The toggle and buffer change on a shared edge of the clocks and are
+        # sampled a full read clock period later, no synchronizer needed
+        with m.If(self.w_toggle != self.r_toggle):
+            m.d[self.r_domain] += [
+                self.r_data.eq(self.w_buf),
+                self.r_rdy.eq(1),
+                self.r_toggle.eq(self.w_toggle),
+            ]
+        with m.Elif(self.r_en):
+            m.d[self.r_domain] += self.r_rdy.eq(0)
+
+        return m
+
+def build_formal(bld: Builder, ratio: int):
+    """Prove `RatioCDC` for a read clock `ratio` times the write clock
+
+    The formal clock is the read clock and the write domain is enabled once
+    every `ratio` cycles, the reader reads once per period at a different
+    arbitrary phase. The written words are a running sequence number."""
+
+    m = Module()
+    width = 8
+
+    count = Signal(range(ratio))
+    w_phase = AnyConst(range(ratio))
+    r_phase = AnyConst(range(ratio))
+    w_tick = Signal()
+    m.d.sync += count.eq(Mux(count == ratio - 1, 0, count + 1))
+    m.d.comb += w_tick.eq(count == w_phase)
+
+    m.submodules.cdc = cdc = DomainRenamer({ "read": "sync", "write": "sync" })(
+        EnableInserter({ "write": w_tick })(RatioCDC(width)))
+    m.d.comb += [
+        cdc.r_en.eq(count == r_phase),
+        Assume(~ResetSignal()),
+    ]
+
+    seq = Signal(width)
+    last_read = Signal(width)
+    w_en = AnySeq(1)
+    m.d.comb += [
+        cdc.w_en.eq(w_en),
+        cdc.w_data.eq(seq + 1),
+    ]
+    with m.If(w_tick & w_en):
+        m.d.sync += seq.eq(seq + 1)
+    with m.If(cdc.r_en & cdc.r_rdy):
+        m.d.sync += last_read.eq(cdc.r_data)
+
+    pending = Signal(width)
+    m.d.comb += pending.eq(seq - last_read)
+
+    m.d.comb += [
+        # Words are read in order without drops or repeats
+        Assert(~(cdc.r_en & cdc.r_rdy) | (cdc.r_data == (last_read + 1)[:width])),
+        # At most one word waits for the reader besides the one in `r_data`
+        Assert(pending <= 2),
+        # Every word is read within `ratio + 1` cycles of being written
+        Assert((last_read - Past(seq, ratio + 1))[:width] <= 2),
+
+        # Invariants for induction
+        Assert(count < ratio),
+        Assert(cdc.w_buf == seq),
+        Assert(cdc.r_data == Mux(cdc.r_toggle == cdc.w_toggle, seq, seq - 1)[:width]),
+        Assert(cdc.r_data == Mux(cdc.r_rdy, last_read + 1, last_read)[:width]),
+    ]
+
+    with bld.temp_open("formal.il") as f:
+        il_text = rtlil.convert(m, ports=[seq, last_read])
+        f.write(il_text)
+
+@sweep(ratio=[5, 10])
+def prove(bld: Builder, ratio: int):
+    build_formal(bld, ratio)
+    sby.verify(bld, "prove.sby", "formal.il",
+        sby.Task("sby_prove", "prove", depth=2*ratio + 2, engines=["smtbmc", "yices"]),
+    )
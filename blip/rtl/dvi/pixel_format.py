@@ -0,0 +1,266 @@
+from nmigen import *
+from nmigen.build import Platform
+from nmigen_boards.ulx3s import ULX3S_85F_Platform
+from typing import List, Optional, Tuple
+from blip import check, sweep, Builder
+
+# Bits per pixel of the supported formats
+pixel_formats = {
+    "rgb888": 24,
+    "rgb565": 16,
+    "rgb332": 8,
+    "pal8": 8,
+    "pal4": 4,
+}
+
+# Bit offsets and widths of the red, green and blue fields of direct color formats
+format_fields = {
+    "rgb888": [(16, 8), (8, 8), (0, 8)],
+    "rgb565": [(11, 5), (5, 6), (0, 5)],
+    "rgb332": [(5, 3), (2, 3), (0, 2)],
+}
+
+def expand_bits(value: int, bits: int) -> int:
+    """Scale a `bits` wide channel to 8 bits by repeating it"""
+    result, shift = 0, 8
+    while shift > 0:
+        shift -= bits
+        result |= value << shift if shift >= 0 else value >> -shift
+    return result & 0xff
+
+def expand_reference(fmt: str, pixel: int, palette: Optional[List[int]]=None) -> Tuple[int, int, int]:
+    """Expand a pixel like `PixelExpander`, returns `(r, g, b)`"""
+    if fmt in format_fields:
+        return tuple(expand_bits(pixel >> offset & ((1 << bits) - 1), bits)
+            for offset, bits in format_fields[fmt])
+    color = palette[pixel]
+    return (color >> 16 & 0xff, color >> 8 & 0xff, color & 0xff)
+
+class PixelExpander(Elaboratable):
+    def __init__(self, fmt: str, palette: Optional[List[int]]=None):
+        """Expand compact pixels to 8 bits per channel
+
+        fmt: One of `pixel_formats`
+        palette: Initial `0xRRGGBB` colors of palette formats
+
+        Direct color formats repeat the channel bits to fill 8 bits so that
+        full intensity stays full intensity. Palette formats look up the
+        color in a block RAM that can be rewritten through the `i_pal_*`
+        port. The output is registered, `o_r`, `o_g` and `o_b` follow
+        `i_pixel` after `latency` cycles in every format.
+        """
+
+        if fmt not in pixel_formats:
+            raise ValueError(f"Unknown pixel format: {fmt}")
+
+        self.fmt = fmt
+        self.bits = pixel_formats[fmt]
+        self.latency = 1
+
+        self.i_pixel = Signal(self.bits)
+        self.o_r = Signal(8)
+        self.o_g = Signal(8)
+        self.o_b = Signal(8)
+
+        if fmt not in format_fields:
+            self.palette = list(palette or [])
+            self.i_pal_addr = Signal(self.bits)
+            self.i_pal_data = Signal(24)
+            self.i_pal_we = Signal()
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        outputs = [self.o_r, self.o_g, self.o_b]
+
+        if self.fmt in format_fields:
+            for o, (offset, bits) in zip(outputs, format_fields[self.fmt]):
+                field = self.i_pixel[offset:offset + bits]
+                m.d.sync += o.eq(Cat(*[field] * (8 // bits + 1))[-8:])
+            return m
+
+        pal = Memory(width=24, depth=1 << self.bits, init=self.palette)
+        m.submodules.pal_rd = pal_rd = pal.read_port(transparent=False)
+        m.submodules.pal_wr = pal_wr = pal.write_port()
+        m.d.comb += [
+            pal_rd.addr.eq(self.i_pixel),
+            self.o_r.eq(pal_rd.data[16:24]),
+            self.o_g.eq(pal_rd.data[8:16]),
+            self.o_b.eq(pal_rd.data[0:8]),
+            pal_wr.addr.eq(self.i_pal_addr),
+            pal_wr.data.eq(self.i_pal_data),
+            pal_wr.en.eq(self.i_pal_we),
+        ]
+
+        return m
+
+class WordUnpacker(Elaboratable):
+    def __init__(self, fmt: str, word_bits: int=32):
+        """Split memory words into pixels of `fmt` for `PixelExpander`
+
+        fmt: One of `pixel_formats`, the pixels must fill the word exactly
+        word_bits: Bits per word
+
+        Words are taken with `i_valid`/`o_ready` and pixels are sent lowest
+        bits first with `o_valid`/`i_ready`. The next word is taken while the
+        last pixel is sent so the output can run at one pixel per cycle.
+        """
+
+        if fmt not in pixel_formats:
+            raise ValueError(f"Unknown pixel format: {fmt}")
+        if word_bits % pixel_formats[fmt] != 0:
+            raise ValueError(f"{word_bits} bit words can't be split into {fmt} pixels")
+
+        self.fmt = fmt
+        self.bits = pixel_formats[fmt]
+        self.word_bits = word_bits
+        self.pixels_per_word = word_bits // self.bits
+
+        self.i_word = Signal(word_bits)
+        self.i_valid = Signal()
+        self.o_ready = Signal()
+        self.o_pixel = Signal(self.bits)
+        self.o_valid = Signal()
+        self.i_ready = Signal()
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        word = Signal(self.word_bits)
+        left = Signal(range(self.pixels_per_word + 1))
+
+        m.d.comb += [
+            self.o_pixel.eq(word[:self.bits]),
+            self.o_valid.eq(left != 0),
+            self.o_ready.eq((left == 0) | ((left == 1) & self.i_ready)),
+        ]
+
+        with m.If(self.i_valid & self.o_ready):
+            m.d.sync += [
+                word.eq(self.i_word),
+                left.eq(self.pixels_per_word),
+            ]
+        with m.Elif(self.o_valid & self.i_ready):
+            m.d.sync += [
+                word.eq(word >> self.bits),
+                left.eq(left - 1),
+            ]
+
+        return m
+
+def check_expansion(fmt: str, count: int=500):
+    """Simulate `PixelExpander` on random pixels against `expand_reference()`"""
+    import random
+    from nmigen.back.pysim import Simulator, Settle
+
+    rng = random.Random(fmt)
+    bits = pixel_formats[fmt]
+    palette = [rng.randrange(1 << 24) for _ in range(1 << bits)] if fmt not in format_fields else None
+
+    dut = PixelExpander(fmt, palette)
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    pixels = [rng.randrange(1 << bits) for _ in range(count)]
+    pixels[:2] = [0, (1 << bits) - 1]
+    results = []
+    def process():
+        for n, pixel in enumerate(pixels):
+            expected = expand_reference(fmt, pixel, palette)
+            yield dut.i_pixel.eq(pixel)
+            # Rewrite a palette entry halfway, visible from the next pixel on
+            if palette and n == count // 2:
+                palette[pixels[n + 1]] = 0x123456
+                yield dut.i_pal_addr.eq(pixels[n + 1])
+                yield dut.i_pal_data.eq(0x123456)
+                yield dut.i_pal_we.eq(1)
+            elif palette:
+                yield dut.i_pal_we.eq(0)
+            yield
+            yield Settle()
+            rgb = ((yield dut.o_r), (yield dut.o_g), (yield dut.o_b))
+            results.append((pixel, rgb, expected))
+
+    sim.add_sync_process(process)
+    sim.run()
+
+    for pixel, rgb, ref in results:
+        assert rgb == ref, f"{fmt} pixel {pixel:#x}: {rgb} != {ref}"
+    assert expand_reference(fmt, (1 << bits) - 1, palette) != (0, 0, 0)
+    if not palette:
+        assert expand_reference(fmt, (1 << bits) - 1) == (0xff, 0xff, 0xff)
+
+@check()
+def sim(bld: Builder):
+    for fmt in pixel_formats:
+        bld.python(f"sim_{fmt}", check_expansion, fmt)
+
+def check_unpacker(fmt: str, count: int=200):
+    """Simulate `WordUnpacker` with random stalls on both sides against the packed words"""
+    import random
+    from nmigen.back.pysim import Simulator, Settle
+
+    rng = random.Random(fmt)
+    dut = WordUnpacker(fmt)
+    words = [rng.randrange(1 << dut.word_bits) for _ in range(count)]
+    mask = (1 << dut.bits) - 1
+    expected = [w >> (n * dut.bits) & mask for w in words for n in range(dut.pixels_per_word)]
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    pixels = []
+    def process():
+        index = 0
+        # Both sides run without stalls first to check the full rate
+        for cycle in range(2 * len(expected)):
+            full_rate = cycle < 3 * dut.pixels_per_word
+            valid = index < len(words) and (full_rate or rng.random() < 0.7)
+            yield dut.i_word.eq(words[index] if valid else 0)
+            yield dut.i_valid.eq(valid)
+            yield dut.i_ready.eq(full_rate or rng.random() < 0.7)
+            yield Settle()
+            if full_rate:
+                assert (yield dut.o_valid) or cycle == 0, "Unpacker stalled at full rate"
+            if (yield dut.o_valid) and (yield dut.i_ready):
+                pixels.append((yield dut.o_pixel))
+            if valid and (yield dut.o_ready):
+                index += 1
+            yield
+
+    sim.add_sync_process(process)
+    sim.run()
+
+    assert pixels == expected[:len(pixels)], f"{fmt}: unpacked pixels don't match"
+    assert len(pixels) > len(expected) // 2, f"{fmt}: only {len(pixels)} pixels unpacked"
+
+@check()
+def sim_unpack(bld: Builder):
+    for fmt, bits in pixel_formats.items():
+        if 32 % bits == 0:
+            bld.python(f"sim_{fmt}", check_unpacker, fmt)
+
+class SynthTop(Elaboratable):
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        m.submodules.expander = expander = PixelExpander(self.fmt, [0] * (1 << pixel_formats[self.fmt]))
+
+        shift_in = Signal(pixel_formats[self.fmt])
+        dummy_in = platform.request("button_fire")
+        dummy_out = platform.request("led")
+
+        m.d.sync += [
+            shift_in.eq(Cat(dummy_in, shift_in[0:])),
+            expander.i_pixel.eq(shift_in),
+            dummy_out.eq(Cat(expander.o_r, expander.o_g, expander.o_b).xor()),
+        ]
+
+        return m
+
+@sweep(fmt=list(pixel_formats))
+def synth(bld: Builder, fmt: str):
+    platform = ULX3S_85F_Platform()
+    bld.build("synth", platform, SynthTop(fmt))
@@ -0,0 +1,228 @@
+from nmigen import *
+from nmigen.build import Platform
+from nmigen_boards.ulx3s import ULX3S_85F_Platform
+from blip import check, sweep, Builder
+from blip.util.dvi_timing import DVIMode, DVITiming, get_dvi_mode_cvt_rb
+from blip.rtl.dvi.timing import VideoTiming, axis_values
+
+class LineScaler(Elaboratable):
+    def __init__(self, dvi_mode: DVIMode, scale: int, width: int=24):
+        """Integer upscaler replaying source lines from block RAM
+
+        dvi_mode: Output mode, the source is `pixels / scale` in both axes
+        scale: Integer scale factor
+        width: Bits per pixel
+
+        `i_h` and `i_v` are the output position from a timing generator
+        counting active pixels first like `VideoTiming`. `o_pixel` is the
+        source pixel for the position `latency` cycles later.
+
+        Each source line is fetched once into one half of a two line buffer
+        while the previous line is replayed `scale` times from the other
+        half, so the source is read at `1 / scale**2` of the output pixel
+        rate. A fetch starts with `o_src_start` for line `o_src_line` one
+        source line ahead (the first line during the last blanking line) and
+        takes `src_width` pixels with `i_src_valid`/`o_src_ready`, it must
+        finish within `scale` output lines.
+        """
+
+        h, v = axis_values(dvi_mode.h), axis_values(dvi_mode.v)
+        if h["data"] % scale != 0 or v["data"] % scale != 0:
+            raise ValueError(f"Resolution is not divisible by scale {scale}")
+
+        self.dvi_mode = dvi_mode
+        self.scale = scale
+        self.width = width
+        self.h_last = h["last"]
+        self.v_last = v["last"]
+        self.v_data = v["data"]
+        self.src_width = h["data"] // scale
+        self.src_height = v["data"] // scale
+        self.latency = 1
+
+        self.i_h = Signal(range(h["last"] + 1))
+        self.i_v = Signal(range(v["last"] + 1))
+        self.o_pixel = Signal(width)
+
+        self.o_src_start = Signal()
+        self.o_src_line = Signal(range(self.src_height))
+        self.i_src_data = Signal(width)
+        self.i_src_valid = Signal()
+        self.o_src_ready = Signal()
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        scale, src_width = self.scale, self.src_width
+
+        buf = Memory(width=self.width, depth=2 * src_width)
+        m.submodules.buf_rd = buf_rd = buf.read_port(transparent=False)
+        m.submodules.buf_wr = buf_wr = buf.write_port()
+
+        # Source position of the current output position
+        x_src = Signal(range(src_width + 1))
+        x_sub = Signal(range(scale))
+        y_src = Signal(range(self.src_height + 1))
+        y_sub = Signal(range(scale))
+
+        line_end = self.i_h == self.h_last
+        with m.If(line_end):
+            m.d.sync += [x_src.eq(0), x_sub.eq(0)]
+            with m.If(self.i_v == self.v_last):
+                m.d.sync += [y_src.eq(0), y_sub.eq(0)]
+            with m.Elif(y_sub == scale - 1):
+                m.d.sync += [y_src.eq(y_src + 1), y_sub.eq(0)]
+            with m.Else():
+                m.d.sync += y_sub.eq(y_sub + 1)
+        with m.Elif(x_sub == scale - 1):
+            m.d.sync += [x_src.eq(x_src + 1), x_sub.eq(0)]
+        with m.Else():
+            m.d.sync += x_sub.eq(x_sub + 1)
+
+        m.d.comb += [
+            buf_rd.addr.eq(Mux(y_src[0], src_width, 0) + x_src),
+            self.o_pixel.eq(buf_rd.data),
+        ]
+
+        # Fetch the next source line when the previous one starts replaying
+        fetch_line = Signal(range(self.src_height))
+        fetch_x = Signal(range(src_width))
+        fetching = Signal()
+
+        with m.If(self.i_h == 0):
+            with m.If(self.i_v == self.v_last):
+                m.d.comb += [self.o_src_start.eq(1), fetch_line.eq(0)]
+            with m.Elif((self.i_v < self.v_data) & (y_sub == 0) & (y_src + 1 < self.src_height)):
+                m.d.comb += [self.o_src_start.eq(1), fetch_line.eq(y_src + 1)]
+
+        m.d.comb += [
+            self.o_src_line.eq(fetch_line),
+            self.o_src_ready.eq(fetching),
+        ]
+
+        bank = Signal()
+        with m.If(self.o_src_start):
+            m.d.sync += [
+                fetching.eq(1),
+                fetch_x.eq(0),
+                bank.eq(fetch_line[0]),
+            ]
+        with m.Elif(fetching & self.i_src_valid):
+            m.d.sync += fetch_x.eq(fetch_x + 1)
+            with m.If(fetch_x == src_width - 1):
+                m.d.sync += fetching.eq(0)
+
+        m.d.comb += [
+            buf_wr.addr.eq(Mux(bank, src_width, 0) + fetch_x),
+            buf_wr.data.eq(self.i_src_data),
+            buf_wr.en.eq(fetching & self.i_src_valid),
+        ]
+
+        return m
+
+def check_scaler(scale: int, frames: int=3):
+    """Simulate `LineScaler` with a stalling source and compare to the source image
+
+    Without scaling there is only a single line time for each fetch so the
+    source doesn't stall."""
+    import random
+    from nmigen.back.pysim import Simulator, Settle
+
+    rng = random.Random(scale)
+    valid_rate = 0.7 if scale > 1 else 1.0
+    mode = DVIMode(1.0, 60.0, DVITiming(3, 12*scale, 2, 3, False), DVITiming(1, 4*scale, 1, 1, False))
+
+    m = Module()
+    m.submodules.timing = timing = VideoTiming([mode])
+    m.submodules.scaler = scaler = LineScaler(mode, scale, width=16)
+    m.d.comb += [
+        scaler.i_h.eq(timing.o_h),
+        scaler.i_v.eq(timing.o_v),
+    ]
+
+    def source_pixel(frame, x, y):
+        return (frame * 97 + y * 31 + x * 7) & 0xffff
+
+    sim = Simulator(m)
+    sim.add_clock(1e-6)
+
+    checked = []
+    mismatches = []
+    def process():
+        frame = -1
+        lines = {}     # Frame of the last fetch of each source line
+        fetch = None   # Line, frame and position of the running fetch
+        expected = None
+        while len(checked) < frames * mode.h.pixels * mode.v.pixels:
+            yield Settle()
+
+            pixel = yield scaler.o_pixel
+            if expected is not None:
+                checked.append(expected)
+                if pixel != source_pixel(*expected):
+                    mismatches.append((expected, pixel))
+
+            h, v = (yield timing.o_h), (yield timing.o_v)
+            expected = None
+            if (yield timing.o_de) and v // scale in lines:
+                expected = (lines[v // scale], h // scale, v // scale)
+
+            if fetch and (yield scaler.i_src_valid) and (yield scaler.o_src_ready):
+                fetch[2] += 1
+                if fetch[2] == scaler.src_width:
+                    fetch = None
+            if (yield scaler.o_src_start):
+                line = yield scaler.o_src_line
+                if line == 0: frame += 1
+                fetch = [line, frame, 0]
+                lines[line] = frame
+                yield scaler.i_src_valid.eq(0)
+            elif fetch:
+                yield scaler.i_src_data.eq(source_pixel(fetch[1], fetch[2], fetch[0]))
+                yield scaler.i_src_valid.eq(rng.random() < valid_rate)
+            yield
+
+    sim.add_sync_process(process)
+    sim.run()
+
+    assert not mismatches, f"{len(mismatches)} mismatching pixels, first {mismatches[0]}"
+
+@check()
+def sim(bld: Builder):
+    for scale in [1, 2, 3]:
+        bld.python(f"sim_{scale}", check_scaler, scale)
+
+class SynthTop(Elaboratable):
+    def __init__(self, dvi_mode: DVIMode, scale: int):
+        self.dvi_mode = dvi_mode
+        self.scale = scale
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        m.submodules.timing = timing = VideoTiming([self.dvi_mode])
+        m.submodules.scaler = scaler = LineScaler(self.dvi_mode, self.scale)
+
+        shift_in = Signal(24)
+        dummy_in = platform.request("button_fire")
+        dummy_out = platform.request("led")
+
+        m.d.sync += [
+            shift_in.eq(Cat(dummy_in, shift_in[0:])),
+            scaler.i_src_data.eq(shift_in),
+            scaler.i_src_valid.eq(shift_in[0]),
+            dummy_out.eq(scaler.o_pixel.xor() ^ scaler.o_src_start),
+        ]
+        m.d.comb += [
+            scaler.i_h.eq(timing.o_h),
+            scaler.i_v.eq(timing.o_v),
+        ]
+
+        return m
+
+@sweep(
+    resolution={"720p": (1280, 720), "1080p": (1920, 1080)},
+    scale=[2, 4])
+def synth(bld: Builder, resolution, scale: int):
+    platform = ULX3S_85F_Platform()
+    dvi_mode = get_dvi_mode_cvt_rb(*resolution)
+    bld.build("synth", platform, SynthTop(dvi_mode, scale))
@@ -0,0 +1,274 @@
+from nmigen import *
+from nmigen.build import Platform
+from typing import List, Tuple
+from blip import check, Builder
+from blip.rtl.ecp5.io import Ecp5OutDdr2, Ecp5OutDdr4, Ecp5OutDdr7, Ecp5ClockDiv, Ecp5EdgeClockSync
+
+# Bits per `sclk` cycle supported by the ECP5 output primitives
+gearings = {
+    2: Ecp5OutDdr2, # ODDRX1F
+    4: Ecp5OutDdr4, # ODDRX2F
+    7: Ecp5OutDdr7, # ODDR71B
+}
+
+def gearbox_schedule(width: int, gearing: int) -> List[Tuple[int, bool]]:
+    """Buffered bit count and whether a word is read for every phase of `Gearbox`"""
+
+    assert width >= gearing, "Words must be at least as wide as the output"
+
+    schedule = []
+    level = 0
+    while True:
+        read = level < gearing
+        schedule.append((level, read))
+        level += (width if read else 0) - gearing
+        if level == 0: break
+    return schedule
+
+class Gearbox(Elaboratable):
+    def __init__(self, width: int, gearing: int, lanes: int=1):
+        """Split `width` bit words into `gearing` bits per clock LSB first
+
+        `i_word` contains `lanes` words that are read together when `o_read`
+        is asserted. The phase of the read pattern is fixed, see
+        `gearbox_schedule()`, so every word is selected with constant
+        shifts instead of a barrel shifter.
+        """
+
+        self.width = width
+        self.gearing = gearing
+        self.lanes = lanes
+
+        self.i_word = Signal(width * lanes)
+        self.o_read = Signal()
+        self.o_bits = Signal(gearing * lanes)
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        width, gearing = self.width, self.gearing
+
+        schedule = gearbox_schedule(width, gearing)
+        phase = Signal(range(len(schedule)))
+        m.d.sync += phase.eq(Mux(phase == len(schedule) - 1, 0, phase + 1))
+
+        bufs = [Signal(width, name=f"buf{ix}") for ix in range(self.lanes)]
+
+        with m.Switch(phase):
+            for p, (level, read) in enumerate(schedule):
+                with m.Case(p):
+                    if read:
+                        m.d.comb += self.o_read.eq(1)
+                    for ix, buf in enumerate(bufs):
+                        if read:
+                            bits = Cat(buf[:level], self.i_word.word_select(ix, width))
+                        else:
+                            bits = buf[:level]
+                        m.d.comb += self.o_bits.word_select(ix, gearing).eq(bits[:gearing])
+                        m.d.sync += buf.eq(bits[gearing:])
+
+        return m
+
+class Ecp5SerializerClocks(Elaboratable):
+    def __init__(self, hz: float, gearing: int):
+        """Edge and system clocks for `TMDSSerializer`
+
+        hz: Frequency of `i_clk`, half of the bit rate
+
+        With gearing 2 both clocks are `i_clk`, otherwise the edge clock is
+        routed through ECLKSYNCB and divided by 2 or 3.5 with CLKDIVF.
+        """
+
+        self.i_clk = Signal()
+        self.o_eclk = Signal()
+        self.o_sclk = Signal()
+
+        self.gearing = gearing
+        self.eclk_hz = hz
+        self.sclk_hz = hz / (gearing / 2)
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        if self.gearing == 2:
+            m.d.comb += [
+                self.o_eclk.eq(self.i_clk),
+                self.o_sclk.eq(self.i_clk),
+            ]
+            return m
+
+        m.submodules.esync = esync = Ecp5EdgeClockSync(self.eclk_hz)
+        m.submodules.div = div = Ecp5ClockDiv(self.eclk_hz, self.gearing / 2)
+        m.d.comb += [
+            esync.i.eq(self.i_clk),
+            div.i.eq(esync.o),
+            self.o_eclk.eq(esync.o),
+            self.o_sclk.eq(div.o),
+        ]
+
+        return m
+
+class TMDSSerializer(Elaboratable):
+    def __init__(self, chars: int=1, gearing: int=2):
+        """Serialize the TMDS data lanes and clock lane on ECP5 DDR outputs
+
+        chars: Characters per lane in a word, eg. pixels per clock
+        gearing: Bits output per `sclk` cycle, one of `gearings`
+
+        `i_packed` contains the blue, green and red lanes as `10*chars`
+        bits each, a new word is read when `o_read` is asserted. Runs in the
+        `sclk` domain, gearings above 2 also need the `eclk` edge clock from
+        `Ecp5SerializerClocks`.
+        """
+
+        if gearing not in gearings:
+            raise ValueError(f"Unsupported gearing: {gearing}")
+
+        self.chars = chars
+        self.gearing = gearing
+
+        self.i_packed = Signal(3*10*chars)
+        self.o_read = Signal()
+        self.o_data = Signal(3)
+        self.o_clk = Signal()
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        width = 10 * self.chars
+
+        m.submodules.gearbox = gearbox = DomainRenamer("sclk")(Gearbox(width, self.gearing, lanes=4))
+        m.d.comb += [
+            gearbox.i_word.eq(Cat(self.i_packed, Repl(C(0b0000011111, 10), self.chars))),
+            self.o_read.eq(gearbox.o_read),
+        ]
+
+        outputs = [self.o_data[0], self.o_data[1], self.o_data[2], self.o_clk]
+        for ix, o in enumerate(outputs):
+            if self.gearing == 2:
+                ddr = DomainRenamer("sclk")(Ecp5OutDdr2())
+            else:
+                ddr = gearings[self.gearing]()
+                m.d.comb += [
+                    ddr.sclk.eq(ClockSignal("sclk")),
+                    ddr.eclk.eq(ClockSignal("eclk")),
+                ]
+            m.submodules[f"ddr{ix}"] = ddr
+            m.d.comb += [
+                ddr.i.eq(gearbox.o_bits.word_select(ix, self.gearing)),
+                o.eq(ddr.o),
+            ]
+
+        return m
+
+def check_gearbox(width: int, gearing: int, words: int=64):
+    """Simulate `Gearbox` and compare the output to the words sent LSB first"""
+    import random
+    from nmigen.back.pysim import Simulator, Settle
+
+    rng = random.Random(width * 8 + gearing)
+    data = [rng.randrange(1 << width) for _ in range(words)]
+
+    dut = Gearbox(width, gearing)
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    bits = []
+    def process():
+        index = 0
+        while len(bits) < width * (words + 2):
+            yield dut.i_word.eq(data[min(index, words - 1)])
+            yield Settle()
+            out = yield dut.o_bits
+            bits.extend((out >> n) & 1 for n in range(gearing))
+            if (yield dut.o_read):
+                index += 1
+            yield
+
+    sim.add_sync_process(process)
+    sim.run()
+
+    # Bits buffered before the first read are undefined
+    ref = [(word >> n) & 1 for word in data for n in range(width)]
+    assert any(bits[offset:offset + len(ref)] == ref for offset in range(width)), \
+        f"Bit order mismatch for {width}:{gearing}"
+
+@check()
+def gearbox(bld: Builder):
+    for width in [10, 20, 40]:
+        for gearing in gearings:
+            bld.python(f"sim_{width}_{gearing}", check_gearbox, width, gearing)
+
+class SerializerSim(Elaboratable):
+    def __init__(self, gearing: int):
+        """`TMDSSerializer` with its clocks generated from the `sync` domain"""
+        self.serializer = TMDSSerializer(gearing=gearing)
+        self.clocks = Ecp5SerializerClocks(1e6, gearing)
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        m.domains.eclk = ClockDomain("eclk")
+        m.domains.sclk = ClockDomain("sclk")
+        m.submodules.clocks = clocks = self.clocks
+        m.submodules.serializer = self.serializer
+        m.d.comb += [
+            clocks.i_clk.eq(ClockSignal()),
+            ClockSignal("eclk").eq(clocks.o_eclk),
+            ClockSignal("sclk").eq(clocks.o_sclk),
+        ]
+
+        return m
+
+def check_serializer(gearing: int, words: int=64):
+    """Simulate `TMDSSerializer` including the DDR primitive models and
+    compare every lane to the characters sent LSB first"""
+    import random
+    from nmigen.back.pysim import Simulator, Settle, Delay
+
+    rng = random.Random(gearing)
+    data = [[rng.randrange(1 << 10) for _ in range(3)] for _ in range(words)]
+
+    dut = SerializerSim(gearing)
+    ser = dut.serializer
+    sim = Simulator(dut)
+    period = 1e-6
+    sim.add_clock(period)
+
+    done = False
+    def feed():
+        nonlocal done
+        index = 0
+        while index < words:
+            yield ser.i_packed.eq(Cat(*(C(c, 10) for c in data[index])))
+            yield Settle()
+            if (yield ser.o_read):
+                index += 1
+            yield
+        done = True
+
+    # Sample the outputs in the middle of every `eclk` half period, the
+    # first rising edge is at half a period
+    lanes = [[] for _ in range(4)]
+    def sample():
+        yield Delay(period * 3 / 4)
+        while not done:
+            data_bits, clk_bit = (yield ser.o_data), (yield ser.o_clk)
+            for ix in range(3):
+                lanes[ix].append((data_bits >> ix) & 1)
+            lanes[3].append(clk_bit)
+            yield Delay(period / 2)
+
+    sim.add_sync_process(feed, domain="sclk")
+    sim.add_process(sample)
+    sim.run()
+
+    clk_char = 0b0000011111
+    for ix, bits in enumerate(lanes):
+        chars = [word[ix] for word in data[:-4]] if ix < 3 else [clk_char] * (words - 4)
+        ref = [(c >> n) & 1 for c in chars for n in range(10)]
+        assert any(bits[offset:offset + len(ref)] == ref for offset in range(len(bits) - len(ref))), \
+            f"Bit order mismatch in lane {ix} for gearing {gearing}"
+
+@check()
+def serializer(bld: Builder):
+    for gearing in gearings:
+        bld.python(f"sim_{gearing}", check_serializer, gearing)
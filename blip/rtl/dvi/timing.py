@@ -0,0 +1,174 @@
+from nmigen import *
+from nmigen.build import Platform
+from typing import List, Dict, Tuple
+from blip import check, Builder
+from blip.util.dvi_timing import DVIMode, DVITiming
+
+# Register values of an axis in `VideoTiming`, all counted from the first
+# active pixel: data end, front porch end, sync end and last position
+axis_fields = ["data", "front", "sync", "last"]
+
+def axis_values(timing: DVITiming) -> Dict[str, int]:
+    front = timing.pixels + timing.front_porch
+    sync = front + timing.sync_pulse
+    total = sync + timing.back_porch
+    return { "data": timing.pixels, "front": front, "sync": sync, "last": total - 1 }
+
+class VideoTiming(Elaboratable):
+    def __init__(self, modes: List[DVIMode]):
+        """Video timing generator switching between modes at runtime
+
+        modes: Modes stored in a ROM, selected by `i_mode`
+
+        The porch, sync and active values and the sync polarities of both
+        axes are registers loaded from the ROM at the end of every frame, so
+        a new `i_mode` takes effect from the next frame without glitches.
+        After reset the first mode is active. The pixel clock must be changed
+        separately to match the selected mode.
+
+        o_h, o_v: Position within the frame, active pixels first
+        o_de: Active pixel data
+        o_hsync, o_vsync: Sync signals with the polarity of the mode applied
+        o_frame: First cycle of a frame
+        o_mode: Index of the active mode
+        """
+
+        if not modes:
+            raise ValueError("VideoTiming needs at least one mode")
+
+        self.modes = list(modes)
+        self.h_values = [axis_values(mode.h) for mode in self.modes]
+        self.v_values = [axis_values(mode.v) for mode in self.modes]
+        h_max = max(v["last"] for v in self.h_values)
+        v_max = max(v["last"] for v in self.v_values)
+
+        self.i_mode = Signal(range(len(self.modes)))
+
+        self.o_h = Signal(range(h_max + 1))
+        self.o_v = Signal(range(v_max + 1))
+        self.o_de = Signal()
+        self.o_hsync = Signal()
+        self.o_vsync = Signal()
+        self.o_frame = Signal()
+        self.o_mode = Signal(range(len(self.modes)))
+
+    def rom_layout(self) -> List[Tuple[str, int]]:
+        layout = [(f"h_{name}", len(self.o_h)) for name in axis_fields]
+        layout += [(f"v_{name}", len(self.o_v)) for name in axis_fields]
+        layout += [("h_invert", 1), ("v_invert", 1)]
+        return layout
+
+    def rom_entry(self, index: int) -> int:
+        mode = self.modes[index]
+        values = { f"h_{k}": v for k, v in self.h_values[index].items() }
+        values.update({ f"v_{k}": v for k, v in self.v_values[index].items() })
+        values["h_invert"] = int(mode.h.invert_polarity)
+        values["v_invert"] = int(mode.v.invert_polarity)
+
+        word, shift = 0, 0
+        for name, width in self.rom_layout():
+            word |= values[name] << shift
+            shift += width
+        return word
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        entry = Record(self.rom_layout())
+        rom = Memory(width=len(entry), depth=len(self.modes),
+            init=[self.rom_entry(n) for n in range(len(self.modes))])
+        m.submodules.rom = rom_rd = rom.read_port(transparent=False)
+        m.d.comb += [
+            rom_rd.addr.eq(self.i_mode),
+            entry.eq(rom_rd.data),
+        ]
+
+        # Timing registers reset to the first mode
+        reset = self.rom_entry(0)
+        regs = Record(self.rom_layout())
+        shift = 0
+        for name, width in self.rom_layout():
+            regs[name].reset = reset >> shift & ((1 << width) - 1)
+            shift += width
+
+        h, v = self.o_h, self.o_v
+        h_end = h == regs.h_last
+        v_end = v == regs.v_last
+
+        m.d.sync += h.eq(h + 1)
+        with m.If(h_end):
+            m.d.sync += h.eq(0)
+            m.d.sync += v.eq(v + 1)
+            with m.If(v_end):
+                m.d.sync += [
+                    v.eq(0),
+                    regs.eq(entry),
+                    self.o_mode.eq(self.i_mode),
+                ]
+
+        m.d.comb += [
+            self.o_de.eq((h < regs.h_data) & (v < regs.v_data)),
+            self.o_hsync.eq(((h >= regs.h_front) & (h < regs.h_sync)) ^ regs.h_invert),
+            self.o_vsync.eq(((v >= regs.v_front) & (v < regs.v_sync)) ^ regs.v_invert),
+            self.o_frame.eq((h == 0) & (v == 0)),
+        ]
+
+        return m
+
+def reference_frame(mode: DVIMode) -> List[Tuple[int, int, int]]:
+    """`(de, hsync, vsync)` of every pixel of a frame in `mode`"""
+
+    h, v = axis_values(mode.h), axis_values(mode.v)
+    frame = []
+    for y in range(v["last"] + 1):
+        v_de = y < v["data"]
+        v_sn = (v["front"] <= y < v["sync"]) ^ mode.v.invert_polarity
+        for x in range(h["last"] + 1):
+            h_de = x < h["data"]
+            h_sn = (h["front"] <= x < h["sync"]) ^ mode.h.invert_polarity
+            frame.append((int(h_de and v_de), int(h_sn), int(v_sn)))
+    return frame
+
+def check_switching():
+    """Simulate `VideoTiming` switching between small modes"""
+    from nmigen.back.pysim import Simulator, Settle
+
+    modes = [
+        DVIMode(1.0, 60.0, DVITiming(3, 16, 2, 3, False), DVITiming(2, 12, 1, 2, True)),
+        DVIMode(1.0, 60.0, DVITiming(1, 24, 4, 2, True), DVITiming(3, 8, 2, 1, False)),
+        DVIMode(1.0, 60.0, DVITiming(2, 8, 1, 1, True), DVITiming(1, 20, 1, 3, True)),
+    ]
+    sequence = [0, 2, 1, 1, 0, 2]
+
+    dut = VideoTiming(modes)
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    frames = []
+    def process():
+        frame = None
+        index = 0
+        while len(frames) < len(sequence):
+            if index < len(sequence):
+                yield dut.i_mode.eq(sequence[index])
+            yield Settle()
+            if (yield dut.o_frame):
+                if frame is not None:
+                    frames.append(frame)
+                frame = ((yield dut.o_mode), [])
+                index += 1
+            if frame is not None:
+                frame[1].append(((yield dut.o_de), (yield dut.o_hsync), (yield dut.o_vsync)))
+            yield
+
+    sim.add_sync_process(process)
+    sim.run()
+
+    # Each mode is requested during the frame before the one using it
+    for n, (mode, frame) in enumerate(frames):
+        assert mode == sequence[n], f"Frame {n} is in mode {mode}, expected {sequence[n]}"
+        assert frame == reference_frame(modes[mode]), f"Frame {n} timing mismatch"
+
+@check()
+def switching(bld: Builder):
+    bld.python("sim", check_switching)
@@ -3,18 +3,38 @@ from nmigen.build import Platform
 from nmigen.back import rtlil
 from nmigen.asserts import Assert, Assume, Cover, AnyConst, AnySeq, Initial, Past
 from nmigen.cli import main_parser, main_runner
-from nmigen_boards.ulx3s import ULX3S_85F_Platform
-from blip import check, Builder
-from blip.task import sby
+from typing import Iterable, Callable
+from nmigen_boards.ulx3s import ULX3S_25F_Platform, ULX3S_85F_Platform
+from blip import check, sweep, Builder
+from blip.task import sby, contract
+from blip.rtl import arith
+from blip.rtl.arith import popcount_linear as popcount
+from blip.model.tmds import enc_chars, enc_biases
 
-def popcount(value):
-    result = Const(0, range(len(value)))
-    for bit in value:
-        result = result + bit
-    return result
+# Control characters indexed by `Cat(hsync, vsync)`
+ctl_chars = [0b1101010100, 0b0010101011, 0b0101010100, 0b1010101011]
 
 class TMDSEncoder(Elaboratable):
-    def __init__(self, pipeline:bool=False):
+    # Register cut points in pipeline order
+    cut_points = ["popcount", "xnor", "select", "output"]
+
+    def __init__(self, pipeline:bool=False, stages: Iterable[str]=(),
+            popcount: Callable[[Value], Value]=popcount):
+        """TMDS encoder for a single channel
+
+        pipeline: Register after the XOR/XNOR encoding, same as `stages=["xnor"]`
+        stages: Cut points to register at, any of `cut_points`:
+            "popcount": after the input popcount
+            "xnor": after the XOR/XNOR encoding and word bias count
+            "select": after choosing whether to invert the word
+            "output": on the output character
+        popcount: Popcount implementation, eg. from `blip.rtl.arith`
+
+        The output is delayed by `latency` cycles and `dc_bias` by
+        `bias_latency` cycles, the DC bias loop always closes within a
+        single cycle so "select" and "output" cuts don't delay it.
+        """
+
         self.i_data = Signal(8)
         self.i_en_data = Signal()
         self.i_hsync = Signal()
@@ -22,103 +42,275 @@ class TMDSEncoder(Elaboratable):
         self.o_char = Signal(10)
         self.dc_bias = Signal(4)
 
+        stages = set(stages)
+        if pipeline:
+            stages.add("xnor")
+        for stage in stages:
+            if stage not in self.cut_points:
+                raise ValueError(f"Unknown TMDSEncoder cut point: {stage}")
+
         self.pipeline = pipeline
+        self.stages = stages
+        self.popcount = popcount
+        self.latency = len(stages)
+        self.bias_latency = len(stages & {"popcount", "xnor"})
 
     def elaborate(self, platform):
         m = Module()
 
-        # Select between XOR and XNOR encoding based on input popcount
-        # to minimize transitions
-        i_pop = Signal(4)
-        use_xnor = Signal()
-        m.d.comb += [
-            i_pop.eq(popcount(self.i_data[1:8])),
-            use_xnor.eq(i_pop > 3),
-        ]
+        def cut(name, *values):
+            if name not in self.stages: return values
+            regs = [Signal.like(v, name=f"{v.name}_{name}") for v in values]
+            m.d.sync += [r.eq(v) for r, v in zip(regs, values)]
+            return regs
 
-        # Calculate XOR encoding serially with no dependency to `use_xnor`
-        xored = Signal(8)
-        m.d.comb += xored[0].eq(self.i_data[0])
-        for n in range(1, 8):
-            m.d.comb += xored[n].eq(self.i_data[n] ^ xored[n - 1])
-
-        # Transform XOR to XNOR encoding if `use_xnor` is true
-        xnored = Signal(8)
-        for n in range(0, 8):
-            if n % 2 == 1:
-                m.d.comb += xnored[n].eq(xored[n] ^ use_xnor)
-            else:
-                m.d.comb += xnored[n].eq(xored[n])
-
-        # Count the DC bias of the data word (-4 to +4)
-        x_bias = Signal(4)
-        m.d.comb += x_bias.eq(0b1100 + popcount(xnored)),
-
-        if self.pipeline:
-            xnored_prev = xnored
-            use_xnor_prev = use_xnor
-            x_bias_prev = x_bias
-            xnored = Signal(8, name="xnored_next")
-            use_xnor = Signal(1, name="use_xnor_next")
-            x_bias = Signal(4, name="x_bias_next")
-            en_data = Signal()
-            hsync = Signal()
-            vsync = Signal()
-            m.d.sync += [
-                xnored.eq(xnored_prev),
-                use_xnor.eq(use_xnor_prev),
-                x_bias.eq(x_bias_prev),
-                en_data.eq(self.i_en_data),
-                hsync.eq(self.i_hsync),
-                vsync.eq(self.i_vsync),
-            ]
-        else:
-            en_data = self.i_en_data
-            hsync = self.i_hsync
-            vsync = self.i_vsync
-
-        # Check if either the data word or current bias is zero,
-        # in which case it doesn't matter whether we invert the signal or not
-        zero_bias = Signal()
-        m.d.comb += zero_bias.eq((x_bias == 0) | (self.dc_bias == 0)),
-
-        # Check if the current and additional bias have the same sign
-        same_bias = Signal()
-        m.d.comb += same_bias.eq(x_bias[3] == self.dc_bias[3]),
-
-        # If we have zero current bias make sure `use_invert` is the same
-        # as `use_xnor` which will encode to either `0b01` or `0b10`. Otherwise
-        # make sure we reduce the current bias instead of increasing it.
-        use_invert = Signal()
-        m.d.comb += use_invert.eq(Mux(zero_bias, use_xnor, same_bias))
-
-        # Count the final DC bias in the output character including
-        # potential data inversion and the control bits
-        data_bias = Signal(4)
-        m.d.comb += data_bias.eq(Mux(use_invert, -x_bias, x_bias) + ~use_xnor + use_invert - 1)
-
-        # Select a fixed control character to use if necessary
-        ctl_char = Signal(10)
-        with m.Switch(Cat(hsync, vsync)):
-            with m.Case(0b00): m.d.comb += ctl_char.eq(0b1101010100)
-            with m.Case(0b01): m.d.comb += ctl_char.eq(0b0010101011)
-            with m.Case(0b10): m.d.comb += ctl_char.eq(0b0101010100)
-            with m.Case(0b11): m.d.comb += ctl_char.eq(0b1010101011)
-
-        # Output either a control character or inverted word
-        with m.If(en_data):
-            m.d.comb += [
-                self.o_char.eq(Cat(Mux(use_invert, ~xnored, xnored), ~use_xnor, use_invert)),
-            ]
-        with m.Else():
-            m.d.comb += [
-                self.o_char.eq(ctl_char),
-            ]
+        data = self.i_data
+        en_data = self.i_en_data
+        hsync = self.i_hsync
+        vsync = self.i_vsync
+
+        use_xnor = choose_xnor(m, data, popcount=self.popcount)
+
+        data, use_xnor, en_data, hsync, vsync = cut("popcount",
+            data, use_xnor, en_data, hsync, vsync)
+
+        xnored, use_xnor, x_bias = encode_xnor(m, data, use_xnor=use_xnor, popcount=self.popcount)
+
+        xnored, use_xnor, x_bias, en_data, hsync, vsync = cut("xnor",
+            xnored, use_xnor, x_bias, en_data, hsync, vsync)
+
+        char, data_bias = encode_select(m, xnored, use_xnor, x_bias,
+            self.dc_bias == 0, self.dc_bias[3])
 
         # Update DC bias every clock if data is enabled
         with m.If(en_data):
             m.d.sync += self.dc_bias.eq(self.dc_bias + data_bias)
 
+        char, en_data, hsync, vsync = cut("select", char, en_data, hsync, vsync)
+
+        # Output either a control character or the encoded word
+        out_char = Signal(10)
+        m.d.comb += out_char.eq(Mux(en_data, char, Array(ctl_chars)[Cat(hsync, vsync)]))
+
+        out_char, = cut("output", out_char)
+        m.d.comb += self.o_char.eq(out_char)
+
+        return m
+
+def signal_name(prefix: str, name: str) -> str:
+    return f"{prefix}_{name}" if prefix else name
+
+def choose_xnor(m: Module, data: Value, name: str="", popcount=popcount):
+    """Whether to use XNOR instead of XOR encoding for `data` to minimize transitions"""
+
+    use_xnor = Signal(name=signal_name(name, "use_xnor"))
+    m.d.comb += use_xnor.eq(popcount(data[1:8]) > 3)
+    return use_xnor
+
+def encode_xnor(m: Module, data: Value, name: str="", use_xnor: Value=None, popcount=popcount):
+    """Data dependent part of `TMDSEncoder`, returns `(xnored, use_xnor, x_bias)`
+
+    use_xnor: Result of `choose_xnor()` if already computed
+    """
+
+    if use_xnor is None:
+        use_xnor = choose_xnor(m, data, name, popcount)
+
+    # Calculate XOR encoding serially with no dependency to `use_xnor`
+    xored = Signal(8, name=signal_name(name, "xored"))
+    m.d.comb += xored[0].eq(data[0])
+    for n in range(1, 8):
+        m.d.comb += xored[n].eq(data[n] ^ xored[n - 1])
+
+    # Transform XOR to XNOR encoding if `use_xnor` is true
+    xnored = Signal(8, name=signal_name(name, "xnored"))
+    m.d.comb += xnored.eq(xored ^ Cat(*([C(0, 1), use_xnor] * 4)))
+
+    # Count the DC bias of the data word (-4 to +4)
+    x_bias = Signal(4, name=signal_name(name, "x_bias"))
+    m.d.comb += x_bias.eq(0b1100 + popcount(xnored))
+
+    return xnored, use_xnor, x_bias
+
+def encode_select(m: Module, xnored: Value, use_xnor: Value, x_bias: Value,
+        zero_dc_bias: Value, dc_sign: Value, name: str=""):
+    """Bias dependent part of `TMDSEncoder`, returns `(char, data_bias)`"""
+
+    # If either the data word or current bias is zero make sure `use_invert`
+    # is the same as `use_xnor` which will encode to either `0b01` or `0b10`.
+    # Otherwise make sure we reduce the current bias instead of increasing it.
+    use_invert = Signal(name=signal_name(name, "use_invert"))
+    m.d.comb += use_invert.eq(Mux((x_bias == 0) | zero_dc_bias, use_xnor, x_bias[3] == dc_sign))
+
+    # Count the final DC bias in the output character including
+    # potential data inversion and the control bits
+    char = Signal(10, name=signal_name(name, "char"))
+    data_bias = Signal(4, name=signal_name(name, "data_bias"))
+    m.d.comb += [
+        char.eq(Cat(Mux(use_invert, ~xnored, xnored), ~use_xnor, use_invert)),
+        data_bias.eq(Mux(use_invert, -x_bias, x_bias) + ~use_xnor + use_invert - 1),
+    ]
+    return char, data_bias
+
+class TMDSEncoderN(Elaboratable):
+    """Encode `n` consecutive pixels per clock like `n` steps of `TMDSEncoder`
+
+    Lane `k` of the inputs and `o_char` is the `k`th pixel in transmission
+    order, `dc_bias` is the bias before lane 0. By default the DC bias is
+    chained through the lanes combinationally.
+
+    With `speculate` every lane is encoded for zero, positive and negative
+    bias up front, giving its bias transfer function as a table of the next
+    bias for all 16 current biases. The tables are composed with a parallel
+    prefix scan that only depends on the data, so the bias before each lane
+    and the next `dc_bias` are a single table lookup from `dc_bias` instead
+    of `n` chained adders.
+    """
+
+    def __init__(self, n: int, speculate: bool=False):
+        self.n = n
+        self.speculate = speculate
+
+        self.i_data = Signal(8*n)
+        self.i_en_data = Signal(n)
+        self.i_hsync = Signal(n)
+        self.i_vsync = Signal(n)
+        self.o_char = Signal(10*n)
+        self.dc_bias = Signal(4)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        lanes = []
+        for k in range(self.n):
+            en_data = self.i_en_data[k]
+            ctl_char = Array(ctl_chars)[Cat(self.i_hsync[k], self.i_vsync[k])]
+            xnored = encode_xnor(m, self.i_data.word_select(k, 8), f"lane{k}")
+            lanes.append((en_data, ctl_char, xnored))
+
+        if self.speculate:
+            self.elaborate_speculate(m, lanes)
+            return m
+
+        dc_bias = self.dc_bias
+        for k, (en_data, ctl_char, xnored) in enumerate(lanes):
+            char, data_bias = encode_select(m, *xnored, dc_bias == 0, dc_bias[3], f"lane{k}")
+            m.d.comb += self.o_char.word_select(k, 10).eq(Mux(en_data, char, ctl_char))
+
+            next_bias = Signal(4, name=f"lane{k}_next_bias")
+            m.d.comb += next_bias.eq(Mux(en_data, dc_bias + data_bias, dc_bias))
+            dc_bias = next_bias
+
+        m.d.sync += self.dc_bias.eq(dc_bias)
+
+        return m
+
+    def elaborate_speculate(self, m: Module, lanes):
+        tables = []
+        chars = []
+        for k, (en_data, ctl_char, xnored) in enumerate(lanes):
+            zero = encode_select(m, *xnored, 1, 0, f"lane{k}_zero")
+            pos = encode_select(m, *xnored, 0, 0, f"lane{k}_pos")
+            neg = encode_select(m, *xnored, 0, 1, f"lane{k}_neg")
+            chars.append((en_data, ctl_char, zero[0], pos[0], neg[0]))
+
+            table = [Signal(4, name=f"lane{k}_next_{bias}") for bias in range(16)]
+            for bias, entry in enumerate(table):
+                data_bias = zero[1] if bias == 0 else neg[1] if bias & 0x8 else pos[1]
+                m.d.comb += entry.eq(Mux(en_data, bias + data_bias, bias))
+            tables.append(table)
+
+        # Kogge-Stone scan, `tables[k]` becomes the transfer function
+        # of lanes 0 to `k`
+        step = 1
+        while step < self.n:
+            scanned = tables[:step]
+            for k in range(step, self.n):
+                table = [Signal(4, name=f"scan{step}_lane{k}_next_{bias}") for bias in range(16)]
+                m.d.comb += [t.eq(Array(tables[k])[prev]) for t, prev in zip(table, tables[k - step])]
+                scanned.append(table)
+            tables = scanned
+            step *= 2
+
+        for k, (en_data, ctl_char, zero, pos, neg) in enumerate(chars):
+            dc_bias = self.dc_bias
+            if k > 0:
+                dc_bias = Signal(4, name=f"lane{k}_dc_bias")
+                m.d.comb += dc_bias.eq(Array(tables[k - 1])[self.dc_bias])
+            char = Mux(dc_bias == 0, zero, Mux(dc_bias[3], neg, pos))
+            m.d.comb += self.o_char.word_select(k, 10).eq(Mux(en_data, char, ctl_char))
+
+        m.d.sync += self.dc_bias.eq(Array(tables[-1])[self.dc_bias])
+
+def rom_entry(data: int, zero_bias: bool, negative_bias: bool) -> int:
+    """Character and DC bias change of `data` as `char | data_bias << 10`
+
+    zero_bias, negative_bias: Whether the current DC bias is zero or negative,
+    these are the only properties of the bias `TMDSEncoder` looks at.
+
+    The entry is taken from the tables of `blip.model.tmds` at a bias
+    with the same properties.
+    """
+
+    dc_bias = 0 if zero_bias else (0xf if negative_bias else 1)
+    char = int(enc_chars[data, dc_bias])
+    data_bias = int(enc_biases[data, dc_bias]) - dc_bias
+    return char | (data_bias & 0xf) << 10
+
+class TMDSRomEncoder(Elaboratable):
+    """Table driven drop-in replacement for `TMDSEncoder(pipeline=True)`
+
+    The character and DC bias change are looked up from a 1024x14 ROM
+    indexed by the data word and the sign/zero state of the current bias,
+    which infers a single DP16KD block RAM on ECP5. The synchronous read
+    gives the same one cycle latency as the pipelined encoder. The address
+    depends on the bias after the previous word so the loop goes through
+    the RAM output, an adder and the address input.
+    """
+
+    def __init__(self):
+        self.i_data = Signal(8)
+        self.i_en_data = Signal()
+        self.i_hsync = Signal()
+        self.i_vsync = Signal()
+        self.o_char = Signal(10)
+        self.dc_bias = Signal(4)
+
+        self.latency = 1
+        self.bias_latency = 1
+
+    def elaborate(self, platform):
+        m = Module()
+
+        rom = Memory(width=14, depth=1024, init=[
+            rom_entry(index & 0xff, bool(index & 0x100), bool(index & 0x200))
+            for index in range(1024)])
+        m.submodules.rom = rom_rd = rom.read_port(transparent=False)
+
+        en_data = Signal()
+        hsync = Signal()
+        vsync = Signal()
+        m.d.sync += [
+            en_data.eq(self.i_en_data),
+            hsync.eq(self.i_hsync),
+            vsync.eq(self.i_vsync),
+        ]
+
+        char = rom_rd.data[0:10]
+        data_bias = rom_rd.data[10:14]
+
+        # Bias after the word currently being output
+        next_bias = Signal(4)
+        m.d.comb += next_bias.eq(Mux(en_data, self.dc_bias + data_bias, self.dc_bias))
+        m.d.sync += self.dc_bias.eq(next_bias)
+
+        m.d.comb += rom_rd.addr.eq(Cat(self.i_data, next_bias == 0, next_bias[3]))
+
+        with m.If(en_data):
+            m.d.comb += self.o_char.eq(char)
+        with m.Else():
+            m.d.comb += self.o_char.eq(Array(ctl_chars)[Cat(hsync, vsync)])
+
         return m
 
 class TMDSDecoder(Elaboratable):
@@ -251,7 +443,13 @@ def build_formal(bld: Builder):
         il_text = rtlil.convert(m, ports=[enc_char, real_chr_bias, real_dc_bias])
         f.write(il_text)
 
-def build_formal_pipe(bld: Builder):
+def build_formal_pipe(bld: Builder, create_pipe=lambda: TMDSEncoder(pipeline=True)):
+    """Prove that a pipelined encoder matches `TMDSEncoder`
+
+    The encoder must have `latency` and `bias_latency` attributes like
+    `TMDSEncoder`. The reference sees the inputs delayed by `bias_latency`
+    and its characters are delayed for the rest of the latency."""
+
     m = Module()
 
     in_data = AnySeq(8)
@@ -263,7 +461,7 @@ def build_formal_pipe(bld: Builder):
     enc_char_pipe = Signal(10)
 
     m.submodules.enc_comb = enc_comb = TMDSEncoder(pipeline=False)
-    m.submodules.enc_pipe = enc_pipe = TMDSEncoder(pipeline=True)
+    m.submodules.enc_pipe = enc_pipe = create_pipe()
 
     m.d.comb += [
         enc_pipe.i_data.eq(in_data),
@@ -273,17 +471,37 @@ def build_formal_pipe(bld: Builder):
         enc_char_pipe.eq(enc_pipe.o_char),
     ]
 
-    m.d.sync += [
-        enc_comb.i_data.eq(in_data),
-        enc_comb.i_en_data.eq(en_data),
-        enc_comb.i_hsync.eq(hsync),
-        enc_comb.i_vsync.eq(vsync),
+    latency, bias_latency = enc_pipe.latency, enc_pipe.bias_latency
+
+    inputs = [in_data, en_data, hsync, vsync]
+    for n in range(bias_latency):
+        delayed = [Signal(len(v), name=f"{name}_d{n}")
+            for v, name in zip(inputs, ["data", "en_data", "hsync", "vsync"])]
+        m.d.sync += [d.eq(v) for d, v in zip(delayed, inputs)]
+        inputs = delayed
+
+    m.d.comb += [
+        enc_comb.i_data.eq(inputs[0]),
+        enc_comb.i_en_data.eq(inputs[1]),
+        enc_comb.i_hsync.eq(inputs[2]),
+        enc_comb.i_vsync.eq(inputs[3]),
     ]
+
+    char = enc_comb.o_char
+    for n in range(latency - bias_latency):
+        delayed = Signal(10, name=f"char_d{n}")
+        m.d.sync += delayed.eq(char)
+        char = delayed
     m.d.comb += [
-        enc_char_comb.eq(enc_comb.o_char),
+        enc_char_comb.eq(char),
     ]
 
-    with m.If(~Initial()):
+    # Skip the cycles before the first input reaches the output
+    warmup = Signal(range(latency + 1))
+    with m.If(warmup < latency):
+        m.d.sync += warmup.eq(warmup + 1)
+
+    with m.If(warmup == latency):
         m.d.comb += [
             Assert(enc_char_pipe == enc_char_comb),
             Assert(enc_pipe.dc_bias == enc_comb.dc_bias),
@@ -304,9 +522,66 @@ def prove(bld: Builder):
 def cover(bld: Builder):
     build_formal(bld)
     sby.verify(bld, "cover.sby", "formal.il",
-        sby.Task("sby_cover", "cover", depth=8, engines=["smtbmc", "yices"]),
+        sby.Task("sby_cover", "cover", depth=8, engines=["smtbmc", "yices"], escalate=[5]),
     )
 
+def build_formal_n(bld: Builder, n: int, speculate: bool):
+    """Prove that `TMDSEncoderN` matches `n` sequential steps of `TMDSEncoder`
+
+    The reference encoder takes one pixel per clock and the wide encoder is
+    enabled every `n`th clock with the last `n` pixels."""
+
+    m = Module()
+
+    in_data = AnySeq(8)
+    en_data = AnySeq(1)
+    hsync = AnySeq(1)
+    vsync = AnySeq(1)
+
+    m.submodules.ref = ref = TMDSEncoder()
+    m.d.comb += [
+        ref.i_data.eq(in_data),
+        ref.i_en_data.eq(en_data),
+        ref.i_hsync.eq(hsync),
+        ref.i_vsync.eq(vsync),
+    ]
+
+    phase = Signal(range(n))
+    last = Signal()
+    m.d.comb += last.eq(phase == n - 1)
+    m.d.sync += phase.eq(Mux(last, 0, phase + 1))
+
+    # Inputs and reference characters of the previous `n - 1` clocks
+    hist_data = Signal(8*(n-1))
+    hist_en_data = Signal(n-1)
+    hist_hsync = Signal(n-1)
+    hist_vsync = Signal(n-1)
+    hist_char = Signal(10*(n-1))
+    m.d.sync += [
+        hist_data.eq(Cat(hist_data[8:], in_data)),
+        hist_en_data.eq(Cat(hist_en_data[1:], en_data)),
+        hist_hsync.eq(Cat(hist_hsync[1:], hsync)),
+        hist_vsync.eq(Cat(hist_vsync[1:], vsync)),
+        hist_char.eq(Cat(hist_char[10:], ref.o_char)),
+    ]
+
+    m.submodules.wide = wide = EnableInserter(last)(TMDSEncoderN(n, speculate))
+    m.d.comb += [
+        wide.i_data.eq(Cat(hist_data, in_data)),
+        wide.i_en_data.eq(Cat(hist_en_data, en_data)),
+        wide.i_hsync.eq(Cat(hist_hsync, hsync)),
+        wide.i_vsync.eq(Cat(hist_vsync, vsync)),
+    ]
+
+    with m.If(last):
+        m.d.comb += Assert(wide.o_char == Cat(hist_char, ref.o_char))
+    with m.If(phase == 0):
+        m.d.comb += Assert(wide.dc_bias == ref.dc_bias)
+
+    with bld.temp_open("formal.il") as f:
+        il_text = rtlil.convert(m, ports=[wide.o_char, ref.o_char])
+        f.write(il_text)
+
 @check()
 def prove_pipe(bld: Builder):
     build_formal_pipe(bld)
@@ -314,9 +589,141 @@ def prove_pipe(bld: Builder):
         sby.Task("sby_prove_pipe", "prove", depth=3, engines=["smtbmc", "yices"]),
     )
 
+@sweep(n=[2, 4], speculate=[False, True])
+def prove_n(bld: Builder, n: int, speculate: bool):
+    build_formal_n(bld, n, speculate)
+    sby.verify(bld, "prove.sby", "formal.il",
+        sby.Task("sby_prove_n", "prove", depth=2*n+1, engines=["smtbmc", "yices"]),
+    )
+
+@sweep(stages={
+    "popcount": ["popcount"],
+    "select": ["select"],
+    "output": ["output"],
+    "xnor_select": ["xnor", "select"],
+    "all": TMDSEncoder.cut_points,
+})
+def prove_stages(bld: Builder, stages):
+    build_formal_pipe(bld, lambda: TMDSEncoder(stages=stages))
+    sby.verify(bld, "prove.sby", "formal.il",
+        sby.Task("sby_prove_stages", "prove", depth=len(stages) + 3, engines=["smtbmc", "yices"]),
+    )
+
+@check()
+def prove_rom(bld: Builder):
+    build_formal_pipe(bld, TMDSRomEncoder)
+    sby.verify(bld, "prove.sby", "formal.il",
+        sby.Task("sby_prove_rom", "prove", depth=3, engines=["smtbmc", "yices"]),
+    )
+
+
+def is_ctl_char(char):
+    return (char == ctl_chars[0]) | (char == ctl_chars[1]) | (char == ctl_chars[2]) | (char == ctl_chars[3])
+
+def decode_data_char(char):
+    """Reference decoding of a TMDS data character"""
+    inverted = Mux(char[9], ~char[:8], char[:8])
+    return Cat(inverted[0], *(inverted[n] ^ inverted[n - 1] ^ ~char[8] for n in range(1, 8)))
+
+def encoder_properties(m: Module, enc: TMDSEncoder, check):
+    # DC bias stays within +-5 and accumulates the bias of each data character
+    dc_bias = Signal(signed(4))
+    chr_bias = Signal(signed(5))
+    m.d.comb += [
+        dc_bias.eq(enc.dc_bias),
+        chr_bias.eq(popcount(enc.o_char) - 5),
+        check(dc_bias >= -5),
+        check(dc_bias <= +5),
+    ]
+    with m.If(Initial() | Past(ResetSignal())):
+        m.d.comb += check(enc.dc_bias == 0)
+    with m.Elif(Past(enc.i_en_data)):
+        m.d.comb += check(enc.dc_bias == (Past(enc.dc_bias) + Past(chr_bias))[:4])
+    with m.Else():
+        m.d.comb += check(enc.dc_bias == Past(enc.dc_bias))
+
+    # Data characters decode back to the input and can't be confused with
+    # control characters, otherwise we output the control character
+    with m.If(enc.i_en_data):
+        m.d.comb += [
+            check(~is_ctl_char(enc.o_char)),
+            check(decode_data_char(enc.o_char) == enc.i_data),
+        ]
+    with m.Else():
+        m.d.comb += check(enc.o_char == Array(ctl_chars)[Cat(enc.i_hsync, enc.i_vsync)])
+
+def decoder_properties(m: Module, dec: TMDSDecoder, check):
+    with m.If(is_ctl_char(dec.i_char)):
+        m.d.comb += [
+            check(~dec.o_en_data),
+            check(dec.i_char == Array(ctl_chars)[Cat(dec.o_hsync, dec.o_vsync)]),
+        ]
+    with m.Else():
+        m.d.comb += [
+            check(dec.o_en_data),
+            check(dec.o_data == decode_data_char(dec.i_char)),
+        ]
+
+encoder_contract = contract.Contract("tmds_encoder",
+    create=lambda: TMDSEncoder(),
+    inputs=lambda enc: [enc.i_data, enc.i_en_data, enc.i_hsync, enc.i_vsync],
+    outputs=lambda enc: [enc.o_char, enc.dc_bias],
+    properties=encoder_properties)
+
+decoder_contract = contract.Contract("tmds_decoder",
+    create=lambda: TMDSDecoder(),
+    inputs=lambda dec: [dec.i_char],
+    outputs=lambda dec: [dec.o_data, dec.o_en_data, dec.o_hsync, dec.o_vsync],
+    properties=decoder_properties)
+
+@check()
+def prove_contracts(bld: Builder):
+    contract.require(bld, encoder_contract, decoder_contract)
+
+@check()
+def prove_link(bld: Builder):
+    """Encoder to decoder round trip using only the proven contracts"""
+    m = Module()
+
+    in_data = AnySeq(8)
+    en_data = AnySeq(1)
+    hsync = AnySeq(1)
+    vsync = AnySeq(1)
+
+    enc = TMDSEncoder()
+    dec = TMDSDecoder()
+    m.submodules.enc = encoder_contract.abstract(enc)
+    m.submodules.dec = decoder_contract.abstract(dec)
+
+    m.d.comb += [
+        enc.i_data.eq(in_data),
+        enc.i_en_data.eq(en_data),
+        enc.i_hsync.eq(hsync),
+        enc.i_vsync.eq(vsync),
+        dec.i_char.eq(enc.o_char),
+    ]
+
+    m.d.comb += Assert(dec.o_en_data == enc.i_en_data)
+    with m.If(dec.o_en_data):
+        m.d.comb += Assert(dec.o_data == enc.i_data)
+    with m.Else():
+        m.d.comb += [
+            Assert(dec.o_hsync == enc.i_hsync),
+            Assert(dec.o_vsync == enc.i_vsync),
+        ]
+
+    with bld.temp_open("formal.il") as f:
+        il_text = rtlil.convert(m, ports=[enc.o_char, enc.dc_bias])
+        f.write(il_text)
+
+    sby.verify(bld, "prove.sby", "formal.il",
+        sby.Task("sby_prove", "prove", depth=3, engines=["smtbmc", "yices"]),
+        deps=contract.require(bld, encoder_contract, decoder_contract),
+    )
+
 class SynthTop(Elaboratable):
-    def __init__(self, pipeline: bool):
-        self.pipeline = pipeline
+    def __init__(self, create_encoder):
+        self.create_encoder = create_encoder
 
     def elaborate(self, platform: Platform) -> Module:
         m = Module()
@@ -324,7 +731,7 @@ class SynthTop(Elaboratable):
         shift_in = Signal(8)
         shift_out = Signal(11, reset=1)
 
-        m.submodules.enc = enc = TMDSEncoder(pipeline=self.pipeline)
+        m.submodules.enc = enc = self.create_encoder()
 
         dummy_in = platform.request("button_fire")
         dummy_out = platform.request("led")
@@ -344,15 +751,17 @@ class SynthTop(Elaboratable):
 
         return m
 
-@check()
-def synth(bld: Builder):
-    platform = ULX3S_85F_Platform()
-    plan = platform.build(SynthTop(pipeline=False), do_build=False)
-    bld.exec_plan("synth", plan)
-
-@check()
-def synth_pipe(bld: Builder):
-    platform = ULX3S_85F_Platform()
-    plan = platform.build(SynthTop(pipeline=True), do_build=False)
-    bld.exec_plan("synth", plan)
+@sweep(
+    encoder={
+        "comb": lambda: TMDSEncoder(pipeline=False),
+        "pipeline": lambda: TMDSEncoder(pipeline=True),
+        "stages4": lambda: TMDSEncoder(stages=TMDSEncoder.cut_points),
+        "lut4": lambda: TMDSEncoder(popcount=arith.popcount_lut4),
+        "rom": TMDSRomEncoder,
+    },
+    device={"25F": ULX3S_25F_Platform, "85F": ULX3S_85F_Platform},
+    retime=[False, True])
+def synth(bld: Builder, encoder, device, retime: bool):
+    platform = device()
+    bld.build("synth", platform, SynthTop(encoder), synth_opts="-retime" if retime else "")
 
@@ -0,0 +1,336 @@
+from nmigen import *
+from nmigen.build import Platform
+from dataclasses import dataclass, field
+from itertools import product
+from typing import Dict, List, Optional, Tuple, Union, Iterable
+from blip import check, Builder
+from blip.rtl.pll import PllClock
+from blip.rtl.ecp5.pll import Ecp5Pll, Config, find_config, clko_hzs, MHz
+from blip.rtl.ecp5.io import Ecp5ClockDiv, Ecp5EdgeClockSync, clkdivf_divs
+
+@dataclass
+class ClockRequest:
+    """Requested clock domain
+
+    name: Name of the clock domain
+    frequency: Frequency in Hz, unused with `ratio`
+    tolerance: Maximum relative error, either a single value or (-, +),
+        domains with a `ratio` use the tolerance of the domain they derive from
+    error_weight: Weight of the error relative to other clocks
+    phase: Phase offset in degrees relative to the other outputs of the PLL
+    ratio: `(domain, factor)` to run at exactly `factor` times `domain`
+    edge: Edge clock routed through ECLKSYNCB, eg. for ODDRX2F
+    """
+
+    name: str
+    frequency: float = 0.0
+    tolerance: Union[float, Tuple[float, float]] = 0.001
+    error_weight: float = 1.0
+    phase: float = 0.0
+    ratio: Optional[Tuple[str, float]] = None
+    edge: bool = False
+
+@dataclass
+class PllPlan:
+    """PLL of a `ClockPlan`
+
+    source: Index of the PLL whose first output is the input, None for the
+        reference clock
+    domains: Domain of each output, None for a helper clock
+    """
+
+    source: Optional[int]
+    domains: List[Optional[str]]
+    clkos: List[PllClock]
+    feedback: Optional[int]
+    config: Config
+
+@dataclass
+class ClockPlan:
+    """Clock network found by `plan_clocks()`
+
+    dividers: CLKDIVF domains as `(edge domain, divisor)`
+    edges: Domains routed through ECLKSYNCB
+    frequencies: Resulting frequency of every domain
+    error: Total weighted squared error of all PLLs
+    """
+
+    ref_hz: float
+    plls: List[PllPlan]
+    dividers: Dict[str, Tuple[str, float]] = field(default_factory=dict)
+    edges: List[str] = field(default_factory=list)
+    frequencies: Dict[str, float] = field(default_factory=dict)
+    error: float = 0.0
+
+    def input_hz(self, index: int) -> float:
+        source = self.plls[index].source
+        if source is None:
+            return self.ref_hz
+        return self.plls[source].config.clko_hzs[0]
+
+def ratio_root(by_name: Dict[str, ClockRequest], name: str) -> str:
+    """Domain without a `ratio` that `name` is derived from"""
+    r = by_name[name]
+    return ratio_root(by_name, r.ratio[0]) if r.ratio else name
+
+def resolve_requests(requests: List[ClockRequest]) -> Tuple[Dict[str, float], Dict[str, Tuple[str, float]], List[List[str]]]:
+    """Target frequencies, CLKDIVF domains and groups of PLL outputs sharing a PLL"""
+
+    by_name = { r.name: r for r in requests }
+    if len(by_name) != len(requests):
+        raise ValueError("Duplicate clock domain names")
+
+    targets = {}
+    def target(name: str, seen: Tuple[str, ...]=()) -> float:
+        if name in seen:
+            raise ValueError(f"Circular clock ratio: {' -> '.join(seen + (name,))}")
+        if name not in by_name:
+            raise ValueError(f"Unknown clock domain: {name}")
+        if name not in targets:
+            r = by_name[name]
+            targets[name] = target(r.ratio[0], seen + (name,)) * r.ratio[1] if r.ratio else r.frequency
+        return targets[name]
+
+    dividers = {}
+    for r in requests:
+        target(r.name)
+        if r.ratio and not r.edge and by_name[r.ratio[0]].edge and 1.0 / r.ratio[1] in clkdivf_divs:
+            dividers[r.name] = (r.ratio[0], 1.0 / r.ratio[1])
+
+    # Domains related by a ratio must come from the same PLL
+    groups = {}
+    for r in requests:
+        if r.name in dividers: continue
+        if r.ratio and r.ratio[0] in dividers:
+            raise ValueError(f"{r.name} can't be derived from the divided clock {r.ratio[0]}")
+        groups.setdefault(ratio_root(by_name, r.name), []).append(r.name)
+
+    for name in targets:
+        if name not in dividers and targets[name] not in clko_hzs:
+            raise ValueError(f"Bad frequency for {name}: {targets[name]}")
+
+    return targets, dividers, list(groups.values())
+
+def solve_pll(input_hz: float, clkos: List[PllClock], domains: List[Optional[str]],
+        ratios: List[Tuple[str, str, float]]) -> Optional[Tuple[Config, Optional[int]]]:
+    """Configuration satisfying the exact `(domain, other, factor)` ratios"""
+
+    if len(clkos) > 4:
+        return None
+
+    index = { d: n for n, d in enumerate(domains) if d is not None }
+    ratios = [(index[name], index[other], factor) for name, other, factor in ratios]
+    for feedback in ([None] if len(clkos) <= 3 else []) + [0]:
+        config = find_config(input_hz, clkos, feedback, ratios)
+        if config:
+            return config, feedback
+    return None
+
+def plan_clocks(ref_hz: float, requests: Iterable[ClockRequest],
+        helper_hzs: Iterable[float]=(100*MHz,)) -> ClockPlan:
+    """Find the PLLs, edge clock buffers and dividers producing `requests`
+
+    A single PLL is preferred, otherwise a PLL producing a helper clock and
+    some of the domains is cascaded with a second one producing the rest,
+    like in `blip.test.dvi_demo_720p`. Domains with a `ratio` of 1/2, 1/3.5,
+    1/4 or 1/5 to an edge clock are divided from it with CLKDIVF, other
+    ratios are exact divisors of the same PLL. Of the options with the
+    fewest PLLs the one with the lowest error wins."""
+
+    requests = list(requests)
+    by_name = { r.name: r for r in requests }
+    targets, dividers, groups = resolve_requests(requests)
+
+    # A ratio domain has the same relative error as its root
+    def pll_clock(name: str) -> PllClock:
+        r = by_name[name]
+        tolerance = by_name[ratio_root(by_name, name)].tolerance
+        return PllClock(targets[name], tolerance, r.error_weight, r.phase)
+
+    def group_ratios(names: List[str]) -> List[Tuple[str, str, float]]:
+        return [(n, by_name[n].ratio[0], by_name[n].ratio[1]) for n in names if by_name[n].ratio]
+
+    options = []
+
+    # All domains from a single PLL
+    names = [n for g in groups for n in g]
+    result = solve_pll(ref_hz, [pll_clock(n) for n in names], names, group_ratios(names))
+    if result:
+        config, feedback = result
+        options.append([PllPlan(None, names, [pll_clock(n) for n in names], feedback, config)])
+
+    # Cascade of two PLLs through a helper clock
+    if not options:
+        for helper_hz, split in product(helper_hzs, product([0, 1], repeat=len(groups))):
+            first = [n for g, s in zip(groups, split) if s == 0 for n in g]
+            second = [n for g, s in zip(groups, split) if s == 1 for n in g]
+            if not second: continue
+
+            helper = PllClock(helper_hz, error_weight=10.0)
+            a = solve_pll(ref_hz, [helper] + [pll_clock(n) for n in first],
+                [None] + first, group_ratios(first))
+            if not a: continue
+            b = solve_pll(a[0].clko_hzs[0], [pll_clock(n) for n in second],
+                second, group_ratios(second))
+            if not b: continue
+
+            options.append([
+                PllPlan(None, [None] + first, [helper] + [pll_clock(n) for n in first], a[1], a[0]),
+                PllPlan(0, second, [pll_clock(n) for n in second], b[1], b[0]),
+            ])
+
+    if not options:
+        raise ValueError("Could not find a clock network for the requested domains")
+
+    plls = min(options, key=lambda plls: sum(p.config.error for p in plls))
+    plan = ClockPlan(ref_hz, plls, dividers,
+        edges=[r.name for r in requests if r.edge],
+        error=sum(p.config.error for p in plls))
+    for pll in plls:
+        for name, hz in zip(pll.domains, pll.config.clko_hzs):
+            if name is not None:
+                plan.frequencies[name] = hz
+    for name, (edge, div) in dividers.items():
+        plan.frequencies[name] = plan.frequencies[edge] / div
+    plan.frequencies = { r.name: plan.frequencies[r.name] for r in requests }
+    return plan
+
+def plan_table(plan: ClockPlan) -> List[List[str]]:
+    rows = [["domain", "target", "actual", "source"]]
+    for index, pll in enumerate(plan.plls):
+        for n, name in enumerate(pll.domains):
+            rows.append([
+                name or f"pll{index}_helper",
+                f"{pll.clkos[n].frequency / MHz:.3f}MHz",
+                f"{pll.config.clko_hzs[n] / MHz:.3f}MHz",
+                f"pll{index}.o_clk[{n}]" + (" ECLKSYNCB" if name in plan.edges else ""),
+            ])
+    for name, (edge, div) in plan.dividers.items():
+        rows.append([name, "", f"{plan.frequencies[name] / MHz:.3f}MHz", f"{edge} CLKDIVF/{div}"])
+    return rows
+
+class Ecp5Clocking(Elaboratable):
+    def __init__(self, plan: ClockPlan):
+        """Clock domains of a `ClockPlan`
+
+        Creates the PLLs, ECLKSYNCB edge clock buffers and CLKDIVF dividers
+        with their clock constraints, and a `ClockDomain` for every
+        requested domain.
+
+        i_clk: Reference clock at `plan.ref_hz`
+        o_locked: All PLLs are locked
+        """
+
+        self.plan = plan
+        self.i_clk = Signal()
+        self.o_locked = Signal()
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        plan = self.plan
+
+        plls = []
+        sources = {}
+        for index, pll_plan in enumerate(plan.plls):
+            pll = Ecp5Pll(plan.input_hz(index), pll_plan.clkos, pll_plan.feedback, pll_plan.config)
+            m.submodules[f"pll{index}"] = pll
+            plls.append(pll)
+            if pll_plan.source is None:
+                m.d.comb += pll.i_clk.eq(self.i_clk)
+            else:
+                m.d.comb += pll.i_clk.eq(plls[pll_plan.source].o_clk[0])
+            for name, o_clk in zip(pll_plan.domains, pll.o_clk):
+                if name is not None:
+                    sources[name] = o_clk
+
+        for name in plan.edges:
+            esync = Ecp5EdgeClockSync(plan.frequencies[name])
+            m.submodules[f"esync_{name}"] = esync
+            m.d.comb += esync.i.eq(sources[name])
+            sources[name] = esync.o
+
+        for name, (edge, div) in plan.dividers.items():
+            clkdiv = Ecp5ClockDiv(plan.frequencies[edge], div)
+            m.submodules[f"div_{name}"] = clkdiv
+            m.d.comb += clkdiv.i.eq(sources[edge])
+            sources[name] = clkdiv.o
+
+        for name in plan.frequencies:
+            m.domains += ClockDomain(name)
+            m.d.comb += ClockSignal(name).eq(sources[name])
+
+        m.d.comb += self.o_locked.eq(Cat(pll.o_locked for pll in plls).all())
+
+        return m
+
+def check_plans():
+    from blip.util.dvi_timing import get_dvi_mode_cvt_rb
+
+    # `blip.test.dvi_demo_720p` needs a cascade for an accurate TMDS clock
+    mode = get_dvi_mode_cvt_rb(1280, 720)
+    plan = plan_clocks(25*MHz, [
+        ClockRequest("pixel", mode.pixel_clock, tolerance=(1e-20, 0.1)),
+        ClockRequest("tmds_eclk", mode.pixel_clock * 5, edge=True),
+        ClockRequest("tmds_sclk", ratio=("tmds_eclk", 0.5)),
+    ])
+    assert len(plan.plls) == 2
+    assert plan.plls[1].source == 0 and plan.plls[1].domains == ["tmds_eclk"]
+    assert plan.dividers == { "tmds_sclk": ("tmds_eclk", 2.0) }
+    assert plan.edges == ["tmds_eclk"]
+    assert abs(plan.frequencies["tmds_eclk"] / (mode.pixel_clock * 5) - 1.0) <= 0.001
+    assert plan.frequencies["tmds_sclk"] == plan.frequencies["tmds_eclk"] / 2
+
+    # Exact ratio from a single PLL like `blip.test.dvi_demo` with `cdc="ratio"`
+    plan = plan_clocks(25*MHz, [
+        ClockRequest("tmds_2bit", 250*MHz, tolerance=0.01),
+        ClockRequest("pixel", ratio=("tmds_2bit", 0.2)),
+    ])
+    assert len(plan.plls) == 1
+    divs = plan.plls[0].config.clko_divs
+    assert divs[1] == divs[0] * 5
+    assert plan.frequencies["pixel"] * 5 == plan.frequencies["tmds_2bit"]
+
+    # A ratio domain carries the error of its root, 720p TMDS is 1% off
+    plan = plan_clocks(25*MHz, [
+        ClockRequest("tmds", mode.pixel_clock * 5, tolerance=0.01),
+        ClockRequest("pixel", ratio=("tmds", 0.2)),
+    ])
+    assert len(plan.plls) == 1
+    divs = plan.plls[0].config.clko_divs
+    assert divs[1] == divs[0] * 5
+    assert plan.frequencies["pixel"] * 5 == plan.frequencies["tmds"]
+    assert abs(plan.frequencies["pixel"] / mode.pixel_clock - 1.0) <= 0.01
+
+    # The first PLL of a cascade may only make the helper clock
+    for pixel_hz in [25.175*MHz, 74.25*MHz]:
+        plan = plan_clocks(25*MHz, [
+            ClockRequest("pixel", pixel_hz, tolerance=0.005),
+            ClockRequest("tmds", ratio=("pixel", 5.0)),
+        ])
+        divs = plan.plls[-1].config.clko_divs
+        assert plan.plls[-1].domains == ["pixel", "tmds"]
+        assert divs[0] == divs[1] * 5
+        assert abs(plan.frequencies["tmds"] / (plan.frequencies["pixel"] * 5) - 1.0) <= 1e-12
+        assert abs(plan.frequencies["pixel"] / pixel_hz - 1.0) <= 0.005
+
+    # Four outputs free CLKOS3 by feeding back through the first one
+    plan = plan_clocks(25*MHz, [
+        ClockRequest("a", 100*MHz), ClockRequest("b", 100*MHz, phase=90.0),
+        ClockRequest("c", 50*MHz), ClockRequest("d", 25*MHz),
+    ])
+    assert len(plan.plls) == 1 and plan.plls[0].feedback == 0
+
+    for requests in [
+        [ClockRequest("a", ratio=("b", 2.0)), ClockRequest("b", ratio=("a", 0.5))],
+        [ClockRequest("a", 50*MHz), ClockRequest("a", 60*MHz)],
+        [ClockRequest("a", 1*MHz)],
+    ]:
+        try:
+            plan_clocks(25*MHz, requests)
+            assert False, f"Expected {requests} to fail"
+        except ValueError:
+            pass
+
+@check()
+def plans(bld: Builder):
+    bld.python("search", check_plans)
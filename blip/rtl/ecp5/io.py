@@ -12,6 +12,14 @@ class Ecp5OutDdr2(Elaboratable):
     def elaborate(self, platform):
         m = Module()
 
+        # Behavioral model for simulation: `i[0]` is output while the
+        # clock is high and `i[1]` while it's low
+        if platform is None:
+            r = Signal(2)
+            m.d.sync += r.eq(self.i)
+            m.d.comb += self.o.eq(Mux(ClockSignal(), r[0], r[1]))
+            return m
+
         m.submodules.oddrx1f = Instance("ODDRX1F",
             i_SCLK=ClockSignal(),
             i_RST=0,
@@ -32,6 +40,18 @@ class Ecp5OutDdr4(Elaboratable):
     def elaborate(self, platform):
         m = Module()
 
+        # Behavioral model for simulation, assumes that `eclk` runs at
+        # twice the frequency of `sclk` with rising edges aligned
+        if platform is None:
+            r = Signal(4)
+            m.domains.ddr_s = ClockDomain("ddr_s", local=True)
+            m.d.comb += ClockSignal("ddr_s").eq(self.sclk)
+            m.d.ddr_s += r.eq(self.i)
+            m.d.comb += self.o.eq(Mux(self.sclk,
+                Mux(self.eclk, r[0], r[1]),
+                Mux(self.eclk, r[2], r[3])))
+            return m
+
         m.submodules.oddrx2f = Instance("ODDRX2F",
             i_SCLK=self.sclk,
             i_ECLK=self.eclk,
@@ -45,18 +65,99 @@ class Ecp5OutDdr4(Elaboratable):
 
         return m
 
-class Ecp5ClockDiv2(Elaboratable):
-    def __init__(self, hz):
+class Ecp5OutDdr7(Elaboratable):
+    def __init__(self):
+        self.i = Signal(7)
+        self.sclk = Signal()
+        self.eclk = Signal()
+        self.o = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        # Behavioral model for simulation, assumes that `eclk` runs at 3.5
+        # times the frequency of `sclk` with edges aligned. Every `eclk` half
+        # period outputs the next bit starting from `i[0]` after `sclk` rises.
+        if platform is None:
+            r = Signal(7)
+            toggle = Signal()
+            m.domains.ddr_s = ClockDomain("ddr_s", local=True)
+            m.d.comb += ClockSignal("ddr_s").eq(self.sclk)
+            m.d.ddr_s += [
+                r.eq(self.i),
+                toggle.eq(~toggle),
+            ]
+
+            # Half period index and last seen `toggle` of both `eclk` edges,
+            # a new `sclk` cycle is detected by `toggle` changing
+            ix_p, ix_n = Signal(range(8)), Signal(range(8))
+            seen_p, seen_n = Signal(), Signal()
+            m.domains.ddr_p = ClockDomain("ddr_p", local=True)
+            m.domains.ddr_n = ClockDomain("ddr_n", local=True, clk_edge="neg")
+            m.d.comb += [
+                ClockSignal("ddr_p").eq(self.eclk),
+                ClockSignal("ddr_n").eq(self.eclk),
+            ]
+
+            ix_pc = Mux(toggle != seen_p, 0, ix_p)
+            ix_nc = Mux(toggle != seen_n, 0, ix_n)
+            m.d.ddr_p += [ix_p.eq(ix_nc + 1), seen_p.eq(toggle)]
+            m.d.ddr_n += [ix_n.eq(ix_pc + 1), seen_n.eq(toggle)]
+            m.d.comb += self.o.eq(r.bit_select(Mux(self.eclk, ix_pc, ix_nc), 1))
+            return m
+
+        m.submodules.oddr71b = Instance("ODDR71B",
+            i_SCLK=self.sclk,
+            i_ECLK=self.eclk,
+            i_RST=0,
+            **{ f"i_D{n}": self.i[n] for n in range(7) },
+            o_Q=self.o,
+        )
+
+        return m
+
+# Division ratios supported by CLKDIVF
+clkdivf_divs = [2.0, 3.5, 4.0, 5.0]
+
+class Ecp5ClockDiv(Elaboratable):
+    def __init__(self, hz, div: float=2.0):
+        """Divide an edge clock by `div` (2.0, 3.5, 4.0 or 5.0) using CLKDIVF"""
+        if div not in clkdivf_divs:
+            raise ValueError(f"Unsupported CLKDIVF division: {div}")
         self.i = Signal()
         self.o = Signal()
-        self.hz = hz // 2
+        self.div = div
+        self.hz = hz / div
 
     def elaborate(self, platform):
         m = Module()
 
+        # Behavioral model for simulation: counts the `2*div` half periods of
+        # the output starting from a rising edge of `i`. The output is the XOR
+        # of a register per edge so it never glitches.
+        if platform is None:
+            halves = int(2 * self.div)
+            count_p = Signal(range(halves), reset=halves - 1)
+            count_n = Signal(range(halves), reset=halves - 1)
+            o_p, o_n = Signal(), Signal()
+            m.domains.div_p = ClockDomain("div_p", local=True, reset_less=True)
+            m.domains.div_n = ClockDomain("div_n", local=True, reset_less=True, clk_edge="neg")
+            m.d.comb += [
+                ClockSignal("div_p").eq(self.i),
+                ClockSignal("div_n").eq(self.i),
+            ]
+
+            next_p = Mux(count_n == halves - 1, 0, count_n + 1)
+            next_n = Mux(count_p == halves - 1, 0, count_p + 1)
+            m.d.div_p += [count_p.eq(next_p), o_p.eq((next_p < (halves + 1) // 2) ^ o_n)]
+            m.d.div_n += [count_n.eq(next_n), o_n.eq((next_n < (halves + 1) // 2) ^ o_p)]
+            m.d.comb += self.o.eq(o_p ^ o_n)
+            return m
+
         platform.add_clock_constraint(self.o, self.hz)
 
         m.submodules.clkdivf = Instance("CLKDIVF",
+            p_DIV=f"{self.div:.1f}",
             i_CLKI=self.i,
             i_RST=0,
             o_CDIVX=self.o,
@@ -64,6 +165,10 @@ class Ecp5ClockDiv2(Elaboratable):
 
         return m
 
+class Ecp5ClockDiv2(Ecp5ClockDiv):
+    def __init__(self, hz):
+        super().__init__(hz, 2.0)
+
 class Ecp5EdgeClockSync(Elaboratable):
     def __init__(self, hz):
         self.i = Signal()
@@ -73,6 +178,10 @@ class Ecp5EdgeClockSync(Elaboratable):
     def elaborate(self, platform):
         m = Module()
 
+        if platform is None:
+            m.d.comb += self.o.eq(self.i)
+            return m
+
         platform.add_clock_constraint(self.o, self.hz)
 
         m.submodules.eclksyncb = Instance("ECLKSYNCB",
@@ -83,6 +192,70 @@ class Ecp5EdgeClockSync(Elaboratable):
 
         return m
 
+class Ecp5ClockSelect(Elaboratable):
+    def __init__(self):
+        """Glitchless switch between two primary clocks using DCSC
+
+        `o` follows `i0` or `i1` depending on `sel`, the switch happens at
+        a low level of both clocks."""
+        self.i0 = Signal()
+        self.i1 = Signal()
+        self.sel = Signal()
+        self.o = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        if platform is None:
+            m.d.comb += self.o.eq(Mux(self.sel, self.i1, self.i0))
+            return m
+
+        m.submodules.dcsc = Instance("DCSC",
+            p_DCSMODE="POS",
+            i_CLK0=self.i0,
+            i_CLK1=self.i1,
+            i_SEL0=self.sel,
+            i_SEL1=0,
+            i_MODESEL=0,
+            o_DCSOUT=self.o,
+        )
+
+        return m
+
+def check_clock_div(div: float, periods: int=20):
+    """Simulate the `Ecp5ClockDiv` model and check that the output rises
+    with the first rising input edge and every `div` input periods after"""
+    from nmigen.back.pysim import Simulator, Delay
+
+    dut = Ecp5ClockDiv(1e6, div)
+    m = Module()
+    m.submodules.div = dut
+    m.d.comb += dut.i.eq(ClockSignal())
+    sim = Simulator(m)
+    period = 1e-6
+    sim.add_clock(period)
+
+    # Sample in the middle of every input half period
+    samples = []
+    def process():
+        yield Delay(period * 3 / 4)
+        for _ in range(int(2 * div * periods)):
+            samples.append((yield dut.o))
+            yield Delay(period / 2)
+
+    sim.add_process(process)
+    sim.run()
+
+    rises = [0] + [n for n in range(1, len(samples)) if samples[n] and not samples[n - 1]]
+    assert samples[0], f"DIV={div}: output not aligned to the input"
+    assert all(b - a == 2 * div for a, b in zip(rises, rises[1:])), f"DIV={div}: bad period {rises}"
+    assert len(rises) >= periods - 1
+
+@check()
+def clock_div(bld: Builder):
+    for div in clkdivf_divs:
+        bld.python(f"sim_{div}", check_clock_div, div)
+
 @check()
 def mega_blinky(bld: Builder):
     platform = ULX3S_85F_Platform()
@@ -99,8 +272,7 @@ def mega_blinky(bld: Builder):
 
             return m
 
-    plan = platform.build(Top(), do_build=False)
-    bld.exec_plan("synth", plan)
+    bld.build("synth", platform, Top())
 
 @check()
 def giga_blinky(bld: Builder):
@@ -139,5 +311,4 @@ def giga_blinky(bld: Builder):
 
             return m
 
-    plan = platform.build(Top(), do_build=False)
-    bld.exec_plan("synth", plan)
+    bld.build("synth", platform, Top())
@@ -3,9 +3,16 @@ from nmigen.build import Platform
 from nmigen_boards.ulx3s import ULX3S_85F_Platform
 from blip import check, Builder
 from blip.rtl.pll import PllClock
-from typing import Union, Iterable
+from blip.build import Cache
+from typing import Union, Iterable, Optional, Tuple
 from itertools import product
 from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+import hashlib
+import tempfile
+import json
+import os
 
 MHz = 1e6
 
@@ -25,15 +32,19 @@ fb_hzs   = FloatRange( 10.000*MHz, 400.000*MHz)
 ref_divs = range(1, 128 + 1)
 fb_divs  = range(1, 128 + 1)
 
-clko_names = ["CLKOP", "CLKOS", "CLKOS2"]
+clko_names = ["CLKOP", "CLKOS", "CLKOS2", "CLKOS3"]
+feedback_paths = ["INT_OP", "INT_OS", "INT_OS2", "INT_OS3"]
 
-Config = namedtuple("Config", "error ref_div fb_div clko_divs clko_hzs")
+# PHASESEL values selecting each output for dynamic phase steps
+phase_sel_codes = {"CLKOS": 0, "CLKOS2": 1, "CLKOS3": 2, "CLKOP": 3}
 
-def find_config(ref_hz: float, clkos: Iterable[PllClock]):
-    """Find PLL configuration for ECP5
+# Phase offsets are set in steps of 1/8 VCO cycles
+phase_steps_per_vco = 8
 
-    See documentation on Ecp5Pll for more information.
-    """
+Config = namedtuple("Config", "error ref_div fb_div clko_divs clko_hzs")
+
+def find_config_reference(ref_hz: float, clkos: Iterable[PllClock]):
+    """Brute force version of `find_config()` kept as a reference"""
 
     # Iterate all possible reference and feedback divisor
     # values to find the optimal configuration
@@ -72,19 +83,236 @@ def find_config(ref_hz: float, clkos: Iterable[PllClock]):
         else:
             # Select this config if the error (or divisors if equal) is
             # lower than the previously found best one
-            config = Config(error, ref_div, fb_div, clk_divs, clk_hzs)
+            config = Config(error, ref_div, fb_div, tuple(clk_divs), tuple(clk_hzs))
             if not best_config or config < best_config:
                 best_config = config
     
     return best_config
 
+def legal_pairs(ref_hz: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """`(ref_div, fb_div, fb_out_div, vco_hz)` arrays of the legal divisor pairs in search order
+
+    The divisor ranges are solved from the PD and VCO limits with a margin
+    of one and then filtered with the exact same comparisons as the brute
+    force search so rounding at the limits can't change the result. The
+    feedback goes through CLKOS3 with divisor 1, so `fb_out_div` is 1."""
+
+    ref_lo = max(int(ref_hz / fb_hzs.hi) - 1, ref_divs.start)
+    ref_hi = min(int(ref_hz / fb_hzs.lo) + 1, ref_divs.stop - 1)
+    pairs = []
+    for ref_div in range(ref_lo, ref_hi + 1):
+        fb_hz = ref_hz / ref_div
+        if fb_hz not in fb_hzs: continue
+        fb_lo = max(int(vco_hzs.lo / fb_hz) - 1, fb_divs.start)
+        fb_hi = min(int(vco_hzs.hi / fb_hz) + 1, fb_divs.stop - 1)
+        for fb_div in range(fb_lo, fb_hi + 1):
+            if fb_hz * fb_div in vco_hzs:
+                pairs.append((ref_div, fb_div))
+
+    ref_div = np.array([p[0] for p in pairs], dtype=np.int64)
+    fb_div = np.array([p[1] for p in pairs], dtype=np.int64)
+    vco_hz = (ref_hz / ref_div) * fb_div
+    return ref_div, fb_div, np.ones_like(fb_div), vco_hz
+
+def legal_feedback_triples(ref_hz: float, clko: PllClock) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Like `legal_pairs()` with the feedback going through the output `clko`
+
+    The output runs at `ref_hz / ref_div * fb_div` and the VCO at
+    `fb_out_div` times that. Only feedback divisors putting the output
+    close to its tolerance are kept, which leaves a few candidates per
+    reference divisor instead of all of them."""
+
+    out_lo = clko.frequency * (1.0 + clko.tolerance_below())
+    out_hi = clko.frequency * (1.0 + clko.tolerance_above())
+    ref_lo = max(int(ref_hz / fb_hzs.hi) - 1, ref_divs.start)
+    ref_hi = min(int(ref_hz / fb_hzs.lo) + 1, ref_divs.stop - 1)
+    triples = []
+    for ref_div in range(ref_lo, ref_hi + 1):
+        fb_hz = ref_hz / ref_div
+        if fb_hz not in fb_hzs: continue
+        fb_lo = max(int(out_lo / fb_hz) - 1, fb_divs.start)
+        fb_hi = min(int(out_hi / fb_hz) + 1, fb_divs.stop - 1)
+        for fb_div in range(fb_lo, fb_hi + 1):
+            out_hz = fb_hz * fb_div
+            if out_hz not in clko_hzs: continue
+            out_div_lo = max(int(vco_hzs.lo / out_hz), 1)
+            out_div_hi = min(int(vco_hzs.hi / out_hz) + 1, 128)
+            for fb_out_div in range(out_div_lo, out_div_hi + 1):
+                if out_hz * fb_out_div in vco_hzs:
+                    triples.append((ref_div, fb_div, fb_out_div))
+
+    ref_div = np.array([t[0] for t in triples], dtype=np.int64)
+    fb_div = np.array([t[1] for t in triples], dtype=np.int64)
+    fb_out_div = np.array([t[2] for t in triples], dtype=np.int64)
+    vco_hz = (ref_hz / ref_div) * fb_div * fb_out_div
+    return ref_div, fb_div, fb_out_div, vco_hz
+
+def search_config(ref_hz: float, clkos: Iterable[PllClock], feedback: Optional[int]=None,
+        ratios: Iterable[Tuple[int, int, float]]=()):
+    """Evaluate the output divisors of all legal pairs at once with NumPy
+
+    ratios: `(output, other, factor)` for outputs running at exactly
+        `factor` times the frequency of `other`, see `find_config()`
+    """
+
+    clkos = list(clkos)
+    if feedback is None:
+        ref_div, fb_div, fb_out_div, vco_hz = legal_pairs(ref_hz)
+    else:
+        ref_div, fb_div, fb_out_div, vco_hz = legal_feedback_triples(ref_hz, clkos[feedback])
+
+    # Outputs with a ratio follow the divisor of the root of their chain,
+    # `derived[root]` lists `(output, root divisor / output divisor)`
+    parents = { n: (other, factor) for n, other, factor in ratios }
+    def root(n: int, factor: float=1.0) -> Tuple[int, float]:
+        if n not in parents: return n, factor
+        other, f = parents[n]
+        return root(other, factor * f)
+    derived = {}
+    for n in parents:
+        derived.setdefault(root(n)[0], []).append((n, root(n)[1]))
+
+    def derived_divs(root_n: int, out_div: np.ndarray):
+        """Divisors of the outputs derived from a root divisor and whether they are legal"""
+        ok = np.ones(len(vco_hz), dtype=bool)
+        divs = []
+        for n, factor in derived.get(root_n, []):
+            exact = out_div / factor
+            div = np.round(exact).astype(np.int64)
+            ok &= (np.abs(exact - div) <= 1e-9 * exact) & (div >= 1) & (div <= 128)
+            div = np.clip(div, 1, 128)
+            if n == feedback:
+                ok &= div == fb_out_div
+            out_err = (vco_hz / div - clkos[n].frequency) / clkos[n].frequency
+            ok &= (clkos[n].tolerance_below() <= out_err) & (out_err <= clkos[n].tolerance_above())
+            divs.append(div)
+        return ok, divs
+
+    valid = np.ones(len(vco_hz), dtype=bool)
+    error = np.zeros(len(vco_hz))
+    clk_divs = [None] * len(clkos)
+    for root_n, clko in enumerate(clkos):
+        if root_n in parents: continue
+
+        # Same candidates and tie breaking as `find_config_reference()`,
+        # the first divisor with the strictly lowest error wins. The
+        # divisor of the feedback output is fixed. Divisors giving no
+        # legal divisor for the derived outputs are skipped.
+        best_div = np.zeros(len(vco_hz), dtype=np.int64)
+        best_err2 = np.zeros(len(vco_hz))
+        nearest = np.round(vco_hz / clko.frequency).astype(np.int64)
+        div_fudges = range(-2, 2 + 1) if root_n != feedback else [None]
+        for div_fudge in div_fudges:
+            if div_fudge is None:
+                out_div = fb_out_div
+            else:
+                out_div = np.clip(nearest + div_fudge, 1, 128)
+            out_err = (vco_hz / out_div - clko.frequency) / clko.frequency
+            out_err2 = out_err * out_err
+            ok = (clko.tolerance_below() <= out_err) & (out_err <= clko.tolerance_above())
+            ok &= derived_divs(root_n, out_div)[0]
+            better = ok & ((best_div == 0) | (out_err2 < best_err2))
+            best_div = np.where(better, out_div, best_div)
+            best_err2 = np.where(better, out_err2, best_err2)
+        valid &= best_div != 0
+        error += best_err2 * clko.error_weight
+        clk_divs[root_n] = best_div
+
+        best_div = np.where(best_div != 0, best_div, 1)
+        for (n, _), div in zip(derived.get(root_n, []), derived_divs(root_n, best_div)[1]):
+            out_err = (vco_hz / div - clkos[n].frequency) / clkos[n].frequency
+            error += out_err * out_err * clkos[n].error_weight
+            clk_divs[n] = div
+
+    index = np.flatnonzero(valid)
+    if len(index) == 0:
+        return None
+
+    # Configs compare by error first and then by the divisors
+    keys = (fb_div[index], ref_div[index], error[index])
+    if feedback is not None:
+        keys = (fb_out_div[index],) + keys
+    best = index[np.lexsort(keys)[0]]
+    divs = tuple(int(d[best]) for d in clk_divs)
+    return Config(float(error[best]), int(ref_div[best]), int(fb_div[best]),
+        divs, tuple(float(vco_hz[best]) / d for d in divs))
+
+# Persistent cache of search results, see `set_config_cache()`
+config_cache: Optional[Cache] = None
+search_version = "3"
+
+def set_config_cache(cache: Optional[Cache]):
+    """Keep the results of `find_config()` in `cache` between runs"""
+    global config_cache
+    config_cache = cache
+
+@lru_cache(maxsize=None)
+def find_config_cached(ref_hz: float, clkos: Tuple[Tuple[float, float, float, float], ...],
+        feedback: Optional[int], ratios: Tuple[Tuple[int, int, float], ...]=()):
+    """Memoized search, `clkos` are `(frequency, below, above, error_weight)` tuples
+
+    The returned `Config` is shared between callers, so its divisors and
+    frequencies are tuples."""
+
+    h = hashlib.sha1()
+    h.update(repr((search_version, ref_hz, clkos, feedback, ratios)).encode("utf-8"))
+    key = "ecp5_pll_" + h.hexdigest()[:16]
+    if config_cache is not None:
+        path = config_cache.lookup(key)
+        if path is not None:
+            with open(os.path.join(path, "config.json")) as f:
+                result = json.load(f)
+            if not result: return None
+            error, ref_div, fb_div, divs, hzs = result
+            return Config(error, ref_div, fb_div, tuple(divs), tuple(hzs))
+
+    config = search_config(ref_hz, [PllClock(f, (lo, hi), w) for f, lo, hi, w in clkos],
+        feedback, ratios)
+    if config_cache is not None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "config.json")
+            with open(path, "w") as f:
+                json.dump(config, f)
+            config_cache.store(key, [path])
+    return config
+
+def find_config(ref_hz: float, clkos: Iterable[PllClock], feedback: Optional[int]=None,
+        ratios: Iterable[Tuple[int, int, float]]=()):
+    """Find PLL configuration for ECP5
+
+    feedback: Index of the output used as the feedback path, by default
+        CLKOS3 is used internally with divisor 1
+    ratios: `(output, other, factor)` for outputs that must run at exactly
+        `factor` times the frequency of output `other`, ie. with the divisor
+        of `other` divided by `factor`. Only configurations where that is a
+        legal divisor are considered.
+
+    See documentation on Ecp5Pll for more information. Without `ratios`
+    returns the same configuration as `find_config_reference()`, results
+    are memoized within the process and with `set_config_cache()` between
+    runs. Phases don't affect the search, see `phase_steps()`.
+    """
+
+    return find_config_cached(float(ref_hz), tuple((float(c.frequency), float(c.tolerance_below()),
+        float(c.tolerance_above()), float(c.error_weight)) for c in clkos), feedback,
+        tuple((int(n), int(other), float(factor)) for n, other, factor in ratios))
+
+def phase_steps(div: int, degrees: float) -> int:
+    """Nearest phase offset of an output with divisor `div` in 1/8 VCO cycles"""
+    period = div * phase_steps_per_vco
+    return round(degrees / 360.0 * period) % period
+
 class Ecp5Pll(Elaboratable):
 
-    def __init__(self, clki_freq: float, clkos: Iterable[PllClock]):
+    def __init__(self, clki_freq: float, clkos: Iterable[PllClock], feedback: Optional[int]=None,
+            config: Optional[Config]=None):
         """Lattice ECP5 Phase-Locked Loop clock generator
 
         clki_freq: Input clock frequency
-        clkos: Output clock frequency/tolerance requests (max 3)
+        clkos: Output clock frequency/tolerance/phase requests (max 3, or 4 with `feedback`)
+        feedback: Index of the output used as the feedback clock
+        config: Configuration to use instead of searching one, eg. from
+            `blip.rtl.ecp5.clocking.plan_clocks()`
 
         Internal structure:
 
@@ -115,16 +343,37 @@ class Ecp5Pll(Elaboratable):
         at the frequency `i_clk * (fb_div/ref_div)`. The individual output clocks
         are obtained by dividing {VCO} by their respective output divisors.
 
-        We first search all possible `(ref_div, fb_div)` pairs that produce
-        legal internal frequencies (400-800MHz for {VCO}, 10-400Hz for {PD}).
+        We first find all `(ref_div, fb_div)` pairs that produce legal
+        internal frequencies (400-800MHz for {VCO}, 10-400Hz for {PD}).
         With a potential chosen {VCO} frequency we solve the optimal output
         clock divisors and check that they are within the requested tolerances.
         Finally we select the configuration with the lowest error, if any.
+        The output divisors of all pairs are evaluated at once with NumPy.
+
+        By default the feedback clock is the VCO itself through the otherwise
+        unused CLKOS3 with divisor 1 (`o_vco`). With `feedback` the feedback
+        is taken from `o_clk[feedback]` instead, which frees CLKOS3 for a
+        fourth output. The {VCO} then runs at `out_div[feedback]` times
+        `i_clk * (fb_div/ref_div)`, so the search includes that divisor.
+
+        Phase offsets are relative to the feedback clock, which must not be
+        shifted itself, and are rounded to 1/8 of a {VCO} cycle. The
+        resulting offsets are in `phases` in degrees. At runtime the phase of
+        the output selected by `i_phase_sel` (see `phase_sel_codes`) is moved
+        by one such step with a pulse on `i_phase_step`, `i_phase_load`
+        restores the configured phases, see `Ecp5PhaseStepper`.
         """
 
         # Check that the inputs are reasonable
-        if not (1 <= len(clkos) <= 3):
+        clkos = list(clkos)
+        max_clkos = 3 if feedback is None else 4
+        if not (1 <= len(clkos) <= max_clkos):
             raise ValueError(f"Bad amount of clock outputs: {len(clkos)}")
+        if feedback is not None:
+            if not (0 <= feedback < len(clkos)):
+                raise ValueError(f"Bad feedback output: {feedback}")
+            if clkos[feedback].phase % 360.0 != 0.0:
+                raise ValueError("The feedback output can't be phase shifted")
         if clki_freq not in clki_hzs:
             raise ValueError(f"Bad input clock frequency: {clki_freq}")
         for clko in clkos:
@@ -132,7 +381,8 @@ class Ecp5Pll(Elaboratable):
                 raise ValueError(f"Bad output clock frequency: {clko.frequency}")
 
         self.clki_hz = clki_freq
-        self.clkos = list(clkos)
+        self.clkos = clkos
+        self.feedback = feedback
 
         # Input/output clock/misc signals
 
@@ -143,11 +393,21 @@ class Ecp5Pll(Elaboratable):
         self.o_vco = Signal()
         self.o_locked = Signal()
 
-        config = find_config(clki_freq, clkos)
+        self.i_phase_sel = Signal(2)
+        self.i_phase_dir = Signal()
+        self.i_phase_step = Signal()
+        self.i_phase_load = Signal()
+
+        if config is None:
+            config = find_config(clki_freq, clkos, feedback)
         if not config:
             raise ValueError("Could not find a PLL configuration")
         self.config = config
 
+        self.phase_steps = [phase_steps(div, clko.phase) for div, clko in zip(config.clko_divs, clkos)]
+        self.phases = [step * 360.0 / (div * phase_steps_per_vco)
+            for step, div in zip(self.phase_steps, config.clko_divs)]
+
     def elaborate(self, platform: Platform) -> Module:
         m = Module()
 
@@ -164,24 +424,34 @@ class Ecp5Pll(Elaboratable):
             "i_CLKI": self.i_clk,
             "i_RST": self.i_rst,
             "o_LOCK": self.o_locked,
-            "o_CLKOS3": self.o_vco,
+            "i_PHASESEL0": self.i_phase_sel[0],
+            "i_PHASESEL1": self.i_phase_sel[1],
+            "i_PHASEDIR": self.i_phase_dir,
+            "i_PHASESTEP": self.i_phase_step,
+            "i_PHASELOADREG": self.i_phase_load,
 
-            # Configure feedback using CLKOS3 with fixed divisor 1
-            "p_FEEDBK_PATH": "INT_OS3", # CLKOS3?
-            "p_CLKOS3_ENABLE": "ENABLED",
-            "p_CLKOS3_DIV": "1",
             "p_CLKI_DIV": str(self.config.ref_div),
             "p_CLKFB_DIV": str(self.config.fb_div),
         }
 
+        if self.feedback is None:
+            # Configure feedback using CLKOS3 with fixed divisor 1
+            params.update({
+                "o_CLKOS3": self.o_vco,
+                "p_FEEDBK_PATH": "INT_OS3",
+                "p_CLKOS3_ENABLE": "ENABLED",
+                "p_CLKOS3_DIV": "1",
+            })
+        else:
+            params["p_FEEDBK_PATH"] = feedback_paths[self.feedback]
+
         # Enable requested clocks
-        # TODO: Phase?
-        # TODO: Allow using CLKOS3 (complicates the configuration search though..)
-        for o_clk, div, hz, name in zip(self.o_clk, self.config.clko_divs, self.config.clko_hzs, clko_names):
+        for o_clk, div, hz, step, name in zip(self.o_clk, self.config.clko_divs,
+                self.config.clko_hzs, self.phase_steps, clko_names):
             params[f"p_{name}_ENABLE"] = "ENABLED"
             params[f"p_{name}_DIV"] = str(div)
-            params[f"p_{name}_FPHASE"] = "0"
-            params[f"p_{name}_CPHASE"] = "0"
+            params[f"p_{name}_FPHASE"] = str(step % phase_steps_per_vco)
+            params[f"p_{name}_CPHASE"] = str(step // phase_steps_per_vco)
             params[f"o_{name}"] = o_clk
             platform.add_clock_constraint(o_clk, hz)
 
@@ -243,11 +513,9 @@ def triple_blinky(bld: Builder):
 
             return m
 
-    plan = platform.build(Top(), do_build=False)
-    bld.exec_plan("synth", plan)
+    bld.build("synth", platform, Top())
 
-@check()
-def asymmetric_tolerances(bld: Builder):
+def check_asymmetric_tolerances():
     config = find_config(25.0*MHz, [
         PllClock(25.0*MHz),
         PllClock(25.0*MHz, tolerance=(-0.1, -1e-6)),
@@ -256,3 +524,134 @@ def asymmetric_tolerances(bld: Builder):
     assert config
     assert config.clko_hzs[1] < 25*MHz
     assert config.clko_hzs[2] > 25*MHz
+
+@check()
+def asymmetric_tolerances(bld: Builder):
+    bld.python("search", check_asymmetric_tolerances)
+
+def check_search_benchmark(count: int=1000):
+    """Compare `find_config()` to the reference over a sweep of target frequencies"""
+    import time
+
+    targets = np.geomspace(clko_hzs.lo, clko_hzs.hi, count)
+    requests = [[PllClock(float(hz), tolerance=0.01), PllClock(25*MHz, tolerance=0.05)] for hz in targets]
+
+    begin = time.time()
+    reference = [find_config_reference(25*MHz, r) for r in requests]
+    reference_sec = time.time() - begin
+
+    begin = time.time()
+    fast = [search_config(25*MHz, r) for r in requests]
+    fast_sec = time.time() - begin
+
+    # Only measure the in-process memoization, the persistent cache is
+    # not filled with the sweep
+    global config_cache
+    saved_cache, config_cache = config_cache, None
+    try:
+        find_config_cached.cache_clear()
+        for r in requests:
+            find_config(25*MHz, r)
+        begin = time.time()
+        memoized = [find_config(25*MHz, r) for r in requests]
+        memoized_sec = time.time() - begin
+    finally:
+        config_cache = saved_cache
+        find_config_cached.cache_clear()
+
+    for hz, ref, res in zip(targets, reference, fast):
+        assert ref == res, f"{hz / MHz:.3f}MHz: {res} != {ref}"
+    assert memoized == fast
+    assert sum(1 for r in reference if r) > count // 2
+
+    print(f"{count} targets: reference {reference_sec:.2f}s, vectorized {fast_sec:.2f}s, memoized {memoized_sec:.4f}s")
+
+@check()
+def search_benchmark(bld: Builder):
+    bld.python("sweep", check_search_benchmark)
+
+def check_feedback_search():
+    """Compare the search with feedback through an output to brute force"""
+
+    def brute_force(ref_hz, clkos, feedback):
+        best = None
+        for ref_div, fb_div, fb_out_div in product(ref_divs, fb_divs, range(1, 128 + 1)):
+            fb_hz = ref_hz / ref_div
+            vco_hz = fb_hz * fb_div * fb_out_div
+            if fb_hz not in fb_hzs or vco_hz not in vco_hzs:
+                continue
+            divs, error = [], 0.0
+            for n, clko in enumerate(clkos):
+                cands = [fb_out_div] if n == feedback else range(1, 128 + 1)
+                errs = [((vco_hz / d - clko.frequency) / clko.frequency, d) for d in cands]
+                errs = [(e * e, d) for e, d in errs if clko.tolerance_below() <= e <= clko.tolerance_above()]
+                if not errs: break
+                err2, div = min(errs)
+                divs.append(div)
+                error += err2 * clko.error_weight
+            else:
+                if best is None or error < best[0]:
+                    best = (error, ref_div, fb_div, divs)
+        return best
+
+    requests = [
+        (25*MHz, [PllClock(100*MHz), PllClock(100*MHz, phase=90.0), PllClock(50*MHz), PllClock(25*MHz)], 0),
+        (25*MHz, [PllClock(143*MHz), PllClock(143*MHz, phase=-45.0)], 0),
+        (25*MHz, [PllClock(74.25*MHz, tolerance=0.01), PllClock(371.25*MHz, tolerance=0.01)], 1),
+        (12*MHz, [PllClock(48*MHz), PllClock(60*MHz), PllClock(8*MHz), PllClock(133*MHz, tolerance=0.01)], 2),
+    ]
+
+    for ref_hz, clkos, feedback in requests:
+        config = search_config(ref_hz, clkos, feedback)
+        best = brute_force(ref_hz, clkos, feedback)
+
+        assert (config is None) == (best is None)
+        if config is None: continue
+        assert abs(config.error - best[0]) <= 1e-12, f"{config} is worse than {best}"
+
+        fb_hz = ref_hz / config.ref_div
+        vco_hz = config.clko_hzs[feedback] * config.clko_divs[feedback]
+        assert fb_hz in fb_hzs and vco_hz in vco_hzs
+        assert abs(fb_hz * config.fb_div / config.clko_hzs[feedback] - 1.0) < 1e-9
+
+        # Phases are exact when divisible by the step of the output
+        for clko, div in zip(clkos, config.clko_divs):
+            step = phase_steps(div, clko.phase)
+            error = (step * 360.0 / (div * phase_steps_per_vco) - clko.phase) % 360.0
+            assert min(error, 360.0 - error) <= 180.0 / (div * phase_steps_per_vco) + 1e-9
+
+    config = find_config(25*MHz, requests[0][1], 0)
+    assert config.clko_hzs == (100*MHz, 100*MHz, 50*MHz, 25*MHz)
+    assert phase_steps(config.clko_divs[1], 90.0) == config.clko_divs[1] * 2
+
+@check()
+def feedback_search(bld: Builder):
+    bld.python("search", check_feedback_search)
+
+@check()
+def quad_phase(bld: Builder):
+    platform = ULX3S_85F_Platform()
+
+    class Top(Elaboratable):
+        def elaborate(self, platform: Platform) -> Module:
+            m = Module()
+
+            # Feedback through CLKOP frees CLKOS3, CLKOS is delayed by 90 degrees
+            m.submodules.pll = pll = Ecp5Pll(platform.default_clk_frequency, [
+                PllClock(100*MHz), PllClock(100*MHz, phase=90.0), PllClock(50*MHz), PllClock(25*MHz),
+            ], feedback=0)
+
+            for n, o_clk in enumerate(pll.o_clk):
+                domain = f"clk{n}"
+                m.domains += ClockDomain(domain)
+                m.d.comb += ClockSignal(domain).eq(o_clk)
+
+                counter = Signal(28)
+                m.d[domain] += counter.eq(counter + 1)
+                m.d.comb += platform.request("led", n).eq(counter[-1])
+
+            m.d.comb += pll.i_clk.eq(ClockSignal())
+
+            return m
+
+    bld.build("synth", platform, Top())
@@ -0,0 +1,443 @@
+from nmigen import *
+from nmigen.build import Platform
+from nmigen.lib.cdc import FFSynchronizer, ResetSynchronizer
+from nmigen_boards.ulx3s import ULX3S_85F_Platform
+from blip import check, Builder
+from blip.rtl.ecp5.pll import Ecp5Pll, PllClock, MHz, clko_names, phase_sel_codes
+from blip.rtl.ecp5.io import Ecp5ClockSelect
+
+class Ecp5PhaseStepper(Elaboratable):
+    def __init__(self, outputs: int, setup_cycles: int=2, pulse_cycles: int=4):
+        """Step the phases of `Ecp5Pll` outputs at runtime
+
+        outputs: Number of PLL outputs
+        setup_cycles: Cycles `o_phase_sel` and `o_phase_dir` are stable
+            around every `o_phase_step` pulse
+        pulse_cycles: Length of the `o_phase_step` and `o_phase_load` pulses
+
+        Runs in the domain of the PLL input clock. `i_start` moves output
+        `i_sel` by `i_count` steps of 1/8 VCO cycles, delaying it with
+        `i_dir` low and advancing it with `i_dir` high. `i_load` restores
+        the configured phases. `o_phases` are the net delays of the outputs
+        in steps since the last load, the feedback output must not be
+        stepped. `o_phase_*` are connected to the `i_phase_*` of the PLL.
+        """
+
+        self.outputs = outputs
+        self.setup_cycles = setup_cycles
+        self.pulse_cycles = pulse_cycles
+
+        self.i_sel = Signal(range(max(outputs, 2)))
+        self.i_dir = Signal()
+        self.i_count = Signal(8)
+        self.i_start = Signal()
+        self.i_load = Signal()
+        self.o_busy = Signal()
+        self.o_phases = [Signal(signed(16), name=f"o_phase{n}") for n in range(outputs)]
+
+        self.o_phase_sel = Signal(2)
+        self.o_phase_dir = Signal()
+        self.o_phase_step = Signal()
+        self.o_phase_load = Signal()
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        sel = Signal.like(self.i_sel)
+        count = Signal.like(self.i_count)
+        timer = Signal(range(max(self.setup_cycles, self.pulse_cycles) + 1))
+
+        codes = Array(Const(phase_sel_codes[name], 2) for name in clko_names[:self.outputs])
+        m.d.comb += self.o_phase_sel.eq(codes[sel])
+
+        with m.If(timer != 0):
+            m.d.sync += timer.eq(timer - 1)
+
+        with m.FSM():
+            with m.State("IDLE"):
+                with m.If(self.i_load):
+                    m.d.sync += timer.eq(self.pulse_cycles - 1)
+                    m.d.sync += [phase.eq(0) for phase in self.o_phases]
+                    m.next = "LOAD"
+                with m.Elif(self.i_start & (self.i_count != 0)):
+                    m.d.sync += [
+                        sel.eq(self.i_sel),
+                        self.o_phase_dir.eq(self.i_dir),
+                        count.eq(self.i_count),
+                        timer.eq(self.setup_cycles - 1),
+                    ]
+                    m.next = "SETUP"
+
+            with m.State("LOAD"):
+                m.d.comb += [self.o_busy.eq(1), self.o_phase_load.eq(1)]
+                with m.If(timer == 0):
+                    m.next = "IDLE"
+
+            with m.State("SETUP"):
+                m.d.comb += self.o_busy.eq(1)
+                with m.If(timer == 0):
+                    m.d.sync += timer.eq(self.pulse_cycles - 1)
+                    m.next = "PULSE"
+
+            with m.State("PULSE"):
+                m.d.comb += [self.o_busy.eq(1), self.o_phase_step.eq(1)]
+                with m.If(timer == 0):
+                    m.d.sync += [
+                        timer.eq(self.setup_cycles - 1),
+                        count.eq(count - 1),
+                    ]
+                    with m.Switch(sel):
+                        for n, phase in enumerate(self.o_phases):
+                            with m.Case(n):
+                                m.d.sync += phase.eq(Mux(self.o_phase_dir, phase - 1, phase + 1))
+                    m.next = "SETUP"
+                    with m.If(count == 1):
+                        m.next = "HOLD"
+
+            with m.State("HOLD"):
+                m.d.comb += self.o_busy.eq(1)
+                with m.If(timer == 0):
+                    m.next = "IDLE"
+
+        return m
+
+class ClockSwitcher(Elaboratable):
+    def __init__(self, count: int, relock: bool=True, reset_cycles: int=16,
+            settle_cycles: int=16, lock_cycles: int=1024):
+        """Switch a clock domain between PLL outputs with a re-lock sequence
+
+        count: Number of selectable clocks
+        relock: Reset the PLL of the new clock before switching
+        reset_cycles: Length of the `o_pll_rst` pulse
+        settle_cycles: Cycles the downstream domain is held in reset before
+            and after switching the clock
+        lock_cycles: Cycles the new clock must stay locked before use
+
+        Runs in a free running domain like the PLL input clock. `i_start`
+        switches to clock `i_sel`: `o_rst` is asserted, the PLL is reset with
+        `o_pll_rst` and the switcher waits for `i_locked` to be stable before
+        changing `o_clk_sel`, eg. of `Ecp5ClockSelect`. `o_rst` is released
+        after `settle_cycles` and is asserted again whenever the active clock
+        loses lock, it should be synchronized to the downstream domain with
+        `ResetSynchronizer`.
+        """
+
+        self.count = count
+        self.relock = relock
+        self.reset_cycles = reset_cycles
+        self.settle_cycles = settle_cycles
+        self.lock_cycles = lock_cycles
+
+        self.i_locked = Signal(count)
+        self.i_sel = Signal(range(max(count, 2)))
+        self.i_start = Signal()
+
+        self.o_pll_rst = Signal(count)
+        self.o_clk_sel = Signal(range(max(count, 2)))
+        self.o_rst = Signal(reset=1)
+        self.o_busy = Signal()
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        locked = Signal(self.count)
+        m.submodules.locked_sync = FFSynchronizer(self.i_locked, locked)
+
+        target = Signal.like(self.o_clk_sel)
+        timer = Signal(range(max(self.reset_cycles, self.settle_cycles, self.lock_cycles) + 1),
+            reset=self.lock_cycles - 1)
+        target_locked = (locked >> target)[0]
+        active_locked = (locked >> self.o_clk_sel)[0]
+
+        with m.If(timer != 0):
+            m.d.sync += timer.eq(timer - 1)
+
+        def wait_lock():
+            m.d.sync += timer.eq(self.lock_cycles - 1)
+            m.next = "WAIT_LOCK"
+
+        with m.FSM(reset="WAIT_LOCK"):
+            with m.State("RUN"):
+                m.d.comb += self.o_rst.eq(~active_locked)
+                with m.If(self.i_start):
+                    m.d.sync += [
+                        target.eq(self.i_sel),
+                        timer.eq(self.settle_cycles - 1),
+                    ]
+                    m.next = "HOLD"
+                with m.Elif(~active_locked):
+                    # Lost lock, wait for it to come back before releasing
+                    wait_lock()
+
+            with m.State("HOLD"):
+                m.d.comb += [self.o_rst.eq(1), self.o_busy.eq(1)]
+                with m.If(timer == 0):
+                    if self.relock:
+                        m.d.sync += timer.eq(self.reset_cycles - 1)
+                        m.next = "RESET"
+                    else:
+                        wait_lock()
+
+            with m.State("RESET"):
+                m.d.comb += [self.o_rst.eq(1), self.o_busy.eq(1)]
+                m.d.comb += self.o_pll_rst.eq(1 << target)
+                with m.If(timer == 0):
+                    wait_lock()
+
+            with m.State("WAIT_LOCK"):
+                m.d.comb += [self.o_rst.eq(1), self.o_busy.eq(1)]
+                with m.If(~target_locked):
+                    m.d.sync += timer.eq(self.lock_cycles - 1)
+                with m.Elif(timer == 0):
+                    m.d.sync += [
+                        self.o_clk_sel.eq(target),
+                        timer.eq(self.settle_cycles - 1),
+                    ]
+                    m.next = "SETTLE"
+
+            with m.State("SETTLE"):
+                m.d.comb += [self.o_rst.eq(1), self.o_busy.eq(1)]
+                with m.If(timer == 0):
+                    m.next = "RUN"
+
+        return m
+
+class Ecp5PllModel(Elaboratable):
+    def __init__(self, outputs: int, lock_cycles: int):
+        """Simulation model of the control ports of `Ecp5Pll`
+
+        `o_locked` rises `lock_cycles` after `i_rst` is released and `i_unlock`
+        drops it like a disturbed input clock would. Phase steps are applied
+        at the end of `i_phase_step` pulses to `o_phases`, counted like
+        `Ecp5PhaseStepper.o_phases`. `o_violation` is set if `i_phase_sel` or
+        `i_phase_dir` change during a pulse.
+        """
+
+        self.outputs = outputs
+        self.lock_cycles = lock_cycles
+
+        self.i_rst = Signal()
+        self.i_unlock = Signal()
+        self.o_locked = Signal()
+
+        self.i_phase_sel = Signal(2)
+        self.i_phase_dir = Signal()
+        self.i_phase_step = Signal()
+        self.i_phase_load = Signal()
+        self.o_phases = [Signal(signed(16), name=f"o_phase{n}") for n in range(outputs)]
+        self.o_violation = Signal()
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        lock_count = Signal(range(self.lock_cycles + 1))
+        with m.If(self.i_rst | self.i_unlock):
+            m.d.sync += lock_count.eq(0)
+        with m.Elif(lock_count != self.lock_cycles):
+            m.d.sync += lock_count.eq(lock_count + 1)
+        m.d.comb += self.o_locked.eq((lock_count == self.lock_cycles) & ~self.i_unlock)
+
+        step_prev = Signal()
+        sel_prev = Signal(2)
+        dir_prev = Signal()
+        m.d.sync += [
+            step_prev.eq(self.i_phase_step),
+            sel_prev.eq(self.i_phase_sel),
+            dir_prev.eq(self.i_phase_dir),
+        ]
+
+        with m.If(step_prev & ((self.i_phase_sel != sel_prev) | (self.i_phase_dir != dir_prev))):
+            m.d.sync += self.o_violation.eq(1)
+
+        with m.If(self.i_phase_load):
+            m.d.sync += [phase.eq(0) for phase in self.o_phases]
+        with m.Elif(step_prev & ~self.i_phase_step):
+            for name, phase in zip(clko_names, self.o_phases):
+                with m.If(sel_prev == phase_sel_codes[name]):
+                    m.d.sync += phase.eq(Mux(dir_prev, phase - 1, phase + 1))
+
+        return m
+
+def check_phase_sweep():
+    """Step the phases of a `Ecp5PllModel` with `Ecp5PhaseStepper`"""
+    from nmigen.back.pysim import Simulator, Settle
+
+    m = Module()
+    m.submodules.pll = pll = Ecp5PllModel(3, lock_cycles=4)
+    m.submodules.stepper = stepper = Ecp5PhaseStepper(3)
+    m.d.comb += [
+        pll.i_phase_sel.eq(stepper.o_phase_sel),
+        pll.i_phase_dir.eq(stepper.o_phase_dir),
+        pll.i_phase_step.eq(stepper.o_phase_step),
+        pll.i_phase_load.eq(stepper.o_phase_load),
+    ]
+
+    sim = Simulator(m)
+    sim.add_clock(1 / (25*MHz))
+
+    # (sel, dir, count) or "load", expected delays of every output after it
+    sequence = [
+        ((1, 0, 5), [0, 5, 0]),
+        ((1, 1, 3), [0, 2, 0]),
+        ((0, 1, 2), [-2, 2, 0]),
+        ((2, 0, 200), [-2, 2, 200]),
+        ("load", [0, 0, 0]),
+        ((2, 1, 1), [0, 0, -1]),
+    ]
+
+    results = []
+    def process():
+        for command, expected in sequence:
+            if command == "load":
+                yield stepper.i_load.eq(1)
+            else:
+                sel, dir, count = command
+                yield stepper.i_sel.eq(sel)
+                yield stepper.i_dir.eq(dir)
+                yield stepper.i_count.eq(count)
+                yield stepper.i_start.eq(1)
+            yield
+            yield stepper.i_start.eq(0)
+            yield stepper.i_load.eq(0)
+            cycles = 1
+            yield Settle()
+            while (yield stepper.o_busy):
+                yield
+                yield Settle()
+                cycles += 1
+            yield
+            yield Settle()
+            model, steps = [], []
+            for model_phase, step_phase in zip(pll.o_phases, stepper.o_phases):
+                model.append((yield model_phase))
+                steps.append((yield step_phase))
+            results.append((command, expected, model, steps, cycles))
+
+        assert not (yield pll.o_violation), "Phase select changed during a step"
+
+    sim.add_sync_process(process)
+    sim.run()
+
+    for command, expected, model, steps, cycles in results:
+        assert model == expected, f"{command}: PLL phases {model}, expected {expected}"
+        assert steps == expected, f"{command}: Stepper phases {steps}, expected {expected}"
+
+    # A full sweep of 200 steps takes microseconds at the input clock
+    cycles = results[3][4]
+    assert cycles <= 200 * (2 * 2 + 4), f"Sweep took {cycles} cycles"
+
+def check_clock_switching():
+    """Switch between two `Ecp5PllModel`s and check the reset gating"""
+    from nmigen.back.pysim import Simulator, Settle
+
+    m = Module()
+    m.submodules.pll0 = pll0 = Ecp5PllModel(1, lock_cycles=20)
+    m.submodules.pll1 = pll1 = Ecp5PllModel(1, lock_cycles=35)
+    m.submodules.switcher = switcher = ClockSwitcher(2, reset_cycles=4, settle_cycles=3, lock_cycles=8)
+    m.d.comb += [
+        pll0.i_rst.eq(switcher.o_pll_rst[0]),
+        pll1.i_rst.eq(switcher.o_pll_rst[1]),
+        switcher.i_locked.eq(Cat(pll0.o_locked, pll1.o_locked)),
+    ]
+
+    sim = Simulator(m)
+    sim.add_clock(1 / (25*MHz))
+
+    trace = []
+    def process():
+        # (cycle, action)
+        actions = { 100: ("switch", 1), 300: ("switch", 0), 500: ("unlock", 1), 520: ("unlock", 0),
+            700: ("switch", 0) }
+        for cycle in range(900):
+            action = actions.get(cycle)
+            if action and action[0] == "switch":
+                yield switcher.i_sel.eq(action[1])
+                yield switcher.i_start.eq(1)
+            elif action and action[0] == "unlock":
+                yield pll0.i_unlock.eq(action[1])
+            yield
+            yield switcher.i_start.eq(0)
+            yield Settle()
+            trace.append(((yield switcher.o_clk_sel), (yield switcher.o_rst),
+                (yield pll0.o_locked), (yield pll1.o_locked)))
+
+    sim.add_sync_process(process)
+    sim.run()
+
+    for n in range(1, len(trace)):
+        sel, rst, locked0, locked1 = trace[n]
+        prev_sel, prev_rst = trace[n - 1][:2]
+        if sel != prev_sel:
+            assert rst and prev_rst, f"Clock switched at {n} without holding reset"
+        if prev_rst and not rst:
+            assert (locked0, locked1)[sel], f"Reset released at {n} without lock"
+        # Lock is synchronized with two flip-flops
+        if n >= 2 and not trace[n - 2][2:][sel]:
+            assert rst, f"Reset not asserted at {n} after losing lock"
+
+    # Reset is released after every switch and follows a lost lock
+    sels = [t[0] for t in trace]
+    assert sels[250] == 1 and not trace[250][1]
+    assert sels[450] == 0 and not trace[450][1]
+    assert all(t[1] for t in trace[505:520])
+    assert not trace[650][1]
+    assert sels[850] == 0 and not trace[850][1]
+
+@check()
+def sim(bld: Builder):
+    bld.python("phase_sweep", check_phase_sweep)
+    bld.python("clock_switching", check_clock_switching)
+
+@check()
+def synth(bld: Builder):
+    platform = ULX3S_85F_Platform()
+
+    class Top(Elaboratable):
+        def elaborate(self, platform: Platform) -> Module:
+            m = Module()
+
+            # Two pixel clocks to switch between and a phase stepped copy
+            m.submodules.pll = pll = Ecp5Pll(platform.default_clk_frequency, [
+                PllClock(65*MHz, tolerance=0.01), PllClock(40*MHz, tolerance=0.01),
+                PllClock(65*MHz, tolerance=0.01),
+            ])
+            m.submodules.stepper = stepper = Ecp5PhaseStepper(3)
+            m.submodules.switcher = switcher = ClockSwitcher(2, relock=False)
+            m.submodules.clk_sel = clk_sel = Ecp5ClockSelect()
+
+            m.domains.video = ClockDomain("video")
+            m.d.comb += [
+                pll.i_clk.eq(ClockSignal()),
+                pll.i_rst.eq(switcher.o_pll_rst.any()),
+                pll.i_phase_sel.eq(stepper.o_phase_sel),
+                pll.i_phase_dir.eq(stepper.o_phase_dir),
+                pll.i_phase_step.eq(stepper.o_phase_step),
+                pll.i_phase_load.eq(stepper.o_phase_load),
+                switcher.i_locked.eq(Repl(pll.o_locked, 2)),
+                clk_sel.i0.eq(pll.o_clk[0]),
+                clk_sel.i1.eq(pll.o_clk[1]),
+                clk_sel.sel.eq(switcher.o_clk_sel),
+                ClockSignal("video").eq(clk_sel.o),
+            ]
+            m.submodules.video_rst = ResetSynchronizer(switcher.o_rst, domain="video")
+
+            step = platform.request("button_fire", 0)
+            switch = platform.request("button_fire", 1)
+            m.d.sync += [
+                stepper.i_sel.eq(2),
+                stepper.i_count.eq(1),
+                stepper.i_start.eq(step),
+                switcher.i_sel.eq(~switcher.o_clk_sel),
+                switcher.i_start.eq(switch & ~switcher.o_busy),
+            ]
+
+            counter = Signal(26)
+            m.d.video += counter.eq(counter + 1)
+            m.d.comb += [
+                platform.request("led", 0).eq(counter[-1]),
+                platform.request("led", 1).eq(stepper.o_phases[2][0]),
+            ]
+
+            return m
+
+    bld.build("synth", platform, Top())
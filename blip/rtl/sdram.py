@@ -394,7 +394,7 @@ def bmc_pending_counter(bld: Builder):
         f.write(il_text)
 
     sby.verify(bld, "formal.sby", "formal.il",
-        sby.Task("sby", "bmc", depth=40, engines=["smtbmc", "yices"]),
+        sby.Task("sby", "bmc", depth=40, engines=["smtbmc", "yices"], escalate=[5, 10, 20]),
     )
 
 @check()
@@ -421,5 +421,5 @@ def cover_pending_counter(bld: Builder):
         f.write(il_text)
 
     sby.verify(bld, "formal.sby", "formal.il",
-        sby.Task("sby", "cover", depth=40, engines=["smtbmc", "yices"]),
+        sby.Task("sby", "cover", depth=40, engines=["smtbmc", "yices"], escalate=[10, 20]),
     )
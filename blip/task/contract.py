@@ -0,0 +1,78 @@
+from nmigen import *
+from nmigen.back import rtlil
+from nmigen.asserts import Assert, Assume, AnySeq
+from dataclasses import dataclass, field
+from typing import Callable, List
+from blip.build import Builder, Task as BuildTask
+from blip.task import sby
+
+@dataclass
+class Contract:
+    """Proven interface contract of a submodule
+
+    Larger proofs can replace a submodule with `abstract()`, which drives its
+    outputs freely constrained only by the contract properties. The contract
+    itself is proven once against the real implementation by `prove()`, the
+    proof task should be passed as a dependency to any check relying on it.
+
+    name: Unique name of the contract, used to share the proof between checks
+    create: Create an instance of the implementation to prove
+    inputs: Input signals of an instance, unconstrained in the proof
+    outputs: Output signals of an instance, unconstrained in the abstraction
+    properties: `properties(m, dut, check)` adds the guaranteed properties
+        of `dut` to `m` with `check` being either `Assert` or `Assume`
+    """
+
+    name: str
+    create: Callable[[], Elaboratable]
+    inputs: Callable[[Elaboratable], List[Signal]]
+    outputs: Callable[[Elaboratable], List[Signal]]
+    properties: Callable[[Module, Elaboratable, Callable], None]
+    depth: int = 3
+    engines: List[str] = field(default_factory=lambda: ["smtbmc", "yices"])
+
+    def abstract(self, dut: Elaboratable) -> Elaboratable:
+        """Black box to use in place of `dut` as a submodule"""
+        return Abstraction(self, dut)
+
+    def prove(self, bld: Builder) -> BuildTask:
+        """Prove the contract for the implementation, once per build"""
+
+        def create() -> BuildTask:
+            m = Module()
+            m.submodules.dut = dut = self.create()
+            for i in self.inputs(dut):
+                m.d.comb += i.eq(AnySeq(len(i)))
+            self.properties(m, dut, Assert)
+
+            with bld.temp_open("formal.il") as f:
+                il_text = rtlil.convert(m, ports=self.outputs(dut))
+                f.write(il_text)
+
+            return sby.verify(bld, "prove.sby", "formal.il",
+                sby.Task("sby_prove", "prove", depth=self.depth, engines=self.engines),
+            )
+
+        return bld.shared(f"contract_{self.name}", create)
+
+class Abstraction(Elaboratable):
+    def __init__(self, contract: Contract, dut: Elaboratable):
+        self.contract = contract
+        self.dut = dut
+
+    def elaborate(self, platform):
+        m = Module()
+
+        # The implementation is only used for its ports, elaborate it into a
+        # throwaway fragment so it is not reported as unused
+        Fragment.get(self.dut, platform)
+
+        for o in self.contract.outputs(self.dut):
+            m.d.comb += o.eq(AnySeq(len(o)))
+        self.contract.properties(m, self.dut, Assume)
+
+        return m
+
+def require(bld: Builder, *contracts: Contract) -> List[BuildTask]:
+    """Proof tasks of `contracts` to depend on"""
+    return [contract.prove(bld) for contract in contracts]
@@ -0,0 +1,98 @@
+from typing import Iterable, Optional, Tuple
+import os
+import re
+import sys
+import shutil
+import hashlib
+import subprocess
+from blip.build import Builder
+from blip.build import Task as BuildTask
+
+cxx_flags = ["-std=c++14", "-O2"]
+
+runtime_includes = [
+    "-I\"$(yosys-config --datdir)/include\"",
+    "-I\"$(yosys-config --datdir)/include/backends/cxxrtl/runtime\"",
+]
+
+def normalize_rtlil(text: str) -> str:
+    """Strip attributes that don't affect simulation, eg. source locations"""
+    return re.sub(r"^\s*attribute \\(src|generator) .*\n", "", text, flags=re.MULTILINE)
+
+yosys_version = None
+
+def model_key(il_text: str) -> str:
+    """Cache key of the compiled model of a design"""
+    global yosys_version
+    if yosys_version is None:
+        try:
+            yosys_version = subprocess.run(["yosys-config", "--version"],
+                capture_output=True, text=True).stdout.strip()
+        except OSError:
+            yosys_version = ""
+
+    h = hashlib.sha1()
+    h.update(normalize_rtlil(il_text).encode("utf-8"))
+    h.update(" ".join([yosys_version] + cxx_flags).encode("utf-8"))
+    return "cxxrtl_" + h.hexdigest()[:16]
+
+def build_model(bld: Builder, il_path: str) -> Tuple[Optional[BuildTask], str]:
+    """Compile the CXXRTL model of a design into an object file once
+
+    The model is keyed by the normalized RTLIL so designs differing only in
+    source locations share it. With `bld.cache` compiled models are kept
+    between runs. Returns the task (None if found in the cache) and the
+    directory containing `design.h` and `design.o`.
+    """
+
+    src_path = bld.temp_file(il_path)
+    with open(src_path) as f:
+        key = model_key(f.read())
+
+    if bld.cache is not None:
+        path = bld.cache.lookup(key)
+        if path is not None:
+            return None, path
+
+    def create() -> BuildTask:
+        shutil.copyfile(src_path, bld.temp_file("design.il"))
+        gen_task = bld.exec("cxxrtl", "yosys", ["-q", "-p",
+            "read_ilang design.il; hierarchy -top top; write_cxxrtl -header design.cpp"])
+        args = " ".join(cxx_flags + runtime_includes + ["-c", "design.cpp", "-o", "design.o"])
+        task = bld.exec("compile", "sh", ["-c", f"${{CXX:-c++}} {args}"], deps=[gen_task])
+        if bld.cache is not None:
+            task = bld.python("store", bld.cache.store, key,
+                [bld.temp_file("design.h"), bld.temp_file("design.o")], deps=[task])
+        return task
+
+    task = bld.shared(key, create)
+    if bld.cache is not None:
+        return task, bld.cache.entry_path(key)
+    else:
+        return task, os.path.dirname(bld.shared_file(key, "design.o"))
+
+def build_sim(bld: Builder, il_path: str, tb_path: str, exe_name: str="sim",
+        deps: Iterable[BuildTask]=()) -> BuildTask:
+    """Compile a CXXRTL simulation of a design into an executable
+
+    il_path: RTLIL of the design with the top module named `top`
+    tb_path: C++ testbench, the generated model can be included as `design.h`
+
+    The model is generated by yosys `write_cxxrtl` and compiled separately
+    from the testbench using the CXXRTL runtime shipped with yosys, see
+    `build_model()`. Returns the compile task, the executable is written
+    as `exe_name` next to the testbench.
+    """
+
+    model_task, model_dir = build_model(bld, il_path)
+    if model_task is not None:
+        deps = [model_task] + list(deps)
+
+    if sys.platform.startswith("win32"):
+        exe_name += ".exe"
+
+    args = " ".join(cxx_flags + runtime_includes + [
+        f"-I\"{model_dir}\"",
+        tb_path, f"\"{os.path.join(model_dir, 'design.o')}\"", "-o", exe_name,
+    ])
+    return bld.exec("compile", "sh", ["-c", f"${{CXX:-c++}} {args}"], deps=deps)
@@ -1,34 +1,160 @@
-from dataclasses import dataclass
-from typing import List, Iterable
-from blip.build import Builder
+from dataclasses import dataclass, field
+from typing import List, Iterable, Tuple, Optional
+import hashlib
+import shutil
+from blip.build import Builder, ExecTask, Result
+from blip.build import Task as BuildTask
 
 @dataclass
 class Task:
+    """Formal verification task
+
+    escalate: Shallower depths to check first in order, see `verify()`
+    """
+
     name: str
     mode: str
     depth: int
     engines: List[str]
     multiclock: bool = False
+    escalate: List[int] = field(default_factory=list)
+
+# Return code of sby for failed assertions or unreached cover statements
+sby_fail = 2
+
+class EscalationTask(BuildTask):
+    def __init__(self, name: str, id: str, mode: str, stages: List[ExecTask], depths: List[int],
+            deps: Iterable[BuildTask]=()):
+        """Run sby stages of increasing depth one after another
+
+        The stop is decided by the return code of sby. A failed BMC stage
+        fails the task immediately and in cover mode a stage reaching all
+        cover statements passes it, otherwise the result of the last (full
+        depth) stage is used. sby returns FAIL both for unreached covers and
+        failed assertions, so shallow cover stages continue on FAIL and a
+        failed assertion is found again by the deeper stage.
+        """
+        super().__init__(name, id, jobserver=True, deps=deps)
+        self.mode = mode
+        self.stages = stages
+        self.depths = depths
+        self.index = 0
+
+    def start(self):
+        stage = self.stages[self.index]
+        stage.slots, stage.env, stage.pass_fds = self.slots, self.env, self.pass_fds
+        stage.start()
+
+    def poll(self) -> Optional[Result]:
+        stage = self.stages[self.index]
+        result = stage.poll()
+        if result is None: return None
+
+        if self.index + 1 < len(self.stages):
+            if self.mode == "cover":
+                done = result.ok or result.exit_code != sby_fail
+            else:
+                done = not result.ok
+            if not done:
+                self.index += 1
+                self.start()
+                return None
+
+        result.info = f"Finished at depth {self.depths[self.index]}"
+        return result
+
+    def describe(self) -> str:
+        depths = ", ".join(str(d) for d in self.depths)
+        return f"{self.stages[-1].describe()}   (depths {depths})"
+
+def prepare(bld: Builder, il_path: str) -> Tuple[BuildTask, str]:
+    """Run yosys `prep` on a design once and share the result
+
+    Checks producing identical RTLIL share a single preparation task that
+    saves the prepared design as a checkpoint, sby tasks read the checkpoint
+    instead of redoing the front-end work. Returns the preparation task and
+    the absolute path of the checkpoint.
+    """
 
-def verify(bld: Builder, sby_name: str, il_path: str, task: Task):
+    src_path = bld.temp_file(il_path)
+    with open(src_path, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:16]
+    key = f"prep_{digest}"
 
+    def create() -> BuildTask:
+        shutil.copyfile(src_path, bld.temp_file("design.il"))
+        return bld.exec("prep", "yosys", ["-q", "-p",
+            "read_ilang design.il; prep -top top; write_ilang prep.il"])
+
+    return bld.shared(key, create), bld.shared_file(key, "prep.il")
+
+def write_design(f, prep_path: str):
+    print("[script]", file=f)
+    print("read_ilang prep.il", file=f)
+    print("hierarchy -top top", file=f)
+    print("[files]", file=f)
+    print(f"prep.il {prep_path}", file=f)
+
+def write_sby(bld: Builder, sby_name: str, prep_path: str, task: Task, mode: str, depth: int, skip: int=0):
     with bld.temp_open(sby_name) as f:
         print("[options]", file=f)
         multiclock = ["off", "on"][task.multiclock]
-        print(f"mode {task.mode}", file=f)
-        print(f"depth {task.depth}", file=f)
+        print(f"mode {mode}", file=f)
+        print(f"depth {depth}", file=f)
+        if skip > 0:
+            print(f"skip {skip}", file=f)
         print(f"multiclock {multiclock}", file=f)
         print("[engines]", file=f)
         print(" ".join(task.engines), file=f)
-        print("[script]", file=f)
-        print(f"read_ilang {il_path}", file=f)
-        print("prep -top top", file=f)
-        print("[files]", file=f)
-        print(f"{il_path}", file=f)
+        write_design(f, prep_path)
+
+def verify(bld: Builder, sby_name: str, il_path: str, task: Task, deps: Iterable[BuildTask]=()) -> BuildTask:
+    """Verify a design using SymbiYosys
+
+    With `task.escalate` the design is first checked at the listed shallower
+    depths, most regressions are shallow so a counterexample is found without
+    paying for the full unrolling. Cover tasks stop as soon as all cover
+    statements are reached. sby can't resume an unrolling across runs so
+    the solver state is not kept, but BMC stages `skip` the steps already
+    checked by the previous stage. Shallow stages of prove tasks only run
+    the base case as BMC, the induction runs only at the configured depth.
+
+    The task is started only after all `deps` (eg. contract proofs) pass.
+    """
 
-    bld.exec(task.name, "sby", [sby_name])
+    prep_task, prep_path = prepare(bld, il_path)
+    deps = [prep_task] + list(deps)
+
+    depths = [d for d in task.escalate if d < task.depth] + [task.depth]
+    if len(depths) == 1:
+        write_sby(bld, sby_name, prep_path, task, task.mode, task.depth)
+        return bld.exec(task.name, "sby", [sby_name], jobserver=True, deps=deps)
+
+    # The last stage keeps the names of a run without escalation
+    stages = []
+    skip = 0
+    for depth in depths:
+        if depth == task.depth:
+            stage_mode = task.mode
+            stage_name = sby_name
+            exec_name = task.name
+        else:
+            stage_mode = "cover" if task.mode == "cover" else "bmc"
+            stage_name = sby_name.replace(".sby", f"_d{depth}.sby")
+            exec_name = f"{task.name}_d{depth}"
+        write_sby(bld, stage_name, prep_path, task, stage_mode, depth,
+            skip=skip if stage_mode == "bmc" else 0)
+        stages.append(bld.exec_task(exec_name, "sby", [stage_name], jobserver=True))
+        skip = depth
+
+    return bld.scheduler.add_task(EscalationTask(task.name, bld.task_id(task.name), task.mode,
+        stages, depths, deps=deps))
 
 def verify_multi(bld: Builder, sby_name: str, il_path: str, tasks: Iterable[Task]):
+    if any(task.escalate for task in tasks):
+        raise ValueError("Depth escalation is only supported by verify()")
+
+    prep_task, prep_path = prepare(bld, il_path)
 
     with bld.temp_open(sby_name) as f:
         print("[tasks]", file=f)
@@ -43,11 +169,6 @@ def verify_multi(bld: Builder, sby_name: str, il_path: str, tasks: Iterable[Task
         print("[engines]", file=f)
         for task in tasks:
             print(f"{task.name}:" + " ".join(task.engines), file=f)
-        print("[script]", file=f)
-        print(f"read_ilang {il_path}", file=f)
-        print("prep -top top", file=f)
-        print("[files]", file=f)
-        print(f"{il_path}", file=f)
-
-    bld.exec("sby", "sby", [sby_name])
+        write_design(f, prep_path)
 
+    bld.exec("sby", "sby", ["-j", str(len(tasks)), sby_name], jobserver=True, deps=[prep_task])
@@ -1,181 +1,624 @@
 from nmigen import *
 from nmigen.build import Platform
+from nmigen.back import rtlil
 from nmigen_boards.ulx3s import ULX3S_85F_Platform
-from blip import check, Builder
+from blip import sweep, Builder
+from blip.build import Result
+from blip.task import cxxrtl
 from blip.rtl.dvi.tmds import TMDSEncoder
-from blip.rtl.ecp5.pll import Ecp5Pll, PllClock
-from blip.rtl.ecp5.io import Ecp5OutDdr2
+from blip.rtl.ecp5.clocking import Ecp5Clocking, ClockRequest, plan_clocks
+from blip.rtl.dvi.serializer import TMDSSerializer
+from blip.rtl.cdc import RatioCDC
+from blip.rtl.dvi.timing import VideoTiming
+from blip.rtl.dvi.scaler import LineScaler
+from blip.rtl.dvi.pixel_format import WordUnpacker, PixelExpander, pixel_formats, format_fields, expand_reference
 from blip.util.dvi_timing import get_dvi_mode_cvt_rb, DVIMode, DVITiming
+from blip.model.tmds import encode, decode, encode_frame, reachable
 from nmigen.lib.fifo import AsyncFIFOBuffered
-
-@check(shared=True)
-def dvi_demo(bld: Builder):
-    platform = ULX3S_85F_Platform()
-    dvi_mode = get_dvi_mode_cvt_rb(800, 480)
-
-    class PixelGenerator(Elaboratable):
-        def __init__(self):
-            self.o_packed = Signal(3*10)
-
-        def elaborate(self, platform: Platform) -> Module:
-            m = Module()
-
-            h_data = dvi_mode.h.pixels
-            h_front = h_data + dvi_mode.h.front_porch
-            h_sync = h_front + dvi_mode.h.sync_pulse
-            h_total = h_sync + dvi_mode.h.back_porch
-
-            v_data = dvi_mode.v.pixels
-            v_front = v_data + dvi_mode.v.front_porch
-            v_sync = v_front + dvi_mode.v.sync_pulse
-            v_total = v_sync + dvi_mode.v.back_porch
-
-            h_count = Signal(range(h_total))
-            v_count = Signal(range(v_total))
-            v_step = Signal()
-
-            f_count = Signal(8)
-
-            m.d.sync += h_count.eq(h_count + 1)
-            with m.If(h_count == h_total - 1):
-                m.d.sync += h_count.eq(0)
-                m.d.comb += v_step.eq(1)
-
-            with m.If(v_step):
-                m.d.sync += v_count.eq(v_count + 1)
-                with m.If(v_count == v_total - 1):
-                    m.d.sync += v_count.eq(0)
-                    m.d.sync += f_count.eq(f_count + 1)
-
-            h_de = Signal(1)
-            v_de = Signal(1)
-            h_sn = Signal(1)
-            v_sn = Signal(1)
-
-            m.submodules.tmds_b = tmds_b = TMDSEncoder(True)
-            m.submodules.tmds_g = tmds_g = TMDSEncoder(True)
-            m.submodules.tmds_r = tmds_r = TMDSEncoder(True)
-
-            m.d.sync += [
-                tmds_r.i_data.eq(h_count[1:] + f_count),
-                tmds_g.i_data.eq(v_count - f_count[2:]),
-                tmds_b.i_data.eq(h_count - f_count),
-            ]
-
-            with m.If(h_count < h_data):
-                m.d.comb += h_de.eq(1)
-            with m.Elif((h_count >= h_front) & (h_count < h_sync)):
-                m.d.comb += h_sn.eq(1)
-
-            with m.If(v_count < v_data):
-                m.d.comb += v_de.eq(1)
-            with m.Elif((v_count >= v_front) & (v_count < v_sync)):
-                m.d.comb += v_sn.eq(1)
-
-            de = h_de & v_de
-            m.d.sync += [
-                tmds_b.i_en_data.eq(de),
-                tmds_b.i_hsync.eq(h_sn ^ dvi_mode.h.invert_polarity),
-                tmds_b.i_vsync.eq(v_sn ^ dvi_mode.v.invert_polarity),
-                tmds_g.i_en_data.eq(de),
-                tmds_r.i_en_data.eq(de),
-                self.o_packed[0:10].eq(tmds_b.o_char),
-                self.o_packed[10:20].eq(tmds_g.o_char),
-                self.o_packed[20:30].eq(tmds_r.o_char),
+from typing import Optional, Callable, List, Tuple
+import numpy as np
+import os
+
+class PixelGenerator(Elaboratable):
+    def __init__(self, dvi_mode: DVIMode, pipeline: bool):
+        self.dvi_mode = dvi_mode
+        self.pipeline = pipeline
+        self.o_packed = Signal(3*10)
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        dvi_mode, pipeline = self.dvi_mode, self.pipeline
+
+        h_data = dvi_mode.h.pixels
+        h_front = h_data + dvi_mode.h.front_porch
+        h_sync = h_front + dvi_mode.h.sync_pulse
+        h_total = h_sync + dvi_mode.h.back_porch
+
+        v_data = dvi_mode.v.pixels
+        v_front = v_data + dvi_mode.v.front_porch
+        v_sync = v_front + dvi_mode.v.sync_pulse
+        v_total = v_sync + dvi_mode.v.back_porch
+
+        h_count = Signal(range(h_total))
+        v_count = Signal(range(v_total))
+        v_step = Signal()
+
+        f_count = Signal(8)
+
+        m.d.sync += h_count.eq(h_count + 1)
+        with m.If(h_count == h_total - 1):
+            m.d.sync += h_count.eq(0)
+            m.d.comb += v_step.eq(1)
+
+        with m.If(v_step):
+            m.d.sync += v_count.eq(v_count + 1)
+            with m.If(v_count == v_total - 1):
+                m.d.sync += v_count.eq(0)
+                m.d.sync += f_count.eq(f_count + 1)
+
+        h_de = Signal(1)
+        v_de = Signal(1)
+        h_sn = Signal(1)
+        v_sn = Signal(1)
+
+        m.submodules.tmds_b = tmds_b = TMDSEncoder(pipeline)
+        m.submodules.tmds_g = tmds_g = TMDSEncoder(pipeline)
+        m.submodules.tmds_r = tmds_r = TMDSEncoder(pipeline)
+
+        m.d.sync += [
+            tmds_r.i_data.eq(h_count[1:] + f_count),
+            tmds_g.i_data.eq(v_count - f_count[2:]),
+            tmds_b.i_data.eq(h_count - f_count),
+        ]
+
+        with m.If(h_count < h_data):
+            m.d.comb += h_de.eq(1)
+        with m.Elif((h_count >= h_front) & (h_count < h_sync)):
+            m.d.comb += h_sn.eq(1)
+
+        with m.If(v_count < v_data):
+            m.d.comb += v_de.eq(1)
+        with m.Elif((v_count >= v_front) & (v_count < v_sync)):
+            m.d.comb += v_sn.eq(1)
+
+        de = h_de & v_de
+        m.d.sync += [
+            tmds_b.i_en_data.eq(de),
+            tmds_b.i_hsync.eq(h_sn ^ dvi_mode.h.invert_polarity),
+            tmds_b.i_vsync.eq(v_sn ^ dvi_mode.v.invert_polarity),
+            tmds_g.i_en_data.eq(de),
+            tmds_r.i_en_data.eq(de),
+            self.o_packed[0:10].eq(tmds_b.o_char),
+            self.o_packed[10:20].eq(tmds_g.o_char),
+            self.o_packed[20:30].eq(tmds_r.o_char),
+        ]
+
+        return m
+
+class ScaledPixelGenerator(Elaboratable):
+    def __init__(self, dvi_mode: DVIMode, scale: int, fmt: Optional[str]=None,
+            palette: Optional[List[int]]=None):
+        """Test pattern at `1 / scale` resolution upscaled with `LineScaler`
+
+        fmt: Send the source as 32-bit words of `fmt` pixels, the scaler
+            gets them through `WordUnpacker` and `PixelExpander` expands the
+            scaled pixels. Without it the pattern of `PixelGenerator` is sent
+            at 24 bits per pixel.
+        palette: Colors of palette formats
+
+        The source sends every line when the scaler fetches it, the frame
+        counter `f` advances with the fetch of the first line. Pixels of
+        `fmt` are `x + 4*y - f`, see `demo_format_pattern()`. `o_packed` is
+        the same as in `PixelGenerator`.
+        """
+
+        self.dvi_mode = dvi_mode
+        self.scale = scale
+        self.fmt = fmt
+        self.palette = palette
+        self.o_packed = Signal(3*10)
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        bits = pixel_formats[self.fmt] if self.fmt else 24
+        m.submodules.timing = timing = VideoTiming([self.dvi_mode])
+        m.submodules.scaler = scaler = LineScaler(self.dvi_mode, self.scale, width=bits)
+        m.d.comb += [
+            scaler.i_h.eq(timing.o_h),
+            scaler.i_v.eq(timing.o_v),
+        ]
+
+        # Source pattern in source pixel coordinates
+        f_count = Signal(8)
+        src_x = Signal(range(scaler.src_width + 1))
+        src_y = Signal.like(scaler.o_src_line)
+        with m.If(scaler.o_src_start):
+            with m.If(scaler.o_src_line == 0):
+                m.d.sync += f_count.eq(f_count + 1)
+
+        if self.fmt:
+            m.submodules.unpacker = unpacker = WordUnpacker(self.fmt)
+            step = unpacker.pixels_per_word
+            if scaler.src_width % step != 0:
+                raise ValueError(f"Source lines are not whole words of {self.fmt}")
+
+            sending = Signal()
+            with m.If(scaler.o_src_start):
+                m.d.sync += [src_x.eq(0), src_y.eq(scaler.o_src_line), sending.eq(1)]
+            with m.Elif(sending & unpacker.o_ready):
+                m.d.sync += src_x.eq(src_x + step)
+                with m.If(src_x == scaler.src_width - step):
+                    m.d.sync += sending.eq(0)
+
+            pixels = [Signal(bits, name=f"src_pixel{n}") for n in range(step)]
+            m.d.comb += [p.eq(src_x + n + Cat(C(0, 2), src_y) - f_count) for n, p in enumerate(pixels)]
+            m.d.comb += [
+                unpacker.i_valid.eq(sending),
+                unpacker.i_word.eq(Cat(*pixels)),
+                unpacker.i_ready.eq(scaler.o_src_ready),
+                scaler.i_src_valid.eq(unpacker.o_valid),
+                scaler.i_src_data.eq(unpacker.o_pixel),
             ]
 
-            return m
-
-    class TmdsShifter(Elaboratable):
-        def __init__(self):
-            self.i_packed = Signal(3*10)
-            self.o_read = Signal()
-            self.o_data = Signal(3)
-            self.o_clk = Signal()
-
-        def elaborate(self, platform: Platform) -> Module:
-            m = Module()
-
-            phase = Signal(range(5))
-            read = Signal()
-            m.d.sync += phase.eq(Mux(read, 0, phase + 1))
-            m.d.comb += read.eq(phase == 4)
+            m.submodules.expander = expander = PixelExpander(self.fmt, self.palette)
+            m.d.comb += expander.i_pixel.eq(scaler.o_pixel)
+            latency = scaler.latency + expander.latency
+            pixel = Cat(expander.o_b, expander.o_g, expander.o_r)
+        else:
+            with m.If(scaler.o_src_start):
+                m.d.sync += [src_x.eq(0), src_y.eq(scaler.o_src_line)]
+            with m.Elif(scaler.o_src_ready):
+                m.d.sync += src_x.eq(src_x + 1)
 
-            m.d.comb += self.o_read.eq(read)
-
-            pairs = [
-                (self.i_packed[0:10], self.o_data[0]),
-                (self.i_packed[10:20], self.o_data[1]),
-                (self.i_packed[20:30], self.o_data[2]),
-                (C(0b0000011111, 10), self.o_clk),
+            m.d.comb += [
+                scaler.i_src_valid.eq(scaler.o_src_ready),
+                scaler.i_src_data.eq(Cat(
+                    (src_x - f_count)[:8],
+                    (src_y - Cat(f_count[2:], C(0, 2)))[:8],
+                    (src_x[1:] + f_count)[:8])),
             ]
-
-            for ix,(i,o) in enumerate(pairs):
-                ddr = Ecp5OutDdr2()
-                reg = Signal(10, name=f"reg{ix}")
-                m.submodules[f"ddr{ix}"] = ddr
-                with m.If(read):
-                    m.d.sync += reg.eq(i)
-                m.d.comb += [
-                    ddr.i.eq(i.word_select(phase, 2)),
-                    o.eq(ddr.o),
-                ]
-
-            return m
-
-    class Top(Elaboratable):
-        def elaborate(self, platform: Platform) -> Module:
-            m = Module()
-
-            # Setup two clock domains
-            m.submodules.pll = pll = Ecp5Pll(platform.default_clk_frequency, [
-                PllClock(dvi_mode.pixel_clock * 5, error_weight=100.0, tolerance=0.01), # TMDS 2 bits
-                PllClock(dvi_mode.pixel_clock, tolerance=(1e-20, 1.0)), # Pixel clock
-            ])
-
-            m.domains.tmds_2bit = ClockDomain("tmds_2bit")
-            m.domains.pixel = ClockDomain("pixel")
+            latency = scaler.latency
+            pixel = scaler.o_pixel
+
+        # Delay the timing to match the scaled pixels
+        de, hsync, vsync = timing.o_de, timing.o_hsync, timing.o_vsync
+        for n in range(latency):
+            delayed = [Signal(name=f"{name}_d{n}") for name in ["de", "hsync", "vsync"]]
+            m.d.sync += [d.eq(v) for d, v in zip(delayed, [de, hsync, vsync])]
+            de, hsync, vsync = delayed
+
+        m.submodules.tmds_b = tmds_b = TMDSEncoder()
+        m.submodules.tmds_g = tmds_g = TMDSEncoder()
+        m.submodules.tmds_r = tmds_r = TMDSEncoder()
+
+        m.d.sync += [
+            tmds_b.i_data.eq(pixel[0:8]),
+            tmds_g.i_data.eq(pixel[8:16]),
+            tmds_r.i_data.eq(pixel[16:24]),
+            tmds_b.i_en_data.eq(de),
+            tmds_b.i_hsync.eq(hsync),
+            tmds_b.i_vsync.eq(vsync),
+            tmds_g.i_en_data.eq(de),
+            tmds_r.i_en_data.eq(de),
+            self.o_packed.eq(Cat(tmds_b.o_char, tmds_g.o_char, tmds_r.o_char)),
+        ]
+
+        return m
+
+class DviPipeline(Elaboratable):
+    """Pixel generator and TMDS shifter in `pixel` and `tmds_2bit` domains
+
+    cdc: Crossing from `pixel` to `tmds_2bit`, "fifo" for any clocks,
+        "ratio" for a pixel clock of exactly 1/5 of the TMDS clock from the
+        same PLL (see `RatioCDC`), "none" for a plain register
+    pixel_gen: Generator to use instead of `PixelGenerator`, must have a
+        30-bit `o_packed` output like it
+    """
+
+    def __init__(self, dvi_mode: DVIMode, pipeline: bool, cdc: str="fifo",
+            pixel_gen: Optional[Elaboratable]=None):
+        if cdc not in ("fifo", "ratio", "none"):
+            raise ValueError(f"Unknown clock domain crossing: {cdc}")
+
+        self.dvi_mode = dvi_mode
+        self.pipeline = pipeline
+        self.cdc = cdc
+        self.pixel_gen = pixel_gen
+        self.o_data = Signal(3)
+        self.o_clk = Signal()
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        pixel_gen = self.pixel_gen or PixelGenerator(self.dvi_mode, self.pipeline)
+
+        if self.cdc == "fifo":
+            m.submodules.fifo = fifo = \
+                AsyncFIFOBuffered(width=3*10, depth=4, r_domain="tmds_2bit", w_domain="pixel")
+
+            m.submodules.pixel_gen = pixel_gen = \
+                DomainRenamer("pixel")(EnableInserter(fifo.w_rdy)(pixel_gen))
+        else:
+            m.submodules.pixel_gen = pixel_gen = \
+                DomainRenamer("pixel")(pixel_gen)
+
+        m.submodules.tmds_shifter = tmds_shifter = \
+            DomainRenamer({ "sclk": "tmds_2bit" })(TMDSSerializer(chars=1, gearing=2))
+
+        m.d.comb += [
+            self.o_data.eq(tmds_shifter.o_data),
+            self.o_clk.eq(tmds_shifter.o_clk),
+        ]
+
+        if self.cdc == "fifo":
+            m.d.comb += [
+                tmds_shifter.i_packed.eq(fifo.r_data),
+                fifo.r_en.eq(tmds_shifter.o_read),
+                fifo.w_data.eq(pixel_gen.o_packed),
+                fifo.w_en.eq(1),
+            ]
+        elif self.cdc == "ratio":
+            m.submodules.cdc = cdc = RatioCDC(3*10, r_domain="tmds_2bit", w_domain="pixel")
             m.d.comb += [
-                pll.i_clk.eq(ClockSignal()),
-                ClockSignal("tmds_2bit").eq(pll.o_clk[0]),
-                ClockSignal("pixel").eq(pll.o_clk[1]),
+                tmds_shifter.i_packed.eq(cdc.r_data),
+                cdc.r_en.eq(tmds_shifter.o_read),
+                cdc.w_data.eq(pixel_gen.o_packed),
+                cdc.w_en.eq(1),
             ]
+        else:
+            m.d.pixel += tmds_shifter.i_packed.eq(pixel_gen.o_packed),
+
+        return m
+
+def demo_palette(fmt: str) -> Optional[List[int]]:
+    """Distinct colors for every pixel of palette formats, None for direct color formats"""
+    if fmt in format_fields:
+        return None
+    return [(n * 0x3b1d47 + 0x102030) & 0xffffff for n in range(1 << pixel_formats[fmt])]
+
+def create_pixel_gen(dvi_mode: DVIMode, scale: int, fmt: Optional[str]) -> Optional[Elaboratable]:
+    """`ScaledPixelGenerator` if scaling or a pixel format is used, otherwise the default generator"""
+    if scale == 1 and not fmt:
+        return None
+    return ScaledPixelGenerator(dvi_mode, scale, fmt, demo_palette(fmt) if fmt else None)
+
+class Top(Elaboratable):
+    def __init__(self, dvi_mode: DVIMode, pipeline: bool, cdc: str="fifo", scale: int=1,
+            fmt: Optional[str]=None):
+        """DVI output demo
+
+        scale: Send a test pattern upscaled with `LineScaler` by this factor
+        fmt: Send the test pattern as words of this pixel format
+        """
+
+        self.dvi_mode = dvi_mode
+        self.pipeline = pipeline
+        self.cdc = cdc
+        self.scale = scale
+        self.fmt = fmt
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        dvi_mode = self.dvi_mode
+
+        # The FIFO lets the pixel clock run faster than needed, the ratio
+        # crossing needs it to be exactly 1/5 of the TMDS clock
+        tmds = ClockRequest("tmds_2bit", dvi_mode.pixel_clock * 5, tolerance=0.01, error_weight=100.0)
+        if self.cdc == "ratio":
+            pixel = ClockRequest("pixel", ratio=("tmds_2bit", 0.2))
+        else:
+            pixel = ClockRequest("pixel", dvi_mode.pixel_clock, tolerance=(1e-20, 1.0))
+
+        plan = plan_clocks(platform.default_clk_frequency, [tmds, pixel])
+        m.submodules.clocks = clocks = Ecp5Clocking(plan)
+        m.d.comb += clocks.i_clk.eq(ClockSignal())
+
+        m.submodules.dvi = dvi = DviPipeline(dvi_mode, self.pipeline, self.cdc,
+            create_pixel_gen(dvi_mode, self.scale, self.fmt))
+
+        hdmi = platform.request("hdmi")
+        m.d.comb += [
+            hdmi.d.eq(dvi.o_data),
+            hdmi.clk.eq(dvi.o_clk),
+        ]
+
+        return m
+
+class SimTop(Elaboratable):
+    """`Top` with the PLL replaced by clock inputs for simulation
+
+    The DDR outputs use their behavioral models, `o_tmds` contains the three
+    data lanes followed by the clock lane."""
+
+    def __init__(self, dvi_mode: DVIMode, pipeline: bool, cdc: str="fifo", scale: int=1,
+            fmt: Optional[str]=None):
+        self.dvi_mode = dvi_mode
+        self.pipeline = pipeline
+        self.cdc = cdc
+        self.scale = scale
+        self.fmt = fmt
+        self.tmds_2bit = ClockDomain("tmds_2bit")
+        self.pixel = ClockDomain("pixel")
+        self.o_tmds = Signal(4)
+
+    def ports(self):
+        return [self.tmds_2bit.clk, self.tmds_2bit.rst, self.pixel.clk, self.pixel.rst, self.o_tmds]
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        m.domains.tmds_2bit = self.tmds_2bit
+        m.domains.pixel = self.pixel
+
+        m.submodules.dvi = dvi = DviPipeline(self.dvi_mode, self.pipeline, self.cdc,
+            create_pixel_gen(self.dvi_mode, self.scale, self.fmt))
+        m.d.comb += self.o_tmds.eq(Cat(dvi.o_data, dvi.o_clk))
+
+        return m
+
+@sweep(shared=True,
+    resolution={"640x480": (640, 480), "800x480": (800, 480), "1024x600": (1024, 600)},
+    pipeline=[False, True],
+    cdc=["fifo", "ratio"])
+def dvi_demo(bld: Builder, resolution, pipeline: bool, cdc: str):
+    platform = ULX3S_85F_Platform()
+    dvi_mode = get_dvi_mode_cvt_rb(*resolution)
 
-            use_fifo = True
-
-            if use_fifo:
-                m.submodules.fifo = fifo = \
-                    AsyncFIFOBuffered(width=3*10, depth=4, r_domain="tmds_2bit", w_domain="pixel")
-
-                m.submodules.pixel_gen = pixel_gen = \
-                    DomainRenamer("pixel")(EnableInserter(fifo.w_rdy)(PixelGenerator()))
-            else:
-                m.submodules.pixel_gen = pixel_gen = \
-                    DomainRenamer("pixel")(PixelGenerator())
-
-            m.submodules.tmds_shifter = tmds_shifter = \
-                DomainRenamer("tmds_2bit")(TmdsShifter())
-
-            hdmi = platform.request("hdmi")
-
-            if use_fifo:
-                m.d.comb += [
-                    tmds_shifter.i_packed.eq(fifo.r_data),
-                    hdmi.d.eq(tmds_shifter.o_data),
-                    hdmi.clk.eq(tmds_shifter.o_clk),
-                    fifo.r_en.eq(tmds_shifter.o_read),
-                    fifo.w_data.eq(pixel_gen.o_packed),
-                    fifo.w_en.eq(1),
-                ]
-            else:
-                m.d.pixel += tmds_shifter.i_packed.eq(pixel_gen.o_packed),
-                m.d.comb += [
-                    hdmi.d.eq(tmds_shifter.o_data),
-                    hdmi.clk.eq(tmds_shifter.o_clk),
-                ]
-
-            return m
-
-    top = Top()
-    plan = platform.build(top, do_build=False)
-    bld.exec_plan("synth", plan)
+    top = Top(dvi_mode, pipeline, cdc)
+    bld.build("synth", platform, top, threads=4)
+
+@sweep(scale=[2, 4], fmt={"none": None, "rgb332": "rgb332", "pal4": "pal4"})
+def dvi_demo_scaled(bld: Builder, scale: int, fmt: Optional[str]):
+    platform = ULX3S_85F_Platform()
+    dvi_mode = get_dvi_mode_cvt_rb(640, 480)
+
+    top = Top(dvi_mode, False, "fifo", scale, fmt)
+    bld.build("synth", platform, top, threads=4)
+
+# Runs the TMDS clock for `argv[1]` cycles with the pixel clock at 1/5 of it,
+# writes the outputs of both half-cycles of every TMDS clock as a byte.
+sim_testbench = """
+#include <stdio.h>
+#include <stdlib.h>
+#include <chrono>
+#include "design.h"
+
+int main(int argc, char **argv)
+{
+    long cycles = atol(argv[1]);
+    FILE *out = fopen(argv[2], "wb");
+    if (!out) return 1;
+
+    cxxrtl_design::p_top top;
+    auto begin = std::chrono::steady_clock::now();
+
+    for (long cycle = 0; cycle < cycles; cycle++) {
+        bool rst = cycle < 20;
+        int half = (int)(cycle % 5) * 2;
+        top.p_tmds__2bit__rst.set<bool>(rst);
+        top.p_pixel__rst.set<bool>(rst);
+
+        top.p_tmds__2bit__clk.set<bool>(true);
+        top.p_pixel__clk.set<bool>(half < 5);
+        top.step();
+        unsigned first = top.p_o__tmds.get<unsigned>();
+
+        top.p_tmds__2bit__clk.set<bool>(false);
+        top.p_pixel__clk.set<bool>(half + 1 < 5);
+        top.step();
+        unsigned second = top.p_o__tmds.get<unsigned>();
+
+        fputc(first | second << 4, out);
+    }
+
+    double seconds = std::chrono::duration<double>(std::chrono::steady_clock::now() - begin).count();
+    printf("cycles_per_second %f\\n", (double)cycles / seconds);
+    fclose(out);
+    return 0;
+}
+"""
+
+def write_ppm(path: str, rgb: np.ndarray):
+    with open(path, "wb") as f:
+        f.write(f"P6\n{rgb.shape[1]} {rgb.shape[0]}\n255\n".encode("ascii"))
+        f.write(np.ascontiguousarray(rgb, dtype=np.uint8).tobytes())
+
+def demo_pattern(width: int, height: int, f: int) -> np.ndarray:
+    """`(height, width, 3)` RGB test pattern of `PixelGenerator` at frame counter `f`"""
+    x = np.arange(width)[None, :]
+    y = np.arange(height)[:, None]
+    return np.stack(np.broadcast_arrays(
+        ((x >> 1) + f) & 0xff,
+        (y - (f >> 2)) & 0xff,
+        (x - f) & 0xff), axis=2).astype(np.uint8)
+
+def demo_format_pattern(fmt: str, width: int, height: int, f: int) -> np.ndarray:
+    """RGB test pattern of `ScaledPixelGenerator` sending `fmt` pixels before scaling"""
+    x = np.arange(width)[None, :]
+    y = np.arange(height)[:, None]
+    pixels = (x + 4 * y - f) & ((1 << pixel_formats[fmt]) - 1)
+    values, index = np.unique(pixels, return_inverse=True)
+    palette = demo_palette(fmt)
+    colors = np.array([expand_reference(fmt, int(p), palette) for p in values], dtype=np.uint8)
+    return colors[index.reshape(pixels.shape)]
+
+def compare_frames(bits: np.ndarray, frames_dir: str, dvi_mode: DVIMode, frames: int,
+        reference: Callable[[int], np.ndarray],
+        counter: Optional[Callable[[Tuple[int, int, int]], int]]=None) -> Result:
+    """Decode TMDS bit streams and compare frames against `blip.model.tmds`
+
+    bits: `(4, count)` bits of the three data lanes and the clock lane
+    reference: Expected RGB frame for the frame counter `f`
+    counter: Frame counter of the `(r, g, b)` first pixel of a frame, by
+        default the blue is `-f` like in `PixelGenerator`
+    """
+
+    h, v = dvi_mode.h, dvi_mode.v
+    h_total = h.pixels + h.front_porch + h.sync_pulse + h.back_porch
+    v_total = v.pixels + v.front_porch + v.sync_pulse + v.back_porch
+    frame_size = h_total * v_total
+
+    # Characters are sent LSB first, align them to the clock lane
+    clk_pattern = np.array([1, 1, 1, 1, 1, 0, 0, 0, 0, 0], dtype=np.uint8)
+    skip = 1000
+    for offset in range(10):
+        window = bits[3, skip + offset:skip + offset + 1000]
+        if np.array_equal(window.reshape(-1, 10), np.broadcast_to(clk_pattern, (100, 10))):
+            break
+    else:
+        return Result(ok=False, info="Could not align to the TMDS clock lane")
+    start = skip + offset
+    count = (bits.shape[1] - start) // 10
+    weights = (1 << np.arange(10)).astype(np.uint16)
+    chars = bits[:3, start:start + count * 10].reshape(3, count, 10).astype(np.uint16) @ weights
+
+    data, en_data, _, vsync = decode(chars)
+
+    # First frame starts with the first data enable after a vertical sync,
+    # data characters don't carry the sync signals
+    vsync_active = np.flatnonzero((vsync[0] ^ v.invert_polarity) & (en_data[0] == 0))
+    if len(vsync_active) == 0:
+        return Result(ok=False, info="No vertical sync found")
+    enabled = np.flatnonzero(en_data[0, vsync_active[0]:])
+    if len(enabled) == 0:
+        return Result(ok=False, info="No data after vertical sync")
+    begin = vsync_active[0] + enabled[0]
+
+    num_frames = min(frames, (count - begin) // frame_size)
+    if num_frames == 0:
+        return Result(ok=False, info="No complete frames simulated")
+
+    # DC bias at the start of the first frame is not known, find the state
+    # that reproduces its active pixels, with short lines several states
+    # can match the first line
+    active = (slice(None), slice(0, v.pixels), slice(0, h.pixels))
+    first = chars[:, begin:begin + frame_size].reshape(3, v_total, h_total)[active].reshape(3, -1)
+    first_data = data[:, begin:begin + frame_size].reshape(3, v_total, h_total)[active].reshape(3, -1)
+    biases = []
+    for c in range(3):
+        for bias in reachable:
+            encoded, _ = encode(first_data[c], dc_bias=int(bias))
+            if np.array_equal(encoded, first[c]):
+                biases.append(int(bias))
+                break
+        else:
+            return Result(ok=False, info=f"Channel {c} does not match any DC bias state")
+
+    for n in range(num_frames):
+        frame = chars[:, begin + n * frame_size:begin + (n + 1) * frame_size].reshape(3, v_total, h_total)
+        first = tuple(int(c) for c in data[::-1, begin + n * frame_size])
+        rgb = reference(counter(first) if counter else -first[2] & 0xff)
+
+        frame_data, _, _, _ = decode(frame)
+        write_ppm(os.path.join(frames_dir, f"frame{n}.ppm"),
+            frame_data[::-1, :v.pixels, :h.pixels].transpose(1, 2, 0))
+
+        ref, biases = encode_frame(rgb, dvi_mode, biases)
+        mismatch = np.argwhere(frame != ref)
+        if len(mismatch) > 0:
+            c, row, col = mismatch[0]
+            return Result(ok=False, info=f"Frame {n}: {len(mismatch)} mismatching characters, "
+                f"first in channel {c} at ({col}, {row})")
+
+    return Result(ok=True, info=f"{num_frames} frames", metrics={ "frames": num_frames })
+
+def check_sim_frames(out_path: str, stdout_path: str, frames_dir: str, dvi_mode: DVIMode, frames: int):
+    """Decode the simulated TMDS outputs and compare frames against `blip.model.tmds`"""
+
+    # Split the bytes into per-lane bit streams, first half-cycle first
+    raw = np.fromfile(out_path, dtype=np.uint8)
+    lanes = np.stack([raw >> np.uint8(n) & 1 for n in range(8)])
+    bits = np.stack([lanes[0:4], lanes[4:8]], axis=2).reshape(4, -1)
+
+    result = compare_frames(bits, frames_dir, dvi_mode, frames,
+        lambda f: demo_pattern(dvi_mode.h.pixels, dvi_mode.v.pixels, f))
+    if not result.ok:
+        return result
+
+    with open(stdout_path) as f:
+        cycles_per_second = float(f.read().split()[-1])
+
+    result.info += f", {cycles_per_second / 1e6:.2f}M TMDS cycles/s"
+    result.metrics["tmds_cycles_per_second"] = cycles_per_second
+    return result
+
+def check_sim_pipeline(frames_dir: str, scale: int, cdc: str, fmt: Optional[str]=None, frames: int=2):
+    """Simulate `ScaledPixelGenerator` through `DviPipeline` and the DDR
+    output models in pysim at a small mode and compare the decoded frames
+    against `blip.model.tmds`"""
+    from nmigen.back.pysim import Simulator, Delay
+
+    dvi_mode = DVIMode(1.0, 60.0, DVITiming(3, 8*scale, 2, 3, False), DVITiming(1, 4*scale, 1, 1, True))
+    h, v = dvi_mode.h, dvi_mode.v
+    frame_size = (h.pixels + h.front_porch + h.sync_pulse + h.back_porch) \
+        * (v.pixels + v.front_porch + v.sync_pulse + v.back_porch)
+
+    top = SimTop(dvi_mode, False, cdc, scale, fmt)
+    sim = Simulator(top)
+    period = 1e-6
+    sim.add_clock(period, domain="tmds_2bit")
+    sim.add_clock(period * 5, domain="pixel")
+
+    # Sample both half-cycles of every TMDS clock, the first frame is
+    # partial and the second one is sent before the source is fetched
+    cycles = (frames + 3) * frame_size * 5
+    samples = []
+    def sample():
+        yield Delay(period * 3 / 4)
+        for _ in range(2 * cycles):
+            samples.append((yield top.o_tmds))
+            yield Delay(period / 2)
+
+    sim.add_process(sample)
+    sim.run()
+
+    samples = np.array(samples, dtype=np.uint8)
+    bits = np.stack([samples >> np.uint8(n) & 1 for n in range(4)])
+
+    def pattern(f: int) -> np.ndarray:
+        if fmt:
+            return demo_format_pattern(fmt, h.pixels // scale, v.pixels // scale, f)
+        return demo_pattern(h.pixels // scale, v.pixels // scale, f)
+
+    def reference(f: int) -> np.ndarray:
+        return pattern(f).repeat(scale, axis=0).repeat(scale, axis=1)
+
+    # The first pixel is `-f` truncated to the pixel, any matching counter
+    # gives the same frame as the palette colors are distinct
+    def counter(rgb: Tuple[int, int, int]) -> int:
+        return next((f for f in range(256)
+            if tuple(demo_format_pattern(fmt, 1, 1, f)[0, 0]) == rgb), 0)
+
+    return compare_frames(bits, frames_dir, dvi_mode, frames, reference, counter if fmt else None)
+
+@sweep(pipeline=[False, True], cdc=["fifo", "ratio"])
+def sim(bld: Builder, pipeline: bool, cdc: str):
+    dvi_mode = get_dvi_mode_cvt_rb(640, 480)
+    frames = 2
+
+    top = SimTop(dvi_mode, pipeline, cdc)
+    with bld.temp_open("sim.il") as f:
+        f.write(rtlil.convert(top, ports=top.ports()))
+    with bld.temp_open("sim.cpp") as f:
+        f.write(sim_testbench)
+
+    # One partial frame to find the frame start, 5 TMDS cycles per pixel
+    h, v = dvi_mode.h, dvi_mode.v
+    frame_size = (h.pixels + h.front_porch + h.sync_pulse + h.back_porch) \
+        * (v.pixels + v.front_porch + v.sync_pulse + v.back_porch)
+    cycles = (frames + 1) * frame_size * 5 + 1000
+
+    compile_task = cxxrtl.build_sim(bld, "sim.il", "sim.cpp")
+    run_task = bld.exec("run", os.path.abspath(bld.temp_file("sim")), [str(cycles), "tmds.bin"], deps=[compile_task])
+    bld.python("frames", check_sim_frames,
+        bld.temp_file("tmds.bin"), bld.temp_file("run.out"), bld.prefix_path, dvi_mode, frames,
+        deps=[run_task])
+
+@sweep(scale=[2, 3], cdc=["fifo", "ratio"])
+def sim_scaled(bld: Builder, scale: int, cdc: str):
+    bld.python("sim", check_sim_pipeline, bld.prefix_path, scale, cdc)
+
+@sweep(fmt=["rgb565", "rgb332", "pal8", "pal4"], scale=[1, 2])
+def sim_format(bld: Builder, fmt: str, scale: int):
+    bld.python("sim", check_sim_pipeline, bld.prefix_path, scale, "fifo", fmt)
@@ -0,0 +1,152 @@
+from nmigen import *
+from nmigen.build import Platform
+from nmigen_boards.ulx3s import ULX3S_85F_Platform
+from blip import sweep, Builder
+from blip.rtl.dvi.tmds import TMDSEncoderN
+from blip.rtl.ecp5.pll import Ecp5Pll, PllClock
+from blip.rtl.dvi.serializer import TMDSSerializer, Ecp5SerializerClocks
+from blip.util.dvi_timing import cvt_rb_timings, DVIMode
+from nmigen.lib.fifo import AsyncFIFOBuffered
+
+class PixelGenerator(Elaboratable):
+    """Test pattern generator producing `n` pixels per clock
+
+    `o_packed` contains the blue, green and red characters of all lanes,
+    each channel as `10*n` bits in transmission order."""
+
+    def __init__(self, dvi_mode: DVIMode, n: int, speculate: bool):
+        self.dvi_mode = dvi_mode
+        self.n = n
+        self.speculate = speculate
+        self.o_packed = Signal(3*10*n)
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        dvi_mode, n = self.dvi_mode, self.n
+
+        h_data = dvi_mode.h.pixels
+        h_front = h_data + dvi_mode.h.front_porch
+        h_sync = h_front + dvi_mode.h.sync_pulse
+        h_total = h_sync + dvi_mode.h.back_porch
+
+        v_data = dvi_mode.v.pixels
+        v_front = v_data + dvi_mode.v.front_porch
+        v_sync = v_front + dvi_mode.v.sync_pulse
+        v_total = v_sync + dvi_mode.v.back_porch
+
+        assert h_total % n == 0, "Line length must be a multiple of pixels per clock"
+
+        h_count = Signal(range(h_total))
+        v_count = Signal(range(v_total))
+        v_step = Signal()
+
+        f_count = Signal(8)
+
+        m.d.sync += h_count.eq(h_count + n)
+        with m.If(h_count == h_total - n):
+            m.d.sync += h_count.eq(0)
+            m.d.comb += v_step.eq(1)
+
+        with m.If(v_step):
+            m.d.sync += v_count.eq(v_count + 1)
+            with m.If(v_count == v_total - 1):
+                m.d.sync += v_count.eq(0)
+                m.d.sync += f_count.eq(f_count + 1)
+
+        v_de = Signal(1)
+        v_sn = Signal(1)
+        with m.If(v_count < v_data):
+            m.d.comb += v_de.eq(1)
+        with m.Elif((v_count >= v_front) & (v_count < v_sync)):
+            m.d.comb += v_sn.eq(1)
+
+        m.submodules.tmds_b = tmds_b = TMDSEncoderN(n, self.speculate)
+        m.submodules.tmds_g = tmds_g = TMDSEncoderN(n, self.speculate)
+        m.submodules.tmds_r = tmds_r = TMDSEncoderN(n, self.speculate)
+
+        for k in range(n):
+            h = h_count + k
+            h_de = Signal(1, name=f"h_de{k}")
+            h_sn = Signal(1, name=f"h_sn{k}")
+
+            with m.If(h < h_data):
+                m.d.comb += h_de.eq(1)
+            with m.Elif((h >= h_front) & (h < h_sync)):
+                m.d.comb += h_sn.eq(1)
+
+            de = h_de & v_de
+            m.d.sync += [
+                tmds_r.i_data.word_select(k, 8).eq(h[1:] + f_count),
+                tmds_g.i_data.word_select(k, 8).eq(v_count - f_count[2:]),
+                tmds_b.i_data.word_select(k, 8).eq(h - f_count),
+                tmds_b.i_en_data[k].eq(de),
+                tmds_b.i_hsync[k].eq(h_sn ^ dvi_mode.h.invert_polarity),
+                tmds_b.i_vsync[k].eq(v_sn ^ dvi_mode.v.invert_polarity),
+                tmds_g.i_en_data[k].eq(de),
+                tmds_r.i_en_data[k].eq(de),
+            ]
+
+        m.d.sync += self.o_packed.eq(Cat(tmds_b.o_char, tmds_g.o_char, tmds_r.o_char))
+
+        return m
+
+class Top(Elaboratable):
+    def __init__(self, dvi_mode: DVIMode, n: int, speculate: bool):
+        self.dvi_mode = dvi_mode
+        self.n = n
+        self.speculate = speculate
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        dvi_mode, n = self.dvi_mode, self.n
+
+        m.submodules.pll = pll = Ecp5Pll(platform.default_clk_frequency, [
+            PllClock(dvi_mode.pixel_clock * 5, tolerance=0.01), # TMDS 2 bits per clock
+            PllClock(dvi_mode.pixel_clock / n, tolerance=(1e-20, 0.1)), # `n` pixels per clock
+        ])
+
+        m.submodules.clocks = clocks = Ecp5SerializerClocks(pll.config.clko_hzs[0], gearing=4)
+
+        m.domains.tmds_eclk = ClockDomain("tmds_eclk")
+        m.domains.tmds_sclk = ClockDomain("tmds_sclk")
+        m.domains.pixel = ClockDomain("pixel")
+        m.d.comb += [
+            pll.i_clk.eq(ClockSignal()),
+            clocks.i_clk.eq(pll.o_clk[0]),
+            ClockSignal("tmds_eclk").eq(clocks.o_eclk),
+            ClockSignal("tmds_sclk").eq(clocks.o_sclk),
+            ClockSignal("pixel").eq(pll.o_clk[1]),
+        ]
+
+        m.submodules.fifo = fifo = \
+            AsyncFIFOBuffered(width=3*10*n, depth=4, r_domain="tmds_sclk", w_domain="pixel")
+
+        m.submodules.pixel_gen = pixel_gen = \
+            DomainRenamer("pixel")(EnableInserter(fifo.w_rdy)(PixelGenerator(dvi_mode, n, self.speculate)))
+
+        m.submodules.tmds_shifter = tmds_shifter = \
+            DomainRenamer({ "eclk": "tmds_eclk", "sclk": "tmds_sclk" })(TMDSSerializer(chars=n, gearing=4))
+
+        hdmi = platform.request("hdmi")
+
+        m.d.comb += [
+            tmds_shifter.i_packed.eq(fifo.r_data),
+            hdmi.d.eq(tmds_shifter.o_data),
+            hdmi.clk.eq(tmds_shifter.o_clk),
+            fifo.r_en.eq(tmds_shifter.o_read),
+            fifo.w_data.eq(pixel_gen.o_packed),
+            fifo.w_en.eq(1),
+        ]
+
+        return m
+
+# 1080p at 60Hz would need a 692.5MHz (666.6MHz with CVT-RB v2) edge clock
+# which is outside of the PLL output range, use the 30Hz reduced blanking
+# modes instead.
+@sweep(shared=True, n=[2, 4], speculate=[False, True], timing=cvt_rb_timings)
+def synth(bld: Builder, n: int, speculate: bool, timing):
+    platform = ULX3S_85F_Platform()
+    dvi_mode = timing(1920, 1080, 30)
+
+    top = Top(dvi_mode, n, speculate)
+    bld.build("synth", platform, top, threads=4)
@@ -3,8 +3,8 @@ from nmigen.build import Platform
 from nmigen_boards.ulx3s import ULX3S_85F_Platform
 from blip import check, Builder
 from blip.rtl.dvi.tmds import TMDSEncoder
-from blip.rtl.ecp5.pll import Ecp5Pll, PllClock, MHz
-from blip.rtl.ecp5.io import Ecp5OutDdr2, Ecp5EdgeClockSync, Ecp5ClockDiv2
+from blip.rtl.ecp5.clocking import Ecp5Clocking, ClockRequest, plan_clocks
+from blip.rtl.dvi.serializer import TMDSSerializer
 from blip.util.dvi_timing import get_dvi_mode_cvt_rb, DVIMode, DVITiming
 from nmigen.lib.fifo import AsyncFIFOBuffered
 
@@ -86,88 +86,20 @@ def synth(bld: Builder):
 
             return m
 
-    class TmdsShifter(Elaboratable):
-        def __init__(self):
-            self.i_packed = Signal(3*10)
-            self.o_read = Signal()
-            self.o_data = Signal(3)
-            self.o_clk = Signal()
-
-        def elaborate(self, platform: Platform) -> Module:
-            m = Module()
-
-            r_packed = Signal(3*10)
-
-            pairs = [
-                (r_packed[0:10], self.o_data[0]),
-                (r_packed[10:20], self.o_data[1]),
-                (r_packed[20:30], self.o_data[2]),
-                (C(0b0000011111, 10), self.o_clk),
-            ]
-
-            # (0) 0123 4567 89?? ????
-            # (1) 4567 89ab cdef ghij (read; read_hi)
-            # (2) 89ab cdef ghij ????
-            # (3) cdef ghij ???? ????
-            # (4) ghij 0123 4567 89?? (read; read_lo)
-
-            read_cycle = Signal(5, reset=1)
-            read_hi = Signal()
-            read_lo = Signal()
-
-            m.d.sclk += [
-                read_cycle.eq(Cat(read_cycle[1:], read_cycle[:1])),
-                read_hi.eq(read_cycle[1]),
-                read_lo.eq(read_cycle[4]),
-            ]
-            with m.If(read_cycle[1] | read_cycle[4]):
-                m.d.comb += self.o_read.eq(1)
-                m.d.sclk += r_packed.eq(self.i_packed)
-
-            for ix,(i,o) in enumerate(pairs):
-                ddr = DomainRenamer("eclk")(Ecp5OutDdr2())
-                reg = Signal(16, name=f"reg{ix}")
-                m.submodules[f"ddr{ix}"] = ddr
-
-                m.d.sclk += reg.eq(reg[4:])
-                with m.If(read_lo):
-                    m.d.sclk += reg[6:16].eq(i)
-                with m.If(read_hi):
-                    m.d.sclk += reg[4:14].eq(i)
-
-                m.d.comb += [
-                    ddr.i.eq(Mux(ClockSignal("sclk"), reg[2:4], reg[0:2])),
-                    o.eq(ddr.o),
-                ]
-
-            return m
-
     class Top(Elaboratable):
         def elaborate(self, platform: Platform) -> Module:
             m = Module()
 
-            m.submodules.plla = plla = Ecp5Pll(platform.default_clk_frequency, [
-                PllClock(100.0*MHz, error_weight=10.0), # 100MHz helper clock for accurate shift clock
-                PllClock(dvi_mode.pixel_clock, tolerance=(1e-20, 0.1)), # Pixel clock
+            # The planner cascades two PLLs through a helper clock for an
+            # accurate shift clock
+            plan = plan_clocks(platform.default_clk_frequency, [
+                ClockRequest("pixel", dvi_mode.pixel_clock, tolerance=(1e-20, 0.1)),
+                ClockRequest("tmds_eclk", dvi_mode.pixel_clock * 5, tolerance=0.001, edge=True), # TMDS 2 bits per clock
+                ClockRequest("tmds_sclk", ratio=("tmds_eclk", 0.5)),
             ])
 
-            m.submodules.pllb = pllb = Ecp5Pll(plla.config.clko_hzs[0], [
-                PllClock(dvi_mode.pixel_clock * 5, tolerance=0.001), # TMDS 2 bits per clock
-            ])
-
-            m.submodules.div = div = Ecp5ClockDiv2(pllb.config.clko_hzs[0])
-
-            m.domains.tmds_eclk = ClockDomain("tmds_eclk")
-            m.domains.tmds_sclk = ClockDomain("tmds_sclk")
-            m.domains.pixel = ClockDomain("pixel")
-            m.d.comb += [
-                plla.i_clk.eq(ClockSignal()),
-                pllb.i_clk.eq(plla.o_clk[0]),
-                div.i.eq(pllb.o_clk[0]),
-                ClockSignal("pixel").eq(plla.o_clk[1]),
-                ClockSignal("tmds_eclk").eq(pllb.o_clk[0]),
-                ClockSignal("tmds_sclk").eq(div.o),
-            ]
+            m.submodules.clocks = clocks = Ecp5Clocking(plan)
+            m.d.comb += clocks.i_clk.eq(ClockSignal())
 
             m.submodules.fifo = fifo = \
                 AsyncFIFOBuffered(width=3*10, depth=4, r_domain="tmds_sclk", w_domain="pixel")
@@ -176,7 +108,7 @@ def synth(bld: Builder):
                 DomainRenamer("pixel")(EnableInserter(fifo.w_rdy)(PixelGenerator()))
 
             m.submodules.tmds_shifter = tmds_shifter = \
-                DomainRenamer({ "eclk": "tmds_eclk", "sclk": "tmds_sclk" })(TmdsShifter())
+                DomainRenamer({ "eclk": "tmds_eclk", "sclk": "tmds_sclk" })(TMDSSerializer(chars=1, gearing=4))
 
             hdmi = platform.request("hdmi")
 
@@ -192,5 +124,4 @@ def synth(bld: Builder):
             return m
 
     top = Top()
-    plan = platform.build(top, do_build=False)
-    bld.exec_plan("synth", plan)
+    bld.build("synth", platform, top, threads=4)
@@ -0,0 +1,210 @@
+from nmigen import *
+from nmigen.build import Platform
+from nmigen.lib.cdc import FFSynchronizer, ResetSynchronizer
+from nmigen_boards.ulx3s import ULX3S_85F_Platform
+from dataclasses import replace
+from typing import List, Tuple
+from blip import sweep, Builder
+from blip.rtl.dvi.tmds import TMDSEncoder
+from blip.rtl.dvi.timing import VideoTiming
+from blip.rtl.ecp5.pll import Ecp5Pll, PllClock
+from blip.rtl.ecp5.pll_control import ClockSwitcher
+from blip.rtl.ecp5.io import Ecp5ClockSelect
+from blip.util.dvi_timing import get_dvi_mode_cvt_rb, cvt_rb_timings, DVIMode
+from blip.test.dvi_demo import DviPipeline
+
+def with_pixel_clock(mode: DVIMode, pixel_clock: float) -> DVIMode:
+    """Same timing as `mode` with the framerate following `pixel_clock`"""
+    h, v = mode.h, mode.v
+    h_total = h.pixels + h.front_porch + h.sync_pulse + h.back_porch
+    v_total = v.pixels + v.front_porch + v.sync_pulse + v.back_porch
+    return replace(mode, pixel_clock=pixel_clock, framerate=pixel_clock / (h_total * v_total))
+
+class PixelGenerator(Elaboratable):
+    """Test pattern generator for the mode selected by `i_mode`
+
+    `o_packed` is the same as in `blip.test.dvi_demo.PixelGenerator`."""
+
+    def __init__(self, modes: List[DVIMode]):
+        self.modes = modes
+        self.i_mode = Signal(range(len(modes)))
+        self.o_mode = Signal(range(len(modes)))
+        self.o_packed = Signal(3*10)
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        m.submodules.timing = timing = VideoTiming(self.modes)
+
+        f_count = Signal(8)
+        with m.If(timing.o_frame):
+            m.d.sync += f_count.eq(f_count + 1)
+
+        m.submodules.tmds_b = tmds_b = TMDSEncoder()
+        m.submodules.tmds_g = tmds_g = TMDSEncoder()
+        m.submodules.tmds_r = tmds_r = TMDSEncoder()
+
+        h, v = timing.o_h, timing.o_v
+        m.d.comb += [
+            timing.i_mode.eq(self.i_mode),
+            self.o_mode.eq(timing.o_mode),
+        ]
+        m.d.sync += [
+            tmds_r.i_data.eq(h[1:] + f_count),
+            tmds_g.i_data.eq(v - f_count[2:]),
+            tmds_b.i_data.eq(h - f_count),
+            tmds_b.i_en_data.eq(timing.o_de),
+            tmds_b.i_hsync.eq(timing.o_hsync),
+            tmds_b.i_vsync.eq(timing.o_vsync),
+            tmds_g.i_en_data.eq(timing.o_de),
+            tmds_r.i_en_data.eq(timing.o_de),
+            self.o_packed.eq(Cat(tmds_b.o_char, tmds_g.o_char, tmds_r.o_char)),
+        ]
+
+        return m
+
+class Top(Elaboratable):
+    def __init__(self, resolutions, timing=get_dvi_mode_cvt_rb, switch_clocks: bool=False):
+        """Single bitstream switching between `resolutions` with a button
+
+        timing: Timing standard, one of `cvt_rb_timings`
+        switch_clocks: Give every mode its own TMDS clock
+
+        By default all modes share the TMDS clock of the first resolution
+        and only the timing ROM entry changes, so the other modes are sent
+        at a lower or higher framerate and should have similar totals.
+
+        With `switch_clocks` every mode gets its own PLL and the button
+        switches the TMDS clock with `ClockSwitcher` and `Ecp5ClockSelect`.
+        The `tmds_2bit` and `pixel` domains are held in reset through the
+        switch and whenever the active PLL loses lock. The DCSC behind
+        `Ecp5ClockSelect` has two clock inputs, so at most two modes are
+        supported.
+
+        The pixel clock runs at least as fast as the TMDS clock needs and
+        the FIFO paces the pixel generator. The active mode is shown on the
+        LEDs."""
+
+        if switch_clocks and not 1 <= len(resolutions) <= 2:
+            raise ValueError(f"Expected one or two resolutions, got {len(resolutions)}")
+
+        self.resolutions = resolutions
+        self.timing = timing
+        self.switch_clocks = switch_clocks
+
+    def shared_clock(self, m: Module, platform: Platform) -> Tuple[List[DVIMode], Signal]:
+        """Clocks of all modes from one PLL, returns the modes and the mode in the `pixel` domain"""
+
+        base_mode = self.timing(*self.resolutions[0])
+        m.submodules.pll = pll = Ecp5Pll(platform.default_clk_frequency, [
+            PllClock(base_mode.pixel_clock * 5, error_weight=100.0, tolerance=0.01), # TMDS 2 bits
+            PllClock(base_mode.pixel_clock, tolerance=(1e-20, 1.0)), # Pixel clock
+        ])
+
+        # Pair the modes with the TMDS clock the PLL actually produces
+        tmds_hz = pll.config.clko_hzs[0]
+        modes = [with_pixel_clock(self.timing(*r), tmds_hz / 5) for r in self.resolutions]
+
+        m.d.comb += [
+            pll.i_clk.eq(ClockSignal()),
+            ClockSignal("tmds_2bit").eq(pll.o_clk[0]),
+            ClockSignal("pixel").eq(pll.o_clk[1]),
+        ]
+
+        # The button selects the next mode, the timing follows from the
+        # next frame on
+        button = Signal()
+        button_prev = Signal()
+        mode = Signal(range(len(modes)))
+        m.submodules.button_sync = FFSynchronizer(platform.request("button_fire", 0), button, o_domain="pixel")
+        m.d.pixel += button_prev.eq(button)
+        with m.If(button & ~button_prev):
+            m.d.pixel += mode.eq(Mux(mode == len(modes) - 1, 0, mode + 1))
+
+        return modes, mode
+
+    def switched_clocks(self, m: Module, platform: Platform) -> Tuple[List[DVIMode], Signal]:
+        """TMDS clock of every mode from its own PLL, returns the modes and the mode in the `pixel` domain"""
+
+        ref_hz = platform.default_clk_frequency
+        modes = [self.timing(*r) for r in self.resolutions]
+        pixel_hz = max(mode.pixel_clock for mode in modes)
+
+        # One PLL per mode, the first one also produces the pixel clock
+        plls = []
+        for ix, mode in enumerate(modes):
+            clocks = [PllClock(mode.pixel_clock * 5, error_weight=100.0, tolerance=0.005)] # TMDS 2 bits
+            if ix == 0:
+                clocks.append(PllClock(pixel_hz, tolerance=(1e-20, 1.0)))
+            m.submodules[f"pll{ix}"] = pll = Ecp5Pll(ref_hz, clocks)
+            m.d.comb += pll.i_clk.eq(ClockSignal())
+            plls.append(pll)
+
+        # Pair the modes with the TMDS clock the PLLs actually produce
+        modes = [with_pixel_clock(mode, pll.config.clko_hzs[0] / 5) for mode, pll in zip(modes, plls)]
+
+        m.submodules.switcher = switcher = ClockSwitcher(len(modes), relock=False)
+        m.submodules.clk_sel = clk_sel = Ecp5ClockSelect()
+        m.d.comb += [
+            switcher.i_locked.eq(Cat(pll.o_locked for pll in plls)),
+            clk_sel.i0.eq(plls[0].o_clk[0]),
+            clk_sel.i1.eq(plls[-1].o_clk[0]),
+            clk_sel.sel.eq(switcher.o_clk_sel),
+            ClockSignal("tmds_2bit").eq(clk_sel.o),
+            ClockSignal("pixel").eq(plls[0].o_clk[1]),
+        ]
+
+        # Both sides of the FIFO restart together after the switch
+        m.submodules.tmds_rst = ResetSynchronizer(switcher.o_rst, domain="tmds_2bit")
+        m.submodules.pixel_rst = ResetSynchronizer(switcher.o_rst, domain="pixel")
+
+        # The button selects the next mode once the previous switch is done
+        button = Signal()
+        button_prev = Signal()
+        m.submodules.button_sync = FFSynchronizer(platform.request("button_fire", 0), button)
+        m.d.sync += [
+            button_prev.eq(button),
+            switcher.i_sel.eq(Mux(switcher.o_clk_sel == len(modes) - 1, 0, switcher.o_clk_sel + 1)),
+            switcher.i_start.eq(button & ~button_prev & ~switcher.o_busy),
+        ]
+
+        mode = Signal(range(len(modes)))
+        m.submodules.mode_sync = FFSynchronizer(switcher.o_clk_sel, mode, o_domain="pixel")
+
+        return modes, mode
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        m.domains.tmds_2bit = ClockDomain("tmds_2bit")
+        m.domains.pixel = ClockDomain("pixel")
+        if self.switch_clocks:
+            modes, mode = self.switched_clocks(m, platform)
+        else:
+            modes, mode = self.shared_clock(m, platform)
+
+        pixel_gen = PixelGenerator(modes)
+        m.submodules.dvi = dvi = DviPipeline(modes[0], False, pixel_gen=pixel_gen)
+        m.d.comb += pixel_gen.i_mode.eq(mode)
+
+        hdmi = platform.request("hdmi")
+        m.d.comb += [
+            hdmi.d.eq(dvi.o_data),
+            hdmi.clk.eq(dvi.o_clk),
+        ]
+        for n in range(len(pixel_gen.o_mode)):
+            m.d.comb += platform.request("led", n).eq(pixel_gen.o_mode[n])
+
+        return m
+
+@sweep(shared=True, timing=cvt_rb_timings)
+def synth(bld: Builder, timing):
+    platform = ULX3S_85F_Platform()
+    top = Top([(800, 480), (640, 480), (720, 480), (848, 480)], timing)
+    bld.build("synth", platform, top, threads=4)
+
+@sweep(timing=cvt_rb_timings)
+def synth_switched(bld: Builder, timing):
+    platform = ULX3S_85F_Platform()
+    top = Top([(800, 480), (640, 480)], timing, switch_clocks=True)
+    bld.build("synth", platform, top, threads=4)
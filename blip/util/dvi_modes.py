@@ -0,0 +1,171 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Iterable
+from blip import check, Builder
+from blip.rtl.pll import PllClock
+from blip.rtl.ecp5.pll import find_config, Config, clko_hzs, MHz
+from blip.util.dvi_timing import DVIMode, DVITiming
+from blip.util.dvi_timing import get_dvi_mode_cvt, get_dvi_mode_cvt_rb, get_dvi_mode_cvt_rb2
+
+def fixed_mode(pixel_mhz: float, h: tuple, v: tuple, h_positive: bool, v_positive: bool) -> DVIMode:
+    """Mode from `(pixels, front_porch, sync_pulse, back_porch)` tuples as listed in the standards"""
+    h_timing = DVITiming(h[3], h[0], h[1], h[2], not h_positive)
+    v_timing = DVITiming(v[3], v[0], v[1], v[2], not v_positive)
+    h_total = sum(h)
+    v_total = sum(v)
+    return DVIMode(pixel_mhz * MHz, pixel_mhz * MHz / (h_total * v_total), h_timing, v_timing)
+
+# Fixed timings from CEA-861 and VESA DMT
+fixed_modes = {
+    "dmt_640x480_60":   fixed_mode( 25.175, ( 640,  16,  96,  48), ( 480, 10, 2, 33), False, False),
+    "dmt_800x600_60":   fixed_mode( 40.000, ( 800,  40, 128,  88), ( 600,  1, 4, 23), True, True),
+    "dmt_1024x768_60":  fixed_mode( 65.000, (1024,  24, 136, 160), ( 768,  3, 6, 29), False, False),
+    "dmt_1280x1024_60": fixed_mode(108.000, (1280,  48, 112, 248), (1024,  1, 3, 38), True, True),
+    "cea_720x480_60":   fixed_mode( 27.000, ( 720,  16,  62,  60), ( 480,  9, 6, 30), False, False),
+    "cea_720x576_50":   fixed_mode( 27.000, ( 720,  12,  64,  68), ( 576,  5, 5, 39), False, False),
+    "cea_1280x720_50":  fixed_mode( 74.250, (1280, 440,  40, 220), ( 720,  5, 5, 20), True, True),
+    "cea_1280x720_60":  fixed_mode( 74.250, (1280, 110,  40, 220), ( 720,  5, 5, 20), True, True),
+    "cea_1920x1080_30": fixed_mode( 74.250, (1920,  88,  44, 148), (1080,  4, 5, 36), True, True),
+    "cea_1920x1080_50": fixed_mode(148.500, (1920, 528,  44, 148), (1080,  4, 5, 36), True, True),
+    "cea_1920x1080_60": fixed_mode(148.500, (1920,  88,  44, 148), (1080,  4, 5, 36), True, True),
+}
+
+# Resolutions and framerates of the computed CVT modes
+cvt_resolutions = [
+    (640, 480), (720, 480), (800, 480), (800, 600), (848, 480), (1024, 600),
+    (1024, 768), (1280, 720), (1280, 800), (1280, 1024), (1360, 768),
+    (1600, 900), (1920, 1080), (1920, 1200),
+]
+cvt_framerates = [30, 50, 60, 75]
+
+cvt_standards = {
+    "cvt": get_dvi_mode_cvt,
+    "cvt_rb": get_dvi_mode_cvt_rb,
+    "cvt_rb2": get_dvi_mode_cvt_rb2,
+}
+
+@lru_cache(maxsize=None)
+def catalog() -> Dict[str, DVIMode]:
+    """All known modes by name, eg. `cvt_rb_1280x720_60` or `cea_1280x720_60`
+
+    The CVT modes are computed for every combination of `cvt_standards`,
+    `cvt_resolutions` and `cvt_framerates` once and cached."""
+
+    modes = {}
+    for standard, get_mode in cvt_standards.items():
+        for width, height in cvt_resolutions:
+            for framerate in cvt_framerates:
+                modes[f"{standard}_{width}x{height}_{framerate}"] = get_mode(width, height, framerate)
+    modes.update(fixed_modes)
+    return modes
+
+@dataclass
+class ModeSolution:
+    """PLL chain producing the clocks of a mode
+
+    plls: Configurations from the input clock onwards, each PLL is fed by
+        the first output of the previous one
+    tmds_hz: Serializer clock, `ratio` times the effective pixel clock
+    pixel_hz: Pixel clock output of the last PLL
+    framerate: Framerate at `tmds_hz / ratio`
+    framerate_error: Relative error to the framerate of the mode
+    """
+
+    name: str
+    mode: DVIMode
+    plls: List[Config]
+    tmds_hz: float
+    pixel_hz: float
+    framerate: float
+    framerate_error: float
+
+def solve_mode(name: str, mode: DVIMode, ref_hz: float, ratio: float=5.0,
+        tolerance: float=0.005, helper_hzs: Iterable[float]=(100*MHz,)) -> Optional[ModeSolution]:
+    """Find PLL settings for the serializer and pixel clocks of a mode
+
+    A single PLL producing both clocks is preferred, otherwise a PLL
+    producing a helper clock and the pixel clock is cascaded with a second
+    one producing the serializer clock like in `blip.test.dvi_demo_720p`.
+    The pixel clock may run faster than needed as the demos pace it with a
+    FIFO, so the framerate follows the serializer clock."""
+
+    tmds_target = mode.pixel_clock * ratio
+    if tmds_target not in clko_hzs or mode.pixel_clock not in clko_hzs:
+        return None
+
+    tmds_clock = PllClock(tmds_target, tolerance=tolerance, error_weight=100.0)
+    pixel_clock = PllClock(mode.pixel_clock, tolerance=(1e-20, 0.1))
+
+    plls = None
+    config = find_config(ref_hz, [tmds_clock, pixel_clock])
+    if config:
+        plls = [config]
+        tmds_hz, pixel_hz = config.clko_hzs
+    else:
+        for helper_hz in helper_hzs:
+            first = find_config(ref_hz, [PllClock(helper_hz, error_weight=10.0), pixel_clock])
+            if not first: continue
+            second = find_config(first.clko_hzs[0], [tmds_clock])
+            if not second: continue
+            plls = [first, second]
+            tmds_hz, pixel_hz = second.clko_hzs[0], first.clko_hzs[1]
+            break
+
+    if not plls:
+        return None
+
+    framerate = mode.framerate * (tmds_hz / tmds_target)
+    return ModeSolution(name, mode, plls, tmds_hz, pixel_hz, framerate,
+        framerate / mode.framerate - 1.0)
+
+def solve_catalog(ref_hz: float, ratio: float=5.0, tolerance: float=0.005,
+        names: Optional[Iterable[str]]=None) -> List[ModeSolution]:
+    """Achievable modes of the catalog for an input clock and serializer ratio
+
+    ratio: Serializer clock relative to the pixel clock, 5 for the 2 bit
+        DDR serializers of the DVI demos
+
+    Only evaluates the PLL configuration search, no RTL is elaborated."""
+
+    modes = catalog()
+    if names is None:
+        names = modes.keys()
+
+    solutions = []
+    for name in names:
+        solution = solve_mode(name, modes[name], ref_hz, ratio, tolerance)
+        if solution:
+            solutions.append(solution)
+    return solutions
+
+def solution_table(solutions: Iterable[ModeSolution]) -> List[List[str]]:
+    rows = [["mode", "pixel", "tmds", "framerate", "error", "plls"]]
+    for s in solutions:
+        rows.append([
+            s.name,
+            f"{s.mode.pixel_clock / MHz:.3f}MHz",
+            f"{s.tmds_hz / MHz:.3f}MHz",
+            f"{s.framerate:.3f}Hz",
+            f"{s.framerate_error * 100:+.3f}%",
+            str(len(s.plls)),
+        ])
+    return rows
+
+def check_solver():
+    modes = catalog()
+    assert modes["cvt_rb_1280x720_60"] == get_dvi_mode_cvt_rb(1280, 720, 60)
+
+    names = ["cvt_rb_640x480_60", "cvt_rb_1280x720_60", "cea_1280x720_60", "cea_1920x1080_60"]
+    solutions = { s.name: s for s in solve_catalog(25*MHz, names=names) }
+
+    # 1080p60 would need a serializer clock above the PLL output range
+    assert "cea_1920x1080_60" not in solutions
+    for name in names[:3]:
+        s = solutions[name]
+        assert abs(s.framerate_error) <= 0.005
+        assert abs(s.tmds_hz / (modes[name].pixel_clock * 5) - 1.0) <= 0.005
+        assert s.pixel_hz >= modes[name].pixel_clock
+
+@check()
+def solver(bld: Builder):
+    bld.python("solve", check_solver)
@@ -141,18 +141,205 @@ def get_dvi_mode_cvt_rb(width: int, height: int, framerate: int=60) -> DVIMode:
         ),
     )
 
-@check()
-def fixtures_rb(bld: Builder):
+def get_dvi_mode_cvt(width: int, height: int, framerate: int=60) -> DVIMode:
+    """Get timings for a resolution using the CVT standard CRT blanking."""
+
+    # VESA-CVT-v1.2 5.5 Definition of Constants & Variables
+
+    cell_gran_rnd = 8   # Character cell extents
+    min_vsync_bp = 550  # Minimum vertical sync and back porch time
+    min_v_porch_rnd = 3 # Vertical front porch lines
+    min_v_bporch = 6    # Minimum vertical back porch lines
+    h_sync_per = 0.08   # Horizontal sync width relative to the total
+    c_prime = 30        # Blanking formula offset (C - J) * K / 256 + J
+    m_prime = 300       # Blanking formula gradient K / 256 * M
+    clock_step = 0.25   # Clock step in MHz
+
+    # Same aspect ratio dependent vertical sync as reduced blanking
+    if height*4 == width*3:
+        v_sync_rnd = 4 # 4:3
+    elif height*16 == width*9:
+        v_sync_rnd = 5 # 16:9
+    elif height*16 == width*10:
+        v_sync_rnd = 6 # 16:10
+    elif height*5 == width*4 or height*15 == width*9:
+        v_sync_rnd = 7 # Special case 5:4 or 15:9
+    else:
+        v_sync_rnd = 10 # Non-standard
+
+    # VESA-CVT-v1.2 5.2 Computation of Common Parameters
+    # Margins and interlacing are not supported
+    v_field_rate_rqd = framerate
+    h_pixels_rnd = int(width / cell_gran_rnd) * cell_gran_rnd
+    total_active_pixels = h_pixels_rnd
+    v_lines_rnd = height
+
+    # VESA-CVT-v1.2 5.3 Computation of CRT Timing Parameters
+    # 8: Estimate the Horizontal Period (us)
+    h_period_est = ((1 / v_field_rate_rqd - min_vsync_bp / 1e6)
+        / (v_lines_rnd + min_v_porch_rnd) * 1e6)
+    # 9: Find the number of lines in vertical sync and back porch
+    v_sync_bp = max(int(min_vsync_bp / h_period_est) + 1, v_sync_rnd + min_v_bporch)
+    # 10-11: Find the vertical back porch and total number of lines
+    v_back_porch = v_sync_bp - v_sync_rnd
+    total_v_lines = v_lines_rnd + v_sync_bp + min_v_porch_rnd
+    # 12-13: Find the ideal blanking duty cycle and horizontal blanking
+    ideal_duty_cycle = max(c_prime - m_prime * h_period_est / 1000, 20)
+    h_blank = int(total_active_pixels * ideal_duty_cycle / (100 - ideal_duty_cycle)
+        / (2 * cell_gran_rnd)) * (2 * cell_gran_rnd)
+    # 14: Find total number of pixel clocks per line
+    total_pixels = total_active_pixels + h_blank
+    # 15: Calculate Pixel Clock Frequency to nearest clock_step MHz below
+    act_pixel_freq = clock_step * int(total_pixels / h_period_est / clock_step)
+    # 16-18: Find the actual horizontal and vertical frequencies
+    act_h_freq = 1000 * act_pixel_freq / total_pixels
+    act_field_rate = 1000 * act_h_freq / total_v_lines
+
+    # VESA-CVT-v1.2 5.3 Horizontal sync is 8% of the line rounded down to
+    # character cells and ends in the middle of the blank
+    h_sync = int(h_sync_per * total_pixels / cell_gran_rnd) * cell_gran_rnd
+    h_bporch = h_blank // 2
+    h_fporch = h_blank - h_sync - h_bporch
+
+    return DVIMode(
+        pixel_clock=act_pixel_freq*1e6,
+        framerate=act_field_rate,
+        h=DVITiming(
+            back_porch=h_bporch,
+            pixels=width,
+            front_porch=h_fporch,
+            sync_pulse=h_sync,
+            invert_polarity=True,
+        ),
+        v=DVITiming(
+            back_porch=v_back_porch,
+            pixels=height,
+            front_porch=min_v_porch_rnd,
+            sync_pulse=v_sync_rnd,
+            invert_polarity=False,
+        ),
+    )
+
+def get_dvi_mode_cvt_rb2(width: int, height: int, framerate: int=60) -> DVIMode:
+    """Get timings for a resolution using the CVT-RB version 2 standard."""
+
+    # VESA-CVT-v1.2 5.5 Definition of Constants & Variables
+
+    # Reduced blanking version 2 constants:
+    rb_min_v_blank = 460   # Minimum vertical blank time
+    rb_v_sync = 8          # Vertical sync lines
+    rb_v_bporch = 6        # Vertical back porch lines
+    rb_min_v_fporch = 1    # Minimum vertical front porch lines
+    rb_h_blank = 80        # Horizontal blank time
+    rb_h_sync = 32         # Horizontal sync time
+    clock_step = 0.001     # Clock step in MHz
+    refresh_multiplier = 1 # Framerate multiplier, no video optimized 1000/1001
+
+    # VESA-CVT-v1.2 5.2 Computation of Common Parameters
+    # Character cell granularity is 1 pixel and margins/interlacing are not
+    # supported so the active area is the requested resolution as-is
+    v_field_rate_rqd = framerate
+    total_active_pixels = width
+    v_lines_rnd = height
+
+    # VESA-CVT-v1.2 5.4 Computation of Reduced Blanking Timing Parameters
+    # 8: Estimate the Horizontal Period (kHz)
+    h_period_est = (1e6 / v_field_rate_rqd - rb_min_v_blank) / v_lines_rnd
+    # 9: Determine the number of lines in the vertical blanking interval
+    vbi_lines = int(rb_min_v_blank / h_period_est) + 1
+    # 10: Check vertical blanking is sufficient
+    rb_min_vbi = rb_min_v_fporch + rb_v_sync + rb_v_bporch
+    act_vbi_lines = max(rb_min_vbi, vbi_lines)
+    # 11: Find total number of vertical lines
+    total_v_lines = act_vbi_lines + v_lines_rnd
+    # 12: Find total number of pixel clocks per line
+    total_pixels = rb_h_blank + total_active_pixels
+    # 13: Calculate Pixel Clock Frequency to nearest clock_step MHz below,
+    # rounded in kHz to avoid floating point error
+    act_pixel_khz = int(round(v_field_rate_rqd * total_v_lines * total_pixels
+        * refresh_multiplier / 1e3, 6))
+    act_pixel_freq = act_pixel_khz * clock_step
+    # 14-16: Find the actual horizontal and vertical frequencies
+    act_h_freq = 1000 * act_pixel_freq / total_pixels
+    act_field_rate = 1000 * act_h_freq / total_v_lines
+
+    # VESA-CVT-v1.2 3.4.3 Reduced Blanking Timing Version 2
+    # Horizontal sync is followed by a fixed back porch of 40 pixel clocks,
+    # vertical back porch is fixed and the front porch takes the rest
+    h_bporch = 40
+    h_fporch = rb_h_blank - rb_h_sync - h_bporch
+    v_fporch = act_vbi_lines - rb_v_sync - rb_v_bporch
+
+    return DVIMode(
+        pixel_clock=act_pixel_freq*1e6,
+        framerate=act_field_rate,
+        h=DVITiming(
+            back_porch=h_bporch,
+            pixels=width,
+            front_porch=h_fporch,
+            sync_pulse=rb_h_sync,
+            invert_polarity=False,
+        ),
+        v=DVITiming(
+            back_porch=rb_v_bporch,
+            pixels=height,
+            front_porch=v_fporch,
+            sync_pulse=rb_v_sync,
+            invert_polarity=True,
+        ),
+    )
+
+# Reduced blanking timing standards selectable by the demos
+cvt_rb_timings = {
+    "rb": get_dvi_mode_cvt_rb,
+    "rb2": get_dvi_mode_cvt_rb2,
+}
+
+def check_fixtures_rb():
     fixtures = [
         (1280,  720, 60, DVIMode( 64.0, 60, DVITiming(80, 1280, 48, 32, 0), DVITiming(13,  720, 3, 5, 1))),
         (1920, 1080, 60, DVIMode(138.5, 60, DVITiming(80, 1920, 48, 32, 0), DVITiming(23, 1080, 3, 5, 1))),
         ( 800,  480, 60, DVIMode( 28.5, 60, DVITiming(80,  800, 48, 32, 0), DVITiming( 6,  480, 3, 7, 1))),
     ]
 
+    check_fixtures(get_dvi_mode_cvt_rb, fixtures)
+
+def check_fixtures_rb2():
+    fixtures = [
+        (1280,  720, 60, DVIMode( 60.465, 60, DVITiming(40, 1280, 8, 32, 0), DVITiming(6,  720,  7, 8, 1))),
+        (1920, 1080, 60, DVIMode(133.320, 60, DVITiming(40, 1920, 8, 32, 0), DVITiming(6, 1080, 17, 8, 1))),
+        (2560, 1440, 60, DVIMode(234.590, 60, DVITiming(40, 2560, 8, 32, 0), DVITiming(6, 1440, 27, 8, 1))),
+        (3840, 2160, 60, DVIMode(522.614, 60, DVITiming(40, 3840, 8, 32, 0), DVITiming(6, 2160, 48, 8, 1))),
+    ]
+
+    check_fixtures(get_dvi_mode_cvt_rb2, fixtures)
+
+def check_fixtures_cvt():
+    fixtures = [
+        ( 640,  480, 60, DVIMode( 23.75, 59.38, DVITiming( 80,  640,  16,  64, 1), DVITiming(13,  480, 3, 4, 0))),
+        (1280,  720, 60, DVIMode( 74.50, 60, DVITiming(192, 1280,  64, 128, 1), DVITiming(20,  720, 3, 5, 0))),
+        (1920, 1080, 60, DVIMode(173.00, 60, DVITiming(328, 1920, 128, 200, 1), DVITiming(32, 1080, 3, 5, 0))),
+    ]
+
+    check_fixtures(get_dvi_mode_cvt, fixtures)
+
+def check_fixtures(get_mode, fixtures):
+    """Compare modes to fixtures with the pixel clock in MHz and nominal framerate"""
     for w, h, fps, ref in fixtures:
-        mode = get_dvi_mode_cvt_rb(w, h, fps)
-        assert abs(mode.pixel_clock == ref.pixel_clock) <= 1e-3
-        assert abs(mode.framerate == ref.framerate) <= 1e-3
-        assert mode.h == ref.h
-        assert mode.v == ref.v
+        mode = get_mode(w, h, fps)
+        assert abs(mode.pixel_clock - ref.pixel_clock * 1e6) <= 1e-3, f"{w}x{h}: {mode.pixel_clock}"
+        assert abs(mode.framerate - ref.framerate) <= 0.5, f"{w}x{h}: {mode.framerate}"
+        assert mode.h == ref.h, f"{w}x{h}: {mode.h}"
+        assert mode.v == ref.v, f"{w}x{h}: {mode.v}"
 
+@check()
+def fixtures_cvt(bld: Builder):
+    bld.python("fixtures", check_fixtures_cvt)
+
+@check()
+def fixtures_rb(bld: Builder):
+    bld.python("fixtures", check_fixtures_rb)
+
+@check()
+def fixtures_rb2(bld: Builder):
+    bld.python("fixtures", check_fixtures_rb2)